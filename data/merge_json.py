@@ -2,12 +2,69 @@
 """
 複数のJSONブロックを含むMarkdownファイルから、
 create_book API形式の単一JSONを生成するスクリプト
+
+--stream を付けると Markdown を1行ずつ読み、JSONブロックが閉じるたびに
+デコードして問題を出力ファイルへ書き出す（ファイル全体や全問題をメモリに持たない）。
+出力は create_book 形式の JSON（従来と同じ内容）か、1行1問の NDJSON。
+
+correct_index は Markdown のまま書き出す（ふつうは 1始まり）。結合した参考書全体の値から
+0始まりか 1始まりかを決めて表示し、0 と 4 が混在するなど決められない場合は警告する。
+
+Usage:
+    python3 merge_json.py "参考書名.md"
+    python3 merge_json.py --stream "参考書名.md"
+    python3 merge_json.py --format ndjson "参考書名.md"        # 参考書名.ndjson
+    python3 merge_json.py --jobs 4 *.md                        # 複数ファイルを並列に結合
 """
 
+import argparse
 import json
 import re
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# 問題の型（Question）は tools/ にある
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tools"))
+
+from question import detect_index_base, raw_book_index  # noqa: E402
+
+# デフォルトの入力ファイル
+DEFAULT_INPUT = "中学入試にでる順 改訂第2版 四字熟語・ことわざ・慣用句.md"
+
+# 出力形式と拡張子
+FORMATS = {"json": ".json", "ndjson": ".ndjson"}
+
+# correct_index が 1〜3 だけの参考書は 1始まり（Markdown の書き方）とみなす
+DEFAULT_INDEX_BASE = 1
+
+# Markdownエスケープ（\_ \[ \] \* \`）
+_MARKDOWN_ESCAPE = re.compile(r'\\([_\[\]*`])')
+
+
+def unescape_markdown(text):
+    """Markdownエスケープを1回の置換で除去する（\_ → _、\[ → [ など）"""
+    return _MARKDOWN_ESCAPE.sub(r'\1', text)
+
+
+def raw_indexes(questions):
+    """問題の correct_index（整数にできないものは飛ばす。検証は後の段で行う）"""
+    for q in questions:
+        try:
+            yield raw_book_index(q)
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+
+def report_index_base(values, log=print):
+    """結合した問題の correct_index が何始まりかを表示する（決められなければ警告して None）"""
+    try:
+        base = detect_index_base(values, DEFAULT_INDEX_BASE)
+    except ValueError as e:
+        log(f"警告: {e}")
+        return None
+    log(f"correct_index: {base}始まり")
+    return base
 
 def merge_json_from_markdown(input_filename, output_filename):
     # ファイルが存在するか確認
@@ -22,16 +79,6 @@ def merge_json_from_markdown(input_filename, output_filename):
     # 正規表現を使って ```json と ``` の間のテキストをすべて抽出する
     json_blocks = re.findall(r'```json\s*(.*?)\s*```', content, re.DOTALL)
 
-    # Markdownエスケープを除去する関数
-    def unescape_markdown(text):
-        # \_ → _、\[ → [、\] → ] などを修正
-        text = text.replace('\\_', '_')
-        text = text.replace('\\[', '[')
-        text = text.replace('\\]', ']')
-        text = text.replace('\\*', '*')
-        text = text.replace('\\`', '`')
-        return text
-
     # 各ブロックのエスケープを除去
     json_blocks = [unescape_markdown(block) for block in json_blocks]
 
@@ -72,24 +119,215 @@ def merge_json_from_markdown(input_filename, output_filename):
         json.dump(merged_data, f, ensure_ascii=False, indent=2)
 
     print("-" * 50)
-    print(f"完了しました。")
+    print("完了しました。")
     print(f"出力ファイル: {output_filename}")
     print(f"結合された問題数: {len(merged_data['questions'])}")
     print(f"タイトル: {merged_data['title']}")
     print(f"教科: {merged_data['subject']}")
+    report_index_base(raw_indexes(merged_data["questions"]))
 
     return True
 
-if __name__ == "__main__":
-    # コマンドライン引数またはデフォルト値
-    if len(sys.argv) >= 2:
-        input_file = sys.argv[1]
+def iter_json_blocks(lines):
+    """Markdown の行から ```json ブロックを1つずつ取り出す
+
+    (ブロックの中身が始まる行番号, エスケープを除去した中身) を返す。
+    行番号は1始まり。閉じていないブロックは ValueError。
+    """
+    block = None
+    start = 0
+    for line_no, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if block is None:
+            if stripped.startswith("```json"):
+                block = []
+                start = line_no + 1
+                rest = stripped[len("```json"):]
+                if rest:
+                    # ```json { ... のように同じ行に中身が続く場合
+                    block.append(rest)
+                    start = line_no
+        elif stripped.startswith("```"):
+            yield start, unescape_markdown("".join(block))
+            block = None
+        else:
+            block.append(line)
+    if block is not None:
+        raise ValueError(f"{start - 1}行目から始まるJSONブロックが閉じていません")
+
+
+class QuestionWriter:
+    """問題を1問ずつ出力ファイルへ書き出す
+
+    json:   create_book 形式（json.dump(..., indent=2) と同じ内容）。
+            メタ情報は最初のブロックを書くときに確定する。
+    ndjson: 1行1問（メタ情報は書かない）
+    """
+
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        self.meta = None
+        self.count = 0
+
+    def start(self, meta):
+        self.meta = {
+            "action": meta.get("action", "create_book"),
+            "subject": meta.get("subject", "jp"),
+            "title": meta.get("title", "Unknown"),
+        }
+        if self.fmt == "json":
+            self.f.write("{\n")
+            for key, value in self.meta.items():
+                self.f.write(f'  "{key}": {json.dumps(value, ensure_ascii=False)},\n')
+            self.f.write('  "questions": [')
+
+    def write(self, questions):
+        if not questions:
+            return
+        if self.fmt == "ndjson":
+            self.f.writelines(json.dumps(q, ensure_ascii=False) + "\n" for q in questions)
+        else:
+            # ブロックの問題をまとめて indent=2 で書き、"[" と "\n]" を外して1段深くする
+            text = json.dumps(questions, ensure_ascii=False, indent=2)[1:-2]
+            self.f.write(("," if self.count else "") + text.replace("\n", "\n  "))
+        self.count += len(questions)
+
+    def finish(self):
+        if self.meta is None:
+            self.start({})
+        if self.fmt == "json":
+            self.f.write("\n  ]\n}" if self.count else "]\n}")
+
+
+def merge_json_streaming(input_filename, output_filename, fmt="json", log=print):
+    """Markdown を1行ずつ読み、JSONブロックが閉じるたびに問題を書き出す
+
+    ブロックのエラーは行番号付きで表示して、そのブロックだけスキップする。
+    結果（ブロック数・問題数・エラー数など）の dict を返す。
+    入力がないか、問題を1問も読めなかった場合は None を返し、出力ファイルは作らない（置き換えない）。
+    """
+    if not os.path.exists(input_filename):
+        log(f"エラー: 入力ファイル '{input_filename}' が見つかりません。")
+        return None
+
+    result = {"input": input_filename, "output": output_filename,
+              "blocks": 0, "questions": 0, "errors": 0}
+    indexes = set()
+    # 一時ファイルに書き出し、問題を読めたときだけ出力ファイルに置き換える
+    tmp = os.path.join(os.path.dirname(output_filename),
+                       f".{os.path.basename(output_filename)}.tmp")
+    with open(input_filename, 'r', encoding='utf-8') as src, \
+            open(tmp, 'w', encoding='utf-8') as out:
+        writer = QuestionWriter(out, fmt)
+        try:
+            for i, (start, block_str) in enumerate(iter_json_blocks(src)):
+                result["blocks"] += 1
+                label = f"ブロック {i+1}（{start}行目〜）"
+                try:
+                    data = json.loads(block_str)
+                except json.JSONDecodeError as e:
+                    result["errors"] += 1
+                    log(f"  {label} の解析中にエラーが発生しました: "
+                        f"{start + e.lineno - 1}行目 {e.colno}列目: {e.msg}")
+                    continue
+                if not isinstance(data, dict):
+                    result["errors"] += 1
+                    log(f"  {label}: オブジェクトではありません。スキップします。")
+                    continue
+
+                # 最初に読めたブロックからメタ情報を取得
+                if writer.meta is None:
+                    writer.start(data)
+                if "questions" in data and isinstance(data["questions"], list):
+                    writer.write(data["questions"])
+                    indexes.update(raw_indexes(data["questions"]))
+                    log(f"  {label}: {len(data['questions'])} 問を追加")
+                else:
+                    log(f"  {label}: 'questions' リストが含まれていません。スキップします。")
+        except ValueError as e:
+            result["errors"] += 1
+            log(f"  エラー: {e}")
+        writer.finish()
+
+    meta = writer.meta
+    result.update(questions=writer.count, title=meta["title"], subject=meta["subject"])
+    if result["blocks"] == 0 or result["questions"] == 0:
+        os.remove(tmp)
+        if result["blocks"] == 0:
+            log("エラー: JSONブロックが見つかりませんでした。")
+        else:
+            log(f"エラー: 問題を1問も読めませんでした（JSONブロック {result['blocks']} 個、"
+                f"エラー {result['errors']} 個）。")
+        log(f"出力ファイル '{output_filename}' は作成しません。")
+        return None
+    os.replace(tmp, output_filename)
+
+    log("-" * 50)
+    log("完了しました。")
+    log(f"出力ファイル: {output_filename}")
+    log(f"JSONブロック: {result['blocks']} 個（エラー {result['errors']} 個）")
+    log(f"結合された問題数: {result['questions']}")
+    log(f"タイトル: {result['title']}")
+    log(f"教科: {result['subject']}")
+    result["index_base"] = report_index_base(indexes, log)
+    return result
+
+
+def _merge_worker(input_filename, output_filename, fmt):
+    """並列実行用（表示が混ざらないよう、表示内容をまとめて返す）"""
+    lines = []
+    result = merge_json_streaming(input_filename, output_filename, fmt, log=lines.append)
+    return result, lines
+
+
+def output_path(input_filename, fmt):
+    """出力ファイル名を生成（.md → .json / .ndjson）"""
+    return os.path.splitext(input_filename)[0] + FORMATS[fmt]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MarkdownのJSONブロックを create_book 形式に結合")
+    parser.add_argument("files", nargs="*", default=[DEFAULT_INPUT],
+                        help=f"入力Markdown（省略時: {DEFAULT_INPUT}）")
+    parser.add_argument("-o", "--output", help="出力ファイル（入力が1つの場合のみ）")
+    parser.add_argument("--stream", action="store_true",
+                        help="1行ずつ読み、ブロックごとに書き出す")
+    parser.add_argument("--format", choices=list(FORMATS), default="json",
+                        help="出力形式（ndjson はストリーミングで書き出す） (default: json)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="並列に結合するファイル数（ストリーミングで書き出す） (default: 1)")
+
+    args = parser.parse_args()
+
+    if args.output and len(args.files) > 1:
+        parser.error("--output は入力が1つの場合のみ指定できます")
+    stream = args.stream or args.format != "json" or args.jobs > 1
+    tasks = [(path, args.output or output_path(path, args.format)) for path in args.files]
+
+    if not stream:
+        ok = [merge_json_from_markdown(src, dst) for src, dst in tasks]
+        return 0 if all(ok) else 1
+
+    if args.jobs > 1 and len(tasks) > 1:
+        results = []
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(tasks))) as pool:
+            futures = [pool.submit(_merge_worker, src, dst, args.format) for src, dst in tasks]
+            for (src, _), future in zip(tasks, futures):
+                result, lines = future.result()
+                print(f"[{src}]")
+                print("\n".join(lines))
+                results.append(result)
     else:
-        # デフォルト: 同じディレクトリ内の.mdファイルを探す
-        input_file = "中学入試にでる順 改訂第2版 四字熟語・ことわざ・慣用句.md"
+        results = [merge_json_streaming(src, dst, args.format) for src, dst in tasks]
 
-    # 出力ファイル名を生成（.md → .json）
-    base_name = os.path.splitext(input_file)[0]
-    output_file = f"{base_name}.json"
+    if len(tasks) > 1:
+        done = [r for r in results if r]
+        print("=" * 50)
+        print(f"ファイル: {len(done)}/{len(tasks)} / 問題数: {sum(r['questions'] for r in done)} / "
+              f"エラーのあるブロック: {sum(r['errors'] for r in done)}")
+    return 0 if all(r and not r["errors"] for r in results) else 1
 
-    merge_json_from_markdown(input_file, output_file)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,65 +1,199 @@
 #!/usr/bin/env python3
 """
 クイズの選択肢をシャッフルし、correct_indexを更新するスクリプト
+
+選択肢はテキストの一致ではなく、並べ替えの置換（どの位置の選択肢をどこへ移すか）で
+シャッフルする。同じテキストの選択肢があっても正解の位置がずれない。
+
+置換は --seed と参考書のタイトル・問題番号から決まるので、同じシードなら何度実行しても
+同じ出力になる（--seed を省略した場合は使ったシードを表示する）。
+問題数が多い場合、numpy があれば置換の計算を配列でまとめて行う（結果は同じ）。
+
+--balance を付けると、参考書全体で正解の位置（correct_index 0〜3）が均等になるように並べる。
+
+元の correct_index が 0始まりか 1始まりかは、参考書全体の値から決める
+（0 があれば 0始まり、4 があれば 1始まり、1〜3 だけなら merge_json.py の出力と同じ 1始まり）。
+--index-base で指定することもできる。出力は常に 0始まり。
+
+Usage:
+    python3 shuffle_json.py "参考書名.json"
+    python3 shuffle_json.py --seed 42 --balance "参考書名.json"
+    python3 shuffle_json.py --seed 42 FINISH/                 # ディレクトリ内の参考書をまとめて
+    python3 shuffle_json.py --index-base 0 "参考書名_shuffled.json"   # シャッフル済みをもう一度
 """
 
+import argparse
+import itertools
 import json
 import random
 import os
 import sys
+import zlib
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def shuffle_quiz_choices(input_filename, output_filename):
-    # ファイルの読み込み
-    if not os.path.exists(input_filename):
-        print(f"エラー: 入力ファイル '{input_filename}' が見つかりません。")
-        return False
+# 問題の型（Question）は tools/ にある
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tools"))
 
-    print(f"ファイルを読み込んでいます: {input_filename}")
-    with open(input_filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+from question import BOOK_CHOICE_KEYS, CHOICE_COUNT, book_questions  # noqa: E402
 
-    questions = data.get("questions", [])
-    print(f"全 {len(questions)} 問のシャッフルを開始します...")
+# デフォルトの入力ファイル
+DEFAULT_INPUT = "中学入試にでる順 改訂第2版 四字熟語・ことわざ・慣用句.json"
 
-    # 統計用（シャッフル後の正解分布を確認するため）
-    stats = {0: 0, 1: 0, 2: 0, 3: 0}
+# 出力ファイル名に付ける文字列
+OUTPUT_SUFFIX = "_shuffled"
 
-    for q in questions:
-        # 1. 現在の正解のインデックスと、その文章内容を取得
-        # 元データが1-4の場合と0-3の場合の両方に対応
-        original_idx = int(q.get("correct_index", 1))
+# 選択肢のキー
+CHOICE_KEYS = BOOK_CHOICE_KEYS
 
-        # 選択肢のキーリスト
-        choice_keys = ["choice_1", "choice_2", "choice_3", "choice_4"]
+# correct_index が 1〜3 だけの参考書は 1始まり（merge_json.py の出力）とみなす
+DEFAULT_INDEX_BASE = 1
+
+# 全24通りの並べ替え（新しい位置 j に元の位置 perm[j] の選択肢を置く）
+PERMUTATIONS = list(itertools.permutations(range(CHOICE_COUNT)))
+
+# 正解を元の位置 a から新しい位置 t へ移す並べ替え（各6通り）
+PERMUTATIONS_TO = {(a, t): [p for p in PERMUTATIONS if p[t] == a]
+                   for a in range(CHOICE_COUNT) for t in range(CHOICE_COUNT)}
+
+# この問題数以上で numpy を使う
+NUMPY_MIN_QUESTIONS = 10000
+
+_MASK = (1 << 64) - 1
+
+# 乱数列の種類（同じ問題番号でも置換の選択と --balance の並び順で別の値を使う）
+_STREAM_PERMUTATION = 0
+_STREAM_BALANCE = 1
+
+
+def _mix(x):
+    """splitmix64 の64ビットハッシュ"""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _np_mix(x):
+    """_mix の numpy 版（uint64 の配列、桁あふれは 2^64 で切り捨て）"""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def book_key(seed, title):
+    """シードと参考書のタイトルから、この参考書の乱数のもとを作る"""
+    return _mix((seed & _MASK) ^ _mix(zlib.crc32(str(title).encode("utf-8"))))
+
+
+def random_value(key, i, stream):
+    """問題番号 i（0始まり）の64ビット乱数（問題番号だけで決まる）"""
+    return _mix(_mix(2 * i + stream) ^ key)
+
+
+def random_values(key, count, stream, use_numpy=False):
+    """問題番号 0..count-1 ごとの64ビット乱数（random_value と同じ値）"""
+    if use_numpy:
+        i = np.arange(count, dtype=np.uint64) * np.uint64(2) + np.uint64(stream)
+        return _np_mix(_np_mix(i) ^ np.uint64(key)).tolist()
+    return [random_value(key, i, stream) for i in range(count)]
+
+
+def balanced_targets(key, count, use_numpy=False):
+    """正解の位置 0〜3 を均等に含む長さ count の並び（問題番号の乱数順に並べる）"""
+    values = random_values(key, count, _STREAM_BALANCE, use_numpy)
+    if use_numpy:
+        order = np.argsort(np.array(values, dtype=np.uint64), kind="stable")
+        targets = np.empty(count, dtype=np.int64)
+        targets[order] = np.arange(count) % CHOICE_COUNT
+        return targets.tolist()
+    targets = [0] * count
+    for rank, i in enumerate(sorted(range(count), key=values.__getitem__)):
+        targets[i] = rank % CHOICE_COUNT
+    return targets
 
-        # 1-4形式の場合はそのまま、0-3形式の場合は+1してchoice_Nに対応
-        if original_idx >= 1 and original_idx <= 4:
-            correct_text = q.get(f"choice_{original_idx}")
-        else:
-            correct_text = q.get(f"choice_{original_idx + 1}")
 
-        # 2. 全選択肢のテキストをリスト化して取得
-        choices_content = []
-        for key in choice_keys:
-            choices_content.append(q.get(key, ""))
+def permutation_at(key, i):
+    """問題番号 i の並べ替え（--balance なし。前から1問ずつ決められる）"""
+    return PERMUTATIONS[random_value(key, i, _STREAM_PERMUTATION) % len(PERMUTATIONS)]
 
-        # 3. 選択肢リストをランダムにシャッフルする
-        random.shuffle(choices_content)
 
-        # 4. シャッフルした内容を元のキーに書き戻し、正解の場所を探す
-        for i, text in enumerate(choices_content):
-            key = f"choice_{i + 1}"  # choice_1〜choice_4
+def plan_permutations(originals, key, balance=False, use_numpy=None):
+    """問題ごとの並べ替えを決める（originals は元の正解の位置のリスト）
 
-            # テキストをセット
-            q[key] = text
+    balance=False: 24通りから一様に選ぶ
+    balance=True:  正解の移動先を balanced_targets で決め、残り3つの並びを6通りから選ぶ
+    """
+    count = len(originals)
+    if use_numpy is None:
+        use_numpy = np is not None and count >= NUMPY_MIN_QUESTIONS
+    values = random_values(key, count, _STREAM_PERMUTATION, use_numpy)
+    if not balance:
+        return [PERMUTATIONS[v % len(PERMUTATIONS)] for v in values]
 
-            # もしこのテキストが「正解のテキスト」なら、正解番号を更新（0-3形式）
-            if text == correct_text:
-                q["correct_index"] = i  # 0〜3
+    targets = balanced_targets(key, count, use_numpy)
+    plans = []
+    for a, t, v in zip(originals, targets, values):
+        candidates = PERMUTATIONS_TO[(a, t)]
+        plans.append(candidates[v % len(candidates)])
+    return plans
 
-        # 統計用にカウント
-        stats[q["correct_index"]] += 1
+
+def shuffle_questions(questions, key, balance=False, use_numpy=None):
+    """questions（Question のリスト）の選択肢を並べ替えて correct_index を更新する
+
+    正解分布の stats と、同じテキストの選択肢を含む問題数を返す。
+    """
+    plans = plan_permutations([q.correct_index for q in questions], key, balance, use_numpy)
+    stats = {i: 0 for i in range(CHOICE_COUNT)}
+    duplicated = 0
+    for q, perm in zip(questions, plans):
+        duplicated += apply_permutation(q, perm)
+        stats[q.correct_index] += 1
+    return stats, duplicated
+
+
+def apply_permutation(q, perm):
+    """q（Question）の選択肢を perm で並べ替え、correct_index を正解の移動先にする
+
+    同じテキストの選択肢を含む場合は True を返す。
+    """
+    choices = q.choices
+    q.choices = [choices[src] for src in perm]
+    q.correct_index = perm.index(q.correct_index)
+    return len(set(choices)) != CHOICE_COUNT
+
+
+def shuffle_quiz_choices(input_filename, output_filename, seed=None, balance=False,
+                         use_numpy=None, index_base=None):
+    # ファイルの読み込み
+    if not os.path.exists(input_filename):
+        print(f"エラー: 入力ファイル '{input_filename}' が見つかりません。")
+        return False
+
+    print(f"ファイルを読み込んでいます: {input_filename}")
+    with open(input_filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    # 並べ替えの前に全問の correct_index を確かめる（途中で失敗して半端に書き換えないため）
+    try:
+        index_base, questions = book_questions(data, index_base, DEFAULT_INDEX_BASE)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return False
+
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    print(f"全 {len(questions)} 問のシャッフルを開始します...（シード: {seed}、"
+          f"元の correct_index: {index_base}始まり）")
+
+    stats, duplicated = shuffle_questions(questions, book_key(seed, data.get("title", "")),
+                                          balance, use_numpy)
+    data["questions"] = [q.to_book() for q in questions]
 
     # 結果を保存
     with open(output_filename, 'w', encoding='utf-8') as f:
@@ -68,6 +202,8 @@ def shuffle_quiz_choices(input_filename, output_filename):
     print("-" * 50)
     print("シャッフルが完了しました。")
     print(f"出力ファイル: {output_filename}")
+    if duplicated:
+        print(f"警告: 同じテキストの選択肢を含む問題が {duplicated} 問あります")
     print("【シャッフル後の正解分布（0-3形式）】")
     for k in sorted(stats.keys()):
         pct = stats[k] / len(questions) * 100 if questions else 0
@@ -76,15 +212,66 @@ def shuffle_quiz_choices(input_filename, output_filename):
     return True
 
 
-if __name__ == "__main__":
-    # コマンドライン引数またはデフォルト値
-    if len(sys.argv) >= 2:
-        input_file = sys.argv[1]
-    else:
-        input_file = "中学入試にでる順 改訂第2版 四字熟語・ことわざ・慣用句.json"
+def output_path(input_filename, output_dir=None):
+    """出力ファイル名を生成（_shuffled を付加）"""
+    base_name = os.path.splitext(input_filename)[0]
+    if output_dir:
+        base_name = os.path.join(output_dir, os.path.basename(base_name))
+    return f"{base_name}{OUTPUT_SUFFIX}.json"
+
+
+def expand_inputs(paths):
+    """ディレクトリは直下の参考書 JSON（_shuffled.json を除く）に展開する"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(".json")
+                         and not name.endswith(f"{OUTPUT_SUFFIX}.json"))
+        else:
+            files.append(path)
+    return files
 
-    # 出力ファイル名を生成（_shuffled を付加）
-    base_name = os.path.splitext(input_file)[0]
-    output_file = f"{base_name}_shuffled.json"
 
-    shuffle_quiz_choices(input_file, output_file)
+def main():
+    parser = argparse.ArgumentParser(description="クイズの選択肢をシャッフルして correct_index を更新")
+    parser.add_argument("inputs", nargs="*", default=[DEFAULT_INPUT],
+                        help=f"参考書 JSON またはディレクトリ（省略時: {DEFAULT_INPUT}）")
+    parser.add_argument("--seed", type=int,
+                        help="シード（同じシードなら同じ出力。省略時はランダムに決めて表示）")
+    parser.add_argument("--balance", action="store_true",
+                        help="参考書全体で正解の位置（correct_index）を均等にする")
+    parser.add_argument("--output-dir", help="出力先ディレクトリ（省略時は入力と同じ場所）")
+    parser.add_argument("--index-base", choices=["auto", "0", "1"], default="auto",
+                        help="元の correct_index が何始まりか（省略時は参考書全体の値から決める）")
+
+    args = parser.parse_args()
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("エラー: シャッフルする参考書 JSON がありません。")
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # 複数のファイルにも同じシードを使う（タイトルが違えば並べ替えも変わる）
+    seed = args.seed if args.seed is not None else random.randrange(1 << 63)
+    index_base = None if args.index_base == "auto" else int(args.index_base)
+    failed = []
+    for i, path in enumerate(files):
+        if i:
+            print()
+        if not shuffle_quiz_choices(path, output_path(path, args.output_dir), seed, args.balance,
+                                    index_base=index_base):
+            failed.append(path)
+
+    if len(files) > 1:
+        print("=" * 50)
+        print(f"{len(files) - len(failed)}/{len(files)} ファイルをシャッフルしました（シード: {seed}）")
+        for path in failed:
+            print(f"  失敗: {path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,6 +24,16 @@ const TIME_LIMITS = {
   all: 300
 };
 
+// インポートのロック待ち上限（並列送信されたバッチを直列化する）
+const IMPORT_LOCK_TIMEOUT_MS = 60000;
+
+// 取り込み済みバッチを記録するスクリプトプロパティのキー接頭辞
+const IMPORTED_BATCH_PREFIX = 'imported_batch_';
+
+// 取り込み済みバッチの記録の保持期間と上限（スクリプトプロパティは合計サイズに上限がある）
+const IMPORTED_BATCH_TTL_MS = 30 * 24 * 60 * 60 * 1000;
+const IMPORTED_BATCH_MAX_KEYS = 500;
+
 // ===========================================
 // シート初期化（手動実行用）
 // ===========================================
@@ -168,7 +178,7 @@ function doGet(e) {
 
 function doPost(e) {
   try {
-    const params = JSON.parse(e.postData.contents);
+    const params = decodeCompressedParams(JSON.parse(e.postData.contents));
     const action = params.action;
 
     let result;
@@ -224,6 +234,20 @@ function doPost(e) {
   }
 }
 
+/**
+ * gzip+base64 で圧縮されたリクエストを展開（import_questions.py --compress gzip-base64）
+ * { encoding: 'gzip+base64', data: '...' } の data を展開して元のパラメータに戻す
+ */
+function decodeCompressedParams(params) {
+  if (params.encoding !== 'gzip+base64') {
+    return params;
+  }
+  const blob = Utilities.newBlob(Utilities.base64Decode(params.data), 'application/x-gzip');
+  const inner = JSON.parse(Utilities.ungzip(blob).getDataAsString('UTF-8'));
+  const { encoding, data, ...rest } = params;
+  return Object.assign(rest, inner);
+}
+
 // ===========================================
 // 認証
 // ===========================================
@@ -617,6 +641,7 @@ function importQuestions(questions, batchId) {
   const maxNumbers = calcMaxNumbersByGenre(existingIds);
 
   const generatedIds = [];
+  const rows = [];
 
   questions.forEach(q => {
     // question_id の自動採番（空、または既存IDと重複の場合）
@@ -627,7 +652,7 @@ function importQuestions(questions, batchId) {
     existingIds.add(questionId);  // 今回追加したIDも重複チェック対象に
     generatedIds.push(questionId);
 
-    sheet.appendRow([
+    rows.push([
       questionId,
       q.subject,
       q.genre_id,
@@ -645,6 +670,11 @@ function importQuestions(questions, batchId) {
     ]);
   });
 
+  // 1行ずつ appendRow せず、まとめて1回で書き込む
+  if (rows.length > 0) {
+    sheet.getRange(sheet.getLastRow() + 1, 1, rows.length, rows[0].length).setValues(rows);
+  }
+
   Logger.log(`${questions.length}問を追加しました（バッチID: ${batchId}）`);
   Logger.log(`生成されたID: ${generatedIds.join(', ')}`);
   return { count: questions.length, batch_id: batchId, generated_ids: generatedIds };
@@ -706,9 +736,10 @@ function generateNextQuestionId(genreId, maxNumbers, existingIds) {
 /**
  * API経由で問題をインポート（doPostから呼び出し）
  * question_id は省略可能（自動採番）
+ * batch_key 指定時は取り込み済みのバッチを再度追加しない（再送しても重複しない）
  */
 function importQuestionsFromAPI(params) {
-  const { questions, batch_id } = params;
+  const { questions, batch_id, batch_key } = params;
 
   if (!questions || !Array.isArray(questions) || questions.length === 0) {
     return { success: false, error: '問題データが必要です' };
@@ -725,15 +756,77 @@ function importQuestionsFromAPI(params) {
     }
   }
 
-  const result = importQuestions(questions, batch_id);
+  // 並列に届いたバッチで question_id の採番が衝突しないよう直列化する
+  const lock = LockService.getScriptLock();
+  lock.waitLock(IMPORT_LOCK_TIMEOUT_MS);
+  try {
+    const props = PropertiesService.getScriptProperties();
+    if (batch_key) {
+      const done = props.getProperty(IMPORTED_BATCH_PREFIX + batch_key);
+      if (done) {
+        const prev = JSON.parse(done);
+        return {
+          success: true,
+          duplicate: true,
+          batch_id: prev.batch_id,
+          imported_count: prev.count,
+          generated_ids: prev.generated_ids || [],
+          message: `バッチ ${batch_key} は取り込み済みです`
+        };
+      }
+    }
 
-  return {
-    success: true,
-    batch_id: result.batch_id,
-    imported_count: result.count,
-    generated_ids: result.generated_ids,
-    message: `${result.count}問をインポートしました`
-  };
+    const result = importQuestions(questions, batch_id);
+    SpreadsheetApp.flush();
+
+    if (batch_key) {
+      props.setProperty(IMPORTED_BATCH_PREFIX + batch_key,
+        JSON.stringify({
+          batch_id: result.batch_id,
+          count: result.count,
+          generated_ids: result.generated_ids,
+          at: Date.now()
+        }));
+      pruneImportedBatchKeys(props);
+    }
+
+    return {
+      success: true,
+      batch_id: result.batch_id,
+      imported_count: result.count,
+      generated_ids: result.generated_ids,
+      message: `${result.count}問をインポートしました`
+    };
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+/**
+ * 取り込み済みバッチの記録のうち、保持期間を過ぎたものと上限を超えた古いものを削除
+ * （保持期間 IMPORTED_BATCH_TTL_MS は30日、件数の上限 IMPORTED_BATCH_MAX_KEYS は500件）
+ */
+function pruneImportedBatchKeys(props) {
+  const now = Date.now();
+  const all = props.getProperties();
+  const entries = [];
+  Object.keys(all).forEach(key => {
+    if (!key.startsWith(IMPORTED_BATCH_PREFIX)) return;
+    let at = 0;
+    try {
+      at = JSON.parse(all[key]).at || 0;
+    } catch (e) {
+      // 壊れた記録は古いものとして扱う
+    }
+    entries.push({ key, at });
+  });
+
+  entries.sort((a, b) => b.at - a.at);
+  entries.forEach((entry, i) => {
+    if (i >= IMPORTED_BATCH_MAX_KEYS || now - entry.at > IMPORTED_BATCH_TTL_MS) {
+      props.deleteProperty(entry.key);
+    }
+  });
 }
 
 /**
@@ -9,14 +9,15 @@ Usage:
 
 環境変数:
     GEMINI_API_KEY: Gemini API キー（.env または環境変数から読み込み）
+    GEMINI_STUB_URL: ローカルのスタブサーバーで代替する場合のURL（tools/stub_server.py）
 """
 
 import os
 import sys
 import argparse
 from pathlib import Path
-from google import genai
-from google.genai import types
+
+import gemini_client
 
 
 def load_env():
@@ -75,17 +76,6 @@ SYSTEM_PROMPT = """あなたは SuperGeniusQuiz v4 プロジェクトの外部
 """
 
 
-def create_client() -> genai.Client:
-    """Gemini クライアントを作成"""
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError(
-            "環境変数 GEMINI_API_KEY が設定されていません。\n"
-            "設定方法: export GEMINI_API_KEY='your-api-key'"
-        )
-    return genai.Client(api_key=api_key)
-
-
 def ask_gemini(
     question: str,
     thinking_level: str = DEFAULT_THINKING_LEVEL,
@@ -102,32 +92,27 @@ def ask_gemini(
     Returns:
         Gemini からの回答テキスト
     """
-    client = create_client()
-
     # プロンプト構築
     if include_system_prompt:
         full_prompt = f"{SYSTEM_PROMPT}\n\n---\n\n## 質問\n{question}"
     else:
         full_prompt = question
 
+    # APIキー未設定などの設定エラーは、下の呼び出し直しの対象にせずそのまま送出する
+    if isinstance(gemini_client.get_transport(), gemini_client.GenAITransport):
+        gemini_client.get_client()
+
     # API呼び出し
     try:
         # thinking_config が使える場合
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=full_prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_level=thinking_level)
-            ),
+        return gemini_client.generate(
+            MODEL_ID,
+            full_prompt,
+            config={"thinking_config": {"thinking_level": thinking_level}},
         )
-    except Exception:
-        # SDK バージョンが古い場合はシンプルに呼び出し
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=full_prompt,
-        )
-
-    return response.text
+    except (TypeError, ValueError):
+        # SDK バージョンが古く thinking_config を受け付けない場合はシンプルに呼び出し
+        return gemini_client.generate(MODEL_ID, full_prompt)
 
 
 def interactive_mode():
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+問題生成のスループットベンチマーク
+
+ローカルのスタブサーバー（tools/stub_server.py）をモデルの代わりに立て、
+generate_questions.process_files を実際の HTTP 経路で実行して計測する。
+APIキー・ネットワーク不要。レスポンスは既存の TSV（または参考書 JSON）の行を再生して作る。
+
+計測項目:
+    チャンク/秒、問題/秒、チャンクのレイテンシ p50/p95/p99、ピークRSS、
+    段階別の所要時間（プロンプト組み立て・通信・抽出・検証・キャッシュ・書き出し）
+
+Usage:
+    python tools/bench_generate.py
+    python tools/bench_generate.py --latency 1.5 --jitter 0.5 --error-rate 0.05 --concurrency 8
+    python tools/bench_generate.py --fixture data/generated/JP01.tsv --rows 80 --stream
+    python tools/bench_generate.py --cache --runs 2     # 2回目はキャッシュヒットのみ
+    python tools/bench_generate.py --save baseline.json
+    python tools/bench_generate.py --concurrency 8 --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import gemini_client
+import generate_questions as gq
+from chunk_packer import QUESTIONS_PER_ITEM
+from response_cache import ResponseCache
+from stub_server import DEFAULT_RESPONSE, server_url, start_server
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 既定のフィクスチャ（参考書 JSON の問題をレスポンス行として再生する）
+DEFAULT_FIXTURE_GLOB = "data/**/*_shuffled.json"
+
+# ベンチマーク用のシステムインストラクション（実ファイルがなくても動くようにする）
+BENCH_SYSTEM_INSTRUCTION = "あなたは中学受験向けの4択クイズ作成者です。" * 50
+
+# 比較表示する指標（名前, 表示名, 大きいほど良いか）
+METRICS = [
+    ("chunks_per_sec", "チャンク/秒", True),
+    ("questions_per_sec", "問題/秒", True),
+    ("latency_p50", "p50レイテンシ(秒)", False),
+    ("latency_p95", "p95レイテンシ(秒)", False),
+    ("latency_p99", "p99レイテンシ(秒)", False),
+    ("peak_rss_mb", "ピークRSS(MB)", False),
+]
+
+
+def book_to_rows(book: dict) -> list[dict]:
+    """参考書 JSON（create_book 形式）の問題を TSV 行の形にする"""
+    subject = book.get("subject", "jp")
+    rows = []
+    for q in book.get("questions", []):
+        choices = [q.get(f"choice_{i}", "") for i in range(1, 5)]
+        index = int(q.get("correct_index", 0))
+        rows.append({
+            "subject": subject,
+            "genre_id": "BENCH",
+            "genre_name": book.get("title", ""),
+            "question_text": q.get("question_text", ""),
+            "choices": json.dumps(choices, ensure_ascii=False),
+            "correct_index": str(index),
+            "correct_answer": choices[index] if 0 <= index < len(choices) else "",
+            "hint": q.get("hint", ""),
+            "difficulty": "2",
+        })
+    return rows
+
+
+def load_fixture_rows(paths: list[Path]) -> list[dict]:
+    """フィクスチャ（生成済み TSV または参考書 JSON）から再生用の行を読む"""
+    rows = []
+    for path in paths:
+        if path.suffix == ".tsv":
+            rows.extend(gq.read_tsv(path))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                rows.extend(book_to_rows(json.load(f)))
+    if not rows:
+        rows = gq.parse_tsv_detailed(gq.extract_tsv_from_response(DEFAULT_RESPONSE))[0]
+    return rows
+
+
+def default_fixtures() -> list[Path]:
+    return sorted(gq.PROJECT_ROOT.glob(DEFAULT_FIXTURE_GLOB))[:1]
+
+
+def make_items(rows: list[dict], count: int) -> list[dict]:
+    """フィクスチャの行から知識データ相当のアイテムを作る（プロンプトの大きさを実データに近づける）"""
+    items = []
+    for i, row in zip(range(count), itertools.cycle(rows)):
+        items.append({
+            "no": i + 1,
+            "word": row.get("correct_answer", ""),
+            "example": row.get("question_text", ""),
+            "note": row.get("hint", ""),
+        })
+    return items
+
+
+class FakeModel:
+    """スタブサーバーの応答関数（遅延・ジッター・エラー率・レスポンス行数を指定できる）
+
+    フィクスチャの行を順に再生し、1レスポンスあたり rows 行の TSV を返す。
+    エラーは例外を送出し、スタブサーバー経由で HTTP 500 として返る。
+    """
+
+    def __init__(self, rows: list[dict], rows_per_response: int, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.rows_per_response = rows_per_response
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lines = itertools.cycle([gq.format_tsv_row(row) for row in rows])
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, request: dict) -> str:
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            lines = [next(self._lines) for _ in range(self.rows_per_response)]
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("疑似エラー")
+        return "```tsv\n" + "\t".join(gq.TSV_FIELDS) + "\n" + "\n".join(lines) + "\n```"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """プロセスのピーク RSS（MB）。resource モジュールがない環境では None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(args, knowledge_files: list[Path], model: FakeModel,
+             cache: Optional[ResponseCache]) -> dict:
+    """process_files を1回実行して指標を返す"""
+    timer = gq.StageTimes()
+    stats = gq.YieldStats()
+    requests_before, errors_before = model.requests, model.errors
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        log = io.StringIO()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else log):
+            results = gq.process_files(
+                knowledge_files,
+                BENCH_SYSTEM_INSTRUCTION,
+                args.mode,
+                Path(output_dir),
+                args.chunk_size,
+                False,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                cache=cache,
+                token_budget=args.token_budget,
+                prompt_format=args.prompt_format,
+                stream=args.stream,
+                retries=args.retries,
+                repair_rounds=0,
+                stats=stats,
+                timer=timer
+            )
+        wall = time.perf_counter() - started
+
+    chunks = len(timer.samples.get("chunk", []))
+    questions = sum(results.values())
+    return {
+        "wall": wall,
+        "chunks": chunks,
+        "questions": questions,
+        "requests": model.requests - requests_before,
+        "errors": model.errors - errors_before,
+        "chunks_per_sec": chunks / wall if wall else 0,
+        "questions_per_sec": questions / wall if wall else 0,
+        "latency_p50": timer.percentile("chunk", 50),
+        "latency_p95": timer.percentile("chunk", 95),
+        "latency_p99": timer.percentile("chunk", 99),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {stage: timer.total(stage) for stage in gq.StageTimes.STAGES},
+    }
+
+
+def print_report(label: str, m: dict):
+    print(f"\n=== {label} ===")
+    print(f"実行時間: {m['wall']:.2f}秒 / チャンク {m['chunks']} / 問題 {m['questions']} / "
+          f"リクエスト {m['requests']} (エラー {m['errors']})")
+    print(f"スループット: {m['chunks_per_sec']:.2f} チャンク/秒, {m['questions_per_sec']:.1f} 問題/秒")
+    print(f"レイテンシ: p50 {m['latency_p50']:.3f}秒 / p95 {m['latency_p95']:.3f}秒 / "
+          f"p99 {m['latency_p99']:.3f}秒")
+    rss = m["peak_rss_mb"]
+    print(f"ピークRSS: {rss:.1f}MB" if rss is not None else "ピークRSS: 計測不可")
+
+    # 段階別の時間は全スレッドの合計（並列実行中は実行時間を超えうる）
+    stage_total = sum(m["stages"].values())
+    print("段階別（全スレッド合計）:")
+    for stage, seconds in m["stages"].items():
+        share = seconds / stage_total * 100 if stage_total else 0
+        per_chunk = seconds / m["chunks"] * 1000 if m["chunks"] else 0
+        print(f"  {stage:<10} {seconds:8.3f}秒 {share:5.1f}%  ({per_chunk:.2f}ms/チャンク)")
+
+
+def print_comparison(current: dict, baseline: dict):
+    print("\n=== ベースライン比較 ===")
+    for key, name, higher_is_better in METRICS:
+        now, base = current.get(key), baseline.get(key)
+        if now is None or not base:
+            continue
+        change = (now - base) / base * 100
+        better = change > 0 if higher_is_better else change < 0
+        mark = "改善" if better else ("悪化" if change else "")
+        print(f"  {name:<18} {base:10.3f} → {now:10.3f} ({change:+.1f}%) {mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="問題生成のスループットベンチマーク（スタブモデル使用）")
+    parser.add_argument("--fixture", type=Path, nargs="*",
+                        help="再生するフィクスチャ（生成済み TSV または参考書 JSON）"
+                             f" (default: {DEFAULT_FIXTURE_GLOB} の先頭)")
+    parser.add_argument("--files", type=int, default=1, help="知識データのファイル数 (default: 1)")
+    parser.add_argument("--items", type=int, default=200, help="1ファイルのアイテム数 (default: 200)")
+    parser.add_argument("--rows", type=int,
+                        help="1レスポンスあたりの行数 (default: チャンク件数 × モードの問題数)")
+    parser.add_argument("--latency", type=float, default=0.2, help="1リクエストの遅延（秒） (default: 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="遅延のゆらぎ幅（±秒） (default: 0.05)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="HTTP 500 を返す割合（0〜1） (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="遅延・エラーの乱数シード")
+    parser.add_argument("--mode", choices=["standard", "max"], default="max")
+    parser.add_argument("--chunk-size", type=int, default=gq.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--token-budget", type=int)
+    parser.add_argument("--prompt-format", choices=gq.PROMPT_FORMATS, default=gq.DEFAULT_PROMPT_FORMAT)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="レート制限（回/秒、0で無制限） (default: 0)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="ストリーミング受信で計測")
+    parser.add_argument("--cache", action="store_true",
+                        help="レスポンスキャッシュを有効にする（--runs で2回目以降はヒット）")
+    parser.add_argument("--runs", type=int, default=1, help="繰り返し回数 (default: 1)")
+    parser.add_argument("--save", type=Path, help="最後の実行結果を JSON で保存")
+    parser.add_argument("--baseline", type=Path, help="比較するベースライン JSON（--save で保存したもの）")
+    parser.add_argument("--verbose", action="store_true", help="生成処理のログを表示")
+
+    args = parser.parse_args()
+
+    fixtures = args.fixture if args.fixture else default_fixtures()
+    rows = load_fixture_rows(fixtures)
+    rows_per_response = args.rows or args.chunk_size * QUESTIONS_PER_ITEM.get(args.mode, 1)
+    print(f"フィクスチャ: {', '.join(p.name for p in fixtures) or 'スタブ既定'} ({len(rows)}行)")
+    print(f"モデル: 遅延 {args.latency}±{args.jitter}秒 / エラー率 {args.error_rate} / "
+          f"{rows_per_response}行/レスポンス")
+    print(f"設定: 並列 {args.concurrency} / チャンク {args.chunk_size}件 / 形式 {args.prompt_format}"
+          f"{' / ストリーミング' if args.stream else ''}{' / キャッシュ' if args.cache else ''}")
+
+    model = FakeModel(rows, rows_per_response, args.latency, args.jitter,
+                      args.error_rate, args.seed)
+    server = start_server(model)
+    gemini_client.set_transport(gemini_client.HttpTransport(server_url(server)))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work = Path(work_dir)
+        knowledge_files = []
+        for i in range(1, args.files + 1):
+            path = work / "jp" / f"JP{i:02d}.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(make_items(rows, args.items), ensure_ascii=False),
+                            encoding="utf-8")
+            knowledge_files.append(path)
+
+        cache = ResponseCache(work / "cache") if args.cache else None
+        try:
+            for run in range(1, args.runs + 1):
+                metrics = run_once(args, knowledge_files, model, cache)
+                print_report(f"実行 {run}/{args.runs}", metrics)
+        finally:
+            server.shutdown()
+            gemini_client.set_transport(None)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print_comparison(metrics, json.load(f))
+    if args.save:
+        args.save.write_text(json.dumps(metrics, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n保存しました: {args.save}")
+
+
+if __name__ == "__main__":
+    main()
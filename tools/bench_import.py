@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+インポートの送信ベンチマーク
+
+GAS スタブ（tools/gas_stub.py）を別プロセスで起動し、import_questions.py の
+送信方式ごとに送信バイト数・所要時間・クライアント側のピークメモリを比べる。
+--loaders を付けると、ファイル読み込み（一括読み込みとストリーミング）の
+ピーク RSS と最初のバッチができるまでの時間を比べる。
+
+方式:
+    legacy       ペイロード全体を json.dumps して1回で POST（従来の方式）
+    none         バッチ分割 + ストリーミング送信（非圧縮）
+    gzip         バッチ分割 + ストリーミング送信（Content-Encoding: gzip）
+    gzip-base64  バッチ分割 + ストリーミング送信（gzip+base64、GAS 対応）
+
+Usage:
+    python tools/bench_import.py
+    python tools/bench_import.py --questions 5000 --workers 4
+    python tools/bench_import.py --file data/generated/JP01.tsv --modes none gzip-base64
+    python tools/bench_import.py --loaders --questions 100000 --format json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import time
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Iterable, Iterator
+from urllib import request
+
+import import_questions as iq
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+STUB_SCRIPT = Path(__file__).parent / "gas_stub.py"
+
+MODES = ["legacy"] + iq.COMPRESS_MODES
+
+# ローダーの比較対象
+#   bulk:   ファイル全体を読み込んでからバリデーション・バッチ分割（従来の方式）
+#   stream: 1問ずつ読みながらバリデーション・バッチ分割
+LOADERS = ["bulk", "stream"]
+FORMATS = {"json": ".json", "ndjson": ".ndjson", "tsv": ".tsv"}
+
+
+def iter_fake_questions(count: int) -> Iterator[dict]:
+    """日本語の問題文・ヒントを含む疑似データを1問ずつ作る"""
+    choices = ["独断", "毒断", "続断", "特断"]
+    for i in range(count):
+        yield {
+            "subject": "jp",
+            "genre_id": f"JP{i % 20 + 1:02d}",
+            "genre_name": "漢字・語彙",
+            "question_text": f"次の文の【　】にあてはまる漢字を選びなさい。問題{i}：物事を【どくだん】で決める。",
+            "choices": choices,
+            "correct_index": i % 4,
+            "correct_answer": choices[i % 4],
+            "hint": "「独」は「ひとり」、「断」は「決める」という意味。似た字に注意しよう。",
+            "difficulty": "normal",
+        }
+
+
+def make_questions(count: int) -> list[dict]:
+    return list(iter_fake_questions(count))
+
+
+@contextlib.contextmanager
+def gas_stub():
+    """GAS スタブを別プロセスで起動して URL を返す（計測にサーバー側のメモリを含めないため）"""
+    proc = subprocess.Popen([sys.executable, "-u", str(STUB_SCRIPT), "--port", "0"],
+                            stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    try:
+        line = proc.stdout.readline()
+        yield line.split(": ", 1)[1].strip()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def legacy_import(url: str, questions: list[dict], batch_id: str) -> int:
+    """従来の方式（全体を1回で POST）。送信バイト数を返す"""
+    payload = {"action": "import_questions", "questions": questions, "batch_id": batch_id}
+    data = json.dumps(payload).encode("utf-8")
+    req = request.Request(url, data=data, headers={"Content-Type": "application/json"},
+                          method="POST")
+    with request.urlopen(req, timeout=300) as response:
+        response.read()
+    return len(data)
+
+
+def send(mode: str, url: str, questions: list[dict], args) -> int:
+    """mode の方式で送信して送信バイト数を返す"""
+    batch_id = f"bench_{mode}"
+    if mode == "legacy":
+        return legacy_import(url, questions, batch_id)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = iq.import_to_gas(questions, batch_id, url=url,
+                                  batch_bytes=args.batch_bytes,
+                                  batch_size=args.batch_size,
+                                  workers=args.workers, compress=mode)
+    if not result["success"]:
+        raise RuntimeError(result.get("error"))
+    return result["sent_bytes"]
+
+
+def run_mode(mode: str, questions: list[dict], args) -> dict:
+    """時間とメモリは別々に計測する（tracemalloc を有効にすると処理が遅くなるため）"""
+    with gas_stub() as url:
+        started = time.perf_counter()
+        sent = send(mode, url, questions, args)
+        elapsed = time.perf_counter() - started
+
+    with gas_stub() as url:
+        tracemalloc.start()
+        send(mode, url, questions, args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"mode": mode, "sent_bytes": sent, "seconds": elapsed, "peak_bytes": peak}
+
+
+def write_questions(questions: Iterable[dict], path: Path):
+    """疑似データを拡張子に応じた形式で書き出す
+
+    計測する子プロセスに親のメモリ使用量が引き継がれないよう（Linux の ru_maxrss は
+    exec 後も残る）、1問ずつ書き出して親プロセスのメモリを増やさない。
+    """
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.suffix == ".json":
+            f.write("[\n")
+            for i, q in enumerate(questions):
+                f.write((",\n" if i else "") + json.dumps(q, ensure_ascii=False, indent=2))
+            f.write("\n]\n")
+        elif path.suffix == ".ndjson":
+            for q in questions:
+                f.write(json.dumps(q, ensure_ascii=False) + "\n")
+        else:
+            fields = iq.REQUIRED_FIELDS + ["hint", "difficulty"]
+            f.write("\t".join(fields) + "\n")
+            for q in questions:
+                row = dict(q, choices=json.dumps(q["choices"], ensure_ascii=False))
+                f.write("\t".join(str(row[field]) for field in fields) + "\n")
+
+
+def bulk_load(path: Path) -> list[dict]:
+    """従来の読み込み（JSON は json.load でファイル全体を読む）"""
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return list(iq.question_loader(path)(path))
+
+
+def measure_loader(loader: str, path: Path, args) -> dict:
+    """ローダーで全バッチを作り、最初のバッチまでの時間・全体の時間・ピークメモリを返す
+
+    ピーク RSS はプロセス全体の値なので、ローダーごとに子プロセスで実行する。
+    """
+    if resource is None:
+        tracemalloc.start()
+    started = time.perf_counter()
+    first_batch = None
+    batches = 0
+
+    if loader == "bulk":
+        questions = bulk_load(path)
+        if iq.validate_questions(questions):
+            raise ValueError("バリデーションエラー")
+        batch_iter = iter(iq.split_batches(questions, args.batch_bytes, args.batch_size))
+    else:
+        scan = iq.QuestionScan()
+        checked = scan.check(iq.question_loader(path)(path))
+        batch_iter = iq.iter_batches(checked, args.batch_bytes, args.batch_size)
+
+    for _ in batch_iter:
+        if first_batch is None:
+            first_batch = time.perf_counter() - started
+        batches += 1
+    total = time.perf_counter() - started
+
+    if resource is None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+    return {"loader": loader, "first_batch": first_batch or 0.0, "total": total,
+            "batches": batches, "peak_bytes": peak}
+
+
+def compare_loaders(args):
+    """ローダーごとに子プロセスで計測して表にする"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = args.file
+        if path is None:
+            path = Path(work_dir) / f"questions{FORMATS[args.format]}"
+            write_questions(iter_fake_questions(args.questions), path)
+        size = path.stat().st_size
+        print(f"ファイル: {path.name} ({iq.format_bytes(size)})")
+        memory = "ピークRSS" if resource else "ピークメモリ(tracemalloc)"
+        print(f"\n{'ローダー':<8} {'最初のバッチ':>12} {'全体':>8} {'バッチ数':>8} {memory:>12}")
+        for loader in LOADERS:
+            output = subprocess.run(
+                [sys.executable, __file__, "--child-loader", loader, str(path),
+                 "--batch-bytes", str(args.batch_bytes), "--batch-size", str(args.batch_size)],
+                check=True, capture_output=True, text=True, encoding="utf-8").stdout
+            m = json.loads(output)
+            print(f"{m['loader']:<8} {m['first_batch']:>11.3f}秒 {m['total']:>7.2f}秒 "
+                  f"{m['batches']:>8} {iq.format_bytes(m['peak_bytes']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="インポートの送信ベンチマーク（GAS スタブ使用）")
+    parser.add_argument("--file", type=Path, help="送信する問題ファイル（TSV / JSON、省略時は疑似データ）")
+    parser.add_argument("--questions", type=int, default=3000, help="疑似データの問題数 (default: 3000)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--batch-bytes", type=int, default=iq.DEFAULT_BATCH_BYTES)
+    parser.add_argument("--batch-size", type=int, default=iq.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=iq.DEFAULT_WORKERS)
+    parser.add_argument("--loaders", action="store_true",
+                        help="送信ではなくファイル読み込み（一括 / ストリーミング）を比べる")
+    parser.add_argument("--format", choices=list(FORMATS), default="json",
+                        help="--loaders で作る疑似データの形式 (default: json)")
+    parser.add_argument("--child-loader", nargs=2, metavar=("LOADER", "FILE"),
+                        help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child_loader:
+        loader, path = args.child_loader
+        print(json.dumps(measure_loader(loader, Path(path), args)))
+        return
+    if args.loaders:
+        compare_loaders(args)
+        return
+
+    if args.file:
+        loader = iq.load_tsv if args.file.suffix.lower() == ".tsv" else iq.load_json
+        questions = loader(args.file)
+    else:
+        questions = make_questions(args.questions)
+    print(f"問題数: {len(questions)} / バッチ上限: {iq.format_bytes(args.batch_bytes)}, "
+          f"{args.batch_size}問 / 並列数: {args.workers}")
+
+    print(f"\n{'方式':<12} {'送信量':>10} {'時間':>8} {'ピークメモリ':>12}")
+    for mode in args.modes:
+        m = run_mode(mode, questions, args)
+        print(f"{m['mode']:<12} {iq.format_bytes(m['sent_bytes']):>10} {m['seconds']:>7.2f}秒 "
+              f"{iq.format_bytes(m['peak_bytes']):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+data/ の成果物の差分ビルド
+
+参考書の Markdown から作る結合 JSON（merge_json.py）・シャッフル済み JSON
+（shuffle_json.py）と、KNOWLEDGE から作る生成済み TSV（generate_questions.py）を
+依存関係のグラフにして、古くなったものだけを作り直す（小さな make）。
+
+ターゲットごとに、入力・スクリプトの内容のハッシュとパラメータ（シードなど）を
+data/.build_state.json に記録し、どれかが変わったときだけビルドする。
+更新日時ではなく内容で比べるので、作り直した結合 JSON が前と同じ内容なら
+シャッフル済み JSON は作り直さない。依存関係のないターゲットは並列にビルドする。
+
+出力はあるがビルドの記録がないターゲット（クローン直後など）は作り直さずにスキップする。
+シャッフル済み JSON はスプレッドシートに登録済みのことがあり、別のシードで並べ直すと
+登録した内容と違ってしまうため。--touch で今ある出力を記録するか、--force で作り直す。
+
+対象:
+    data/*.md, data/FINISH/*.md  1行目が ```json で始まる参考書の Markdown
+                                  → 参考書名.json → 参考書名_shuffled.json
+    KNOWLEDGE/{教科}/*.json      → data/generated/{ジャンルID}.tsv（--generated 指定時のみビルド）
+
+Usage:
+    python tools/build_data.py                  # 古くなったものだけビルド
+    python tools/build_data.py --explain        # ターゲットごとにビルドする・しない理由を表示
+    python tools/build_data.py -n --explain     # ビルドせずに理由だけ表示
+    python tools/build_data.py --seed 42 --balance --jobs 4
+    python tools/build_data.py "*四字熟語*"      # 一致するターゲット（と依存先）だけ
+    python tools/build_data.py --touch          # 今ある成果物を最新として記録する（ビルドしない）
+    python tools/build_data.py --force          # 記録のない既存の成果物も作り直す
+    python tools/build_data.py --generated      # 生成済み TSV も作り直す（Gemini API を使う）
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from run_manifest import atomic_write_text, file_hash
+
+# プロジェクトルート
+PROJECT_ROOT = Path(__file__).parent.parent
+TOOLS_DIR = PROJECT_ROOT / "tools"
+DATA_DIR = PROJECT_ROOT / "data"
+sys.path.insert(0, str(DATA_DIR))
+
+import merge_json  # noqa: E402
+import shuffle_json  # noqa: E402
+
+# 参考書の Markdown を探すディレクトリ
+BOOK_DIRS = [DATA_DIR, DATA_DIR / "FINISH"]
+
+# ビルドの記録
+DEFAULT_STATE_FILE = DATA_DIR / ".build_state.json"
+
+# シャッフルのシード（同じシードなら同じ出力）
+DEFAULT_SEED = 0
+
+# 生成済み TSV
+KNOWLEDGE_DIR = PROJECT_ROOT / "KNOWLEDGE"
+GENERATED_DIR = DATA_DIR / "generated"
+SYSTEM_INSTRUCTION_FILE = KNOWLEDGE_DIR / "SYSTEM＿INSTRUCTION.txt"
+SUBJECTS = ["jp", "math", "sci", "soc"]
+GENERATE_MODE = "max"
+
+# ルールごとのスクリプト（内容が変わったら作り直す）
+RULE_SCRIPTS = {
+    "merge": [DATA_DIR / "merge_json.py", TOOLS_DIR / "question.py"],
+    "shuffle": [DATA_DIR / "shuffle_json.py", TOOLS_DIR / "question.py"],
+    "generate": [TOOLS_DIR / name for name in
+                 ("generate_questions.py", "gemini_client.py", "validation.py", "chunk_packer.py",
+                  "question.py")],
+}
+
+
+@dataclass
+class Target:
+    """ビルドする成果物1つ"""
+    rule: str                    # merge / shuffle / generate
+    output: Path
+    inputs: list[Path]
+    params: dict = field(default_factory=dict)
+    deps: list[str] = field(default_factory=list)   # 出力を入力に使うターゲット
+
+    @property
+    def name(self) -> str:
+        return rel(self.output)
+
+    @property
+    def scripts(self) -> list[Path]:
+        return RULE_SCRIPTS[self.rule]
+
+
+def rel(path: Path) -> str:
+    """記録・表示用のパス（プロジェクトルートからの相対パス）"""
+    try:
+        return path.resolve().relative_to(PROJECT_ROOT.resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def is_book_source(path: Path) -> bool:
+    """LLM が出力した参考書の Markdown か（1行目が ```json で始まる。説明用の .md は除く）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.readline().lstrip("\ufeff").strip().startswith("```json")
+
+
+def discover_targets(seed: int, balance: bool) -> list[Target]:
+    """ターゲットを依存先が先になる順に並べて返す"""
+    targets = []
+    for directory in BOOK_DIRS:
+        if not directory.exists():
+            continue
+        for md in sorted(directory.glob("*.md")):
+            if not is_book_source(md):
+                continue
+            merged = md.with_suffix(".json")
+            shuffled = Path(shuffle_json.output_path(str(md)))
+            targets.append(Target("merge", merged, [md]))
+            targets.append(Target("shuffle", shuffled, [merged],
+                                  {"seed": seed, "balance": balance}, deps=[rel(merged)]))
+
+    for subject in SUBJECTS:
+        directory = KNOWLEDGE_DIR / subject
+        if not directory.exists():
+            continue
+        for source in sorted(directory.glob("*.json")):
+            targets.append(Target("generate", GENERATED_DIR / f"{source.stem}.tsv",
+                                  [source, SYSTEM_INSTRUCTION_FILE], {"mode": GENERATE_MODE}))
+    return targets
+
+
+def select_targets(targets: list[Target], patterns: list[str]) -> list[Target]:
+    """パターン（fnmatch、出力の相対パスに対して）に一致するターゲットと依存先"""
+    if not patterns:
+        return targets
+    by_name = {t.name: t for t in targets}
+    wanted = set()
+    stack = [t.name for t in targets
+             if any(fnmatch.fnmatch(t.name, p) or p in t.name for p in patterns)]
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(by_name[name].deps)
+    return [t for t in targets if t.name in wanted]
+
+
+class BuildState:
+    """ビルドの記録（data/.build_state.json）
+
+    files:   パス → [更新日時(ns), サイズ, SHA-256]（更新日時とサイズが同じなら読み直さない）
+    targets: 出力 → {"inputs", "scripts", "params", "output"}（ビルドしたときのハッシュ）
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.files: dict[str, list] = {}
+        self.targets: dict[str, dict] = {}
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") == self.VERSION:
+                self.files = data.get("files", {})
+                self.targets = data.get("targets", {})
+
+    def hash(self, path: Path) -> Optional[str]:
+        """ファイル内容のハッシュ（ファイルがなければ None）"""
+        key = rel(path)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self.files.pop(key, None)
+            return None
+        cached = self.files.get(key)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        digest = file_hash(path)
+        self.files[key] = [st.st_mtime_ns, st.st_size, digest]
+        return digest
+
+    def fingerprint(self, target: Target) -> dict:
+        """今の入力・スクリプト・パラメータ"""
+        return {
+            "inputs": {rel(p): self.hash(p) for p in target.inputs},
+            "scripts": {rel(p): self.hash(p) for p in target.scripts},
+            "params": target.params,
+        }
+
+    def record(self, target: Target):
+        self.targets[target.name] = dict(self.fingerprint(target),
+                                         output=self.hash(target.output))
+
+    def save(self, names: list[str]):
+        """記録を書き出す（今のターゲットにないものは消す）"""
+        self.targets = {k: v for k, v in self.targets.items() if k in names}
+        data = {"version": self.VERSION, "files": self.files, "targets": self.targets}
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1))
+
+
+def stale_reasons(target: Target, state: BuildState) -> list[str]:
+    """ビルドが必要な理由（空なら最新）"""
+    output = state.hash(target.output)
+    if output is None:
+        return ["出力がありません"]
+    recorded = state.targets.get(target.name)
+    if recorded is None:
+        return ["ビルドの記録がありません"]
+
+    reasons = []
+    current = state.fingerprint(target)
+    for kind, label in (("inputs", "入力"), ("scripts", "スクリプト")):
+        before = recorded.get(kind, {})
+        for path, digest in current[kind].items():
+            if digest is None:
+                reasons.append(f"{label}がありません: {path}")
+            elif path not in before:
+                reasons.append(f"{label}が増えました: {path}")
+            elif before[path] != digest:
+                reasons.append(f"{label}が変わりました: {path}")
+    before_params = recorded.get("params", {})
+    for key in sorted(set(before_params) | set(current["params"])):
+        if before_params.get(key) != current["params"].get(key):
+            reasons.append(f"パラメータが変わりました: {key} {before_params.get(key)} → "
+                           f"{current['params'].get(key)}")
+    if recorded.get("output") != output:
+        reasons.append("出力が記録と違います（手で変更された）")
+    return reasons
+
+
+def unrecorded_output(target: Target, state: BuildState) -> bool:
+    """出力はあるがビルドの記録がない（このツール以外で作られた）か"""
+    return target.name not in state.targets and state.hash(target.output) is not None
+
+
+def run_rule(rule: str, output: str, inputs: list[str], params: dict) -> tuple[bool, list[str]]:
+    """ターゲットを1つビルドする（ワーカープロセスで実行）。(成功したか, 表示する行) を返す"""
+    lines = []
+    out = Path(output)
+    tmp = out.with_name(f".{out.name}.tmp")
+    try:
+        if rule == "merge":
+            result = merge_json.merge_json_streaming(inputs[0], str(tmp), "json", log=lines.append)
+            if not result or result["errors"] or not result["blocks"]:
+                return False, [line.strip() for line in lines if "エラー" in line or "警告" in line]
+            os.replace(tmp, out)
+            return True, [f"JSONブロック {result['blocks']} 個 / {result['questions']} 問"]
+        if rule == "shuffle":
+            buffer = io.StringIO()
+            with contextlib.redirect_stdout(buffer):
+                ok = shuffle_json.shuffle_quiz_choices(inputs[0], str(tmp), params["seed"],
+                                                       params["balance"])
+            lines = buffer.getvalue().splitlines()
+            if not ok:
+                return False, lines
+            os.replace(tmp, out)
+            return True, [line.strip() for line in lines if "correct_index" in line]
+        if rule == "generate":
+            # ターゲットごとの作業ディレクトリに生成する（マニフェストも別になるので並列に
+            # ビルドできる）。失敗したチャンクがあれば出力を置き換えず、次回は --resume で続きから
+            work_dir = out.with_name(f".{out.stem}.build")
+            proc = subprocess.run(
+                [sys.executable, str(TOOLS_DIR / "generate_questions.py"), inputs[0],
+                 "--mode", params["mode"], "--output-dir", str(work_dir), "--resume"],
+                capture_output=True, text=True, encoding="utf-8")
+            lines = (proc.stdout + proc.stderr).splitlines()
+            generated = work_dir / out.name
+            if proc.returncode != 0 or not generated.exists():
+                return False, lines[-5:]
+            os.replace(generated, out)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return True, lines[-5:]
+        raise ValueError(f"不明なルール: {rule}")
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def ready_targets(pending: list[Target], finished: dict, by_name: dict):
+    """依存先が終わったターゲットを pending から取り出して返す
+
+    取り出したターゲットを呼び出し側で終わらせると、それに依存するものも続けて返す。
+    """
+    while True:
+        ready = [t for t in pending if all(d in finished or d not in by_name for d in t.deps)]
+        if not ready:
+            return
+        for target in ready:
+            pending.remove(target)
+            yield target
+
+
+@dataclass
+class BuildReport:
+    built: list[str] = field(default_factory=list)
+    up_to_date: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    unrecorded: list[str] = field(default_factory=list)
+
+
+def build(targets: list[Target], state: BuildState, jobs: int = 1, explain: bool = False,
+          dry_run: bool = False, touch: bool = False, generated: bool = False,
+          force: bool = False) -> BuildReport:
+    """依存先が終わったターゲットから順に、古くなったものだけを並列にビルドする
+
+    依存先の判定はその依存先のビルドが終わってから行う（内容が同じなら作り直さない）。
+    dry_run では依存先をビルドする予定のターゲットも「ビルドする」として表示する。
+    出力はあるが記録がないターゲットは、force=True でなければ上書きせずにスキップする。
+    """
+    report = BuildReport()
+    by_name = {t.name: t for t in targets}
+    pending = list(targets)
+    finished: dict[str, str] = {}    # 名前 → ok / failed / skipped / planned
+    running = {}
+
+    def show(target: Target, status: str, reasons: list[str] = ()):
+        print(f"{status} {target.name}")
+        if explain:
+            for reason in reasons:
+                print(f"    - {reason}")
+
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for target in ready_targets(pending, finished, by_name):
+                if unrecorded_output(target, state) and not (force or touch):
+                    finished[target.name] = "skipped"
+                    report.skipped.append(target.name)
+                    report.unrecorded.append(target.name)
+                    show(target, "スキップ", ["出力はあるがビルドの記録がないので上書きしない"
+                                            "（--touch で記録、--force で作り直す）"])
+                    continue
+                dep_status = {d: finished.get(d) for d in target.deps}
+                broken = [d for d, s in dep_status.items() if s in ("failed", "skipped")]
+                if broken:
+                    finished[target.name] = "skipped"
+                    report.skipped.append(target.name)
+                    show(target, "スキップ", [f"依存先がビルドできませんでした: {d}" for d in broken])
+                    continue
+
+                planned = [d for d, s in dep_status.items() if s == "planned"]
+                reasons = stale_reasons(target, state)
+                if not reasons and planned:
+                    reasons = [f"依存先をビルドします（内容が変われば作り直す）: {d}" for d in planned]
+                if not reasons:
+                    finished[target.name] = "ok"
+                    report.up_to_date.append(target.name)
+                    if explain:
+                        show(target, "最新", ["入力・スクリプト・パラメータが記録と同じ"])
+                    continue
+
+                if target.rule == "generate" and not generated and not touch:
+                    finished[target.name] = "skipped"
+                    report.skipped.append(target.name)
+                    show(target, "スキップ", reasons + ["生成済み TSV は --generated を付けたときだけ作り直す"])
+                    continue
+                if touch:
+                    if state.hash(target.output) is None:
+                        finished[target.name] = "skipped"
+                        report.skipped.append(target.name)
+                        show(target, "スキップ", ["出力がないので記録できません"])
+                    else:
+                        state.record(target)
+                        finished[target.name] = "ok"
+                        report.up_to_date.append(target.name)
+                        show(target, "記録", reasons)
+                    continue
+                if dry_run:
+                    finished[target.name] = "planned"
+                    report.built.append(target.name)
+                    show(target, "ビルドする", reasons)
+                    continue
+
+                show(target, "ビルド", reasons)
+                future = pool.submit(run_rule, target.rule, str(target.output),
+                                     [str(p) for p in target.inputs], target.params)
+                running[future] = target
+
+            if not running:
+                if pending:
+                    # 依存先がターゲットにない（選択から外れた）ものは通常ここに来ない
+                    raise RuntimeError("依存関係を解決できません: " + ", ".join(t.name for t in pending))
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                target = running.pop(future)
+                try:
+                    ok, lines = future.result()
+                except Exception as e:
+                    ok, lines = False, [f"{type(e).__name__}: {e}"]
+                print(f"{'完了' if ok else '失敗'} {target.name}")
+                for line in lines:
+                    print(f"    {line}")
+                if ok:
+                    state.record(target)
+                    finished[target.name] = "ok"
+                    report.built.append(target.name)
+                else:
+                    finished[target.name] = "failed"
+                    report.failed.append(target.name)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data/ の成果物の差分ビルド")
+    parser.add_argument("targets", nargs="*",
+                        help="ビルドするターゲット（出力の相対パスに対するパターン、省略時は全部）")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help=f"シャッフルのシード (default: {DEFAULT_SEED})")
+    parser.add_argument("--balance", action="store_true", help="正解の位置を均等にシャッフルする")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="並列にビルドする数 (default: CPU数)")
+    parser.add_argument("--explain", action="store_true",
+                        help="ターゲットごとにビルドする・しない理由を表示する")
+    parser.add_argument("--dry-run", "-n", action="store_true", help="ビルドせずに表示だけする")
+    parser.add_argument("--touch", action="store_true",
+                        help="ビルドせず、今ある成果物を最新として記録する")
+    parser.add_argument("--force", action="store_true",
+                        help="ビルドの記録がない既存の成果物も作り直す")
+    parser.add_argument("--generated", action="store_true",
+                        help="生成済み TSV も作り直す（Gemini API を使う）")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE_FILE, help="ビルドの記録ファイル")
+
+    args = parser.parse_args()
+
+    all_targets = discover_targets(args.seed, args.balance)
+    targets = select_targets(all_targets, args.targets)
+    if not targets:
+        print("ターゲットがありません。")
+        return 1
+
+    state = BuildState(args.state)
+    started = time.perf_counter()
+    report = build(targets, state, args.jobs, args.explain, args.dry_run, args.touch,
+                   args.generated, args.force)
+    elapsed = time.perf_counter() - started
+    if not args.dry_run:
+        state.save([t.name for t in all_targets])
+
+    built = "ビルド予定" if args.dry_run else "ビルド"
+    print("-" * 50)
+    print(f"{built} {len(report.built)} / 最新 {len(report.up_to_date)} / "
+          f"失敗 {len(report.failed)} / スキップ {len(report.skipped)}（{elapsed:.2f}秒）")
+    if report.unrecorded:
+        print(f"記録のない既存の成果物 {len(report.unrecorded)} 個は上書きしませんでした。"
+              f"今ある成果物を最新として記録するには --touch、作り直すには --force を付けてください。")
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
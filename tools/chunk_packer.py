@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+トークン予算によるチャンク分割
+
+知識データ1件ごとにプロンプト・出力のトークン数を見積もり、
+出力トークンが予算に収まる範囲でできるだけ多くのアイテムを1チャンクに詰める。
+短い漢字データは1回にまとめて往復回数を減らし、長い歴史データは
+小さく分けて max_output_tokens による TSV の途中切れを防ぐ。
+
+見積もりは概算（ASCII は4文字で1トークン、それ以外は1文字1トークン）。
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+# 1アイテムあたりの生成問題数の目安
+QUESTIONS_PER_ITEM = {"standard": 1, "max": 4}
+
+# TSV 1行の固定部分（subject, genre_id, genre_name, 区切り文字、difficulty など）
+ROW_OVERHEAD_TOKENS = 40
+
+# 問題文・選択肢・ヒントの長さはおおむね知識データの長さに比例する
+ROW_CONTENT_RATIO = 1.5
+
+# 出力トークンの目標値（max_output_tokens=65536 に対して思考トークン分の余裕を残す）
+DEFAULT_OUTPUT_BUDGET = 32768
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算する"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def default_serializer(item: dict) -> str:
+    return json.dumps(item, ensure_ascii=False, indent=2)
+
+
+@dataclass
+class ItemEstimate:
+    """1アイテムのトークン見積もり"""
+    prompt_tokens: int
+    output_tokens: int
+
+
+def estimate_item(item: dict, mode: str,
+                  serializer: Callable[[dict], str] = default_serializer) -> ItemEstimate:
+    """1アイテムのプロンプト・出力トークン数を見積もる
+
+    プロンプトは serializer の形式で数える。出力（モデルが書く問題の行）の長さは
+    埋め込み形式によらないので、常に既定の形式（整形済みJSON）の長さから見積もる。
+    """
+    content_tokens = estimate_tokens(default_serializer(item))
+    if serializer is default_serializer:
+        prompt_tokens = content_tokens
+    else:
+        prompt_tokens = estimate_tokens(serializer(item))
+    per_question = ROW_OVERHEAD_TOKENS + int(content_tokens * ROW_CONTENT_RATIO)
+    return ItemEstimate(prompt_tokens, QUESTIONS_PER_ITEM.get(mode, 1) * per_question)
+
+
+def pack_chunks(items: list[dict], mode: str, output_budget: int = DEFAULT_OUTPUT_BUDGET,
+                max_items: Optional[int] = None,
+                serializer: Callable[[dict], str] = default_serializer) -> list[list[dict]]:
+    """出力トークン予算に収まるようにアイテムをチャンクに詰める
+
+    元の並び順を保ったまま先頭から詰めていく（next-fit）。TSV の行順と
+    キャッシュキーが入力順で決まるようにするため、並べ替えはしない。
+    予算を単独で超えるアイテムは1件だけのチャンクにする。
+    """
+    chunks: list[list[dict]] = []
+    current: list[dict] = []
+    current_tokens = 0
+
+    for item in items:
+        tokens = estimate_item(item, mode, serializer).output_tokens
+        full = max_items is not None and len(current) >= max_items
+        if current and (current_tokens + tokens > output_budget or full):
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def estimate_chunk(chunk: list[dict], mode: str,
+                   serializer: Callable[[dict], str] = default_serializer) -> ItemEstimate:
+    """チャンク全体の見積もり（プロンプトは知識データ部分のみ）"""
+    estimates = [estimate_item(item, mode, serializer) for item in chunk]
+    return ItemEstimate(sum(e.prompt_tokens for e in estimates),
+                        sum(e.output_tokens for e in estimates))
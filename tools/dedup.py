@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+ほぼ同じ問題の検出（MinHash / LSH）
+
+参考書 JSON と生成済み TSV をまとめて読み、問題文 + 正解の文字 n-gram から
+MinHash のスケッチを作って LSH のバケットに入れる。同じバケットに入った問題どうし
+だけを比べるので、全ペアを比べる O(n²) にならない。
+
+スケッチは One Permutation Hashing（n-gram のハッシュを NUM_BINS 個のビンに
+振り分けて各ビンの最小値を取る）で作り、空のビンは右隣のビンから埋める
+（rotation densification）。バケットで見つけた候補は n-gram 集合の
+Jaccard 係数で確かめる（短い問題文ではスケッチの一致率が高めに出るため）。
+正解（正規化後）が異なる問題は、問題文が似ていても重複とみなさない。
+
+Usage:
+    python tools/dedup.py                                  # data/ 以下の全ファイル
+    python tools/dedup.py data/generated/JP01.tsv data/generated/JP02.tsv
+    python tools/dedup.py --threshold 0.7 --show 20
+    python tools/dedup.py --output-dir data/dedup          # 重複を除いて入力ごとに書き出す
+
+--output-dir では、入力ファイルごとに重複（残す問題以外）を除いたものを同じファイル名で
+書き出す。形式は入力と同じ（参考書 JSON は create_book 形式のまま、TSV は同じ列のまま）
+なので、そのまま create_book / import_questions.py に渡せる。
+"""
+
+import argparse
+import csv
+import json
+import re
+import time
+import unicodedata
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+import import_questions as iq
+from question_store import PROJECT_ROOT, expand_paths, is_book_file, iter_file
+from run_manifest import atomic_write_text
+
+
+# 既定の入力（data/ 以下の参考書 JSON と生成済み TSV）
+DEFAULT_PATTERNS = ["data/**/*_shuffled.json", "data/generated/*.tsv"]
+
+# 文字 n-gram の長さ
+NGRAM = 3
+
+# スケッチのビン数（2のべき乗）と LSH のバンド数（1バンド = NUM_BINS / BANDS 個のビン）
+NUM_BINS = 64
+BANDS = 16
+
+# 重複とみなす類似度（n-gram 集合の Jaccard 係数）
+DEFAULT_THRESHOLD = 0.8
+
+# 1つのバケットに入れる代表の上限（定型文が多いバケットで比較が膨らまないように）
+MAX_BUCKET_REPRESENTATIVES = 32
+
+# 空のビンを埋めるときに距離ごとにずらす値
+_DENSIFY_STEP = 0x9E3779B1
+
+# 記号・空白（問題文の装飾 **太字** や【】の違いは無視する）
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """全角・半角、大文字・小文字、記号・空白の違いをなくす"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", str(text)).lower())
+
+
+def shingle_hashes(text: str, n: int = NGRAM) -> list[int]:
+    """文字 n-gram の32ビットハッシュ（重複なし）
+
+    UTF-16 にしてから n 文字分のバイト列をスライスし、crc32 を取る
+    （実行ごとに値が変わる hash() は使わない）。
+    """
+    data = text.encode("utf-16-le")
+    width = 2 * n
+    if len(data) < width:
+        return [zlib.crc32(data)] if data else []
+    hashes = set()
+    for start in range(0, len(data) - width + 1, 2):
+        hashes.add(zlib.crc32(data[start:start + width]))
+    return list(hashes)
+
+
+def make_sketch(hashes: list[int], num_bins: int = NUM_BINS) -> Optional[tuple]:
+    """One Permutation Hashing のスケッチ（n-gram がなければ None）"""
+    if not hashes:
+        return None
+    # ビンごとの最小値（ビンはハッシュの下位ビット）
+    bins = {}
+    for h in hashes:
+        k = h & (num_bins - 1)
+        if k not in bins or h < bins[k]:
+            bins[k] = h
+    if len(bins) == num_bins:
+        return tuple(bins[k] for k in range(num_bins))
+
+    # 空のビンは右側で最も近い値のあるビンから、距離に応じてずらした値で埋める
+    sketch = [0] * num_bins
+    filled = sorted(bins)
+    previous = filled[-1] - num_bins
+    for k in filled:
+        value = bins[k]
+        sketch[k] = value
+        for j in range(previous + 1, k):
+            sketch[j] = (value + (k - j) * _DENSIFY_STEP) & 0xFFFFFFFF
+        previous = k
+    return tuple(sketch)
+
+
+def jaccard(a: array, b: array) -> float:
+    """n-gram ハッシュ集合の Jaccard 係数"""
+    common = len(set(a).intersection(b))
+    return common / (len(a) + len(b) - common)
+
+
+@dataclass
+class Entry:
+    """索引に入れた1問"""
+    source: str
+    number: int              # ファイル内の問題番号（1始まり）
+    question: dict
+    answer: str              # 正規化した正解
+    shingles: array          # n-gram ハッシュ（重複なし）
+
+    @property
+    def label(self) -> str:
+        return f"{self.source}:{self.number}"
+
+
+@dataclass
+class Cluster:
+    """重複とみなした問題のまとまり（先頭が残す問題）"""
+    entries: list[Entry] = field(default_factory=list)
+
+    @property
+    def keep(self) -> Entry:
+        return self.entries[0]
+
+    @property
+    def drop(self) -> list[Entry]:
+        return self.entries[1:]
+
+
+def correct_answer(q: dict) -> str:
+    answer = q.get("correct_answer")
+    if answer:
+        return str(answer)
+    choices = q.get("choices")
+    if isinstance(choices, str):
+        try:
+            choices = json.loads(choices)
+        except json.JSONDecodeError:
+            return ""
+    try:
+        return str(choices[int(q.get("correct_index"))])
+    except (TypeError, ValueError, IndexError, KeyError):
+        return ""
+
+
+class DedupIndex:
+    """MinHash / LSH の索引"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_bins: int = NUM_BINS,
+                 bands: int = BANDS):
+        if num_bins % bands:
+            raise ValueError("num_bins は bands で割り切れる必要があります")
+        self.threshold = threshold
+        self.num_bins = num_bins
+        self.rows = num_bins // bands
+        self.entries: list[Entry] = []
+        self.buckets: dict[tuple, list[int]] = {}
+        self.skipped = 0
+        self.compared = 0
+        self._parent: list[int] = []
+
+    def add(self, question: dict, source: str, number: int):
+        answer = normalize(correct_answer(question))
+        key = normalize(question.get("question_text", "")) + "|" + answer
+        hashes = shingle_hashes(key)
+        sketch = make_sketch(hashes, self.num_bins)
+        if sketch is None:
+            self.skipped += 1
+            return
+        index = len(self.entries)
+        entry = Entry(source, number, question, answer, array("I", hashes))
+        self.entries.append(entry)
+        self._parent.append(index)
+
+        # 正解が同じで、どれかのバンドが一致した代表だけを候補にする
+        # （正解をバケットのキーに含めるので、定型の問題文でも候補が膨らまない）
+        rows = self.rows
+        buckets = [self.buckets.setdefault((band, answer, sketch[band:band + rows]), [])
+                   for band in range(0, self.num_bins, rows)]
+        candidates = set().union(*buckets)
+
+        size = len(entry.shingles)
+        for other in sorted(candidates):
+            candidate = self.entries[other]
+            # Jaccard 係数は小さい方の集合 / 大きい方の集合を超えない
+            other_size = len(candidate.shingles)
+            if min(size, other_size) < self.threshold * max(size, other_size):
+                continue
+            self.compared += 1
+            if jaccard(candidate.shingles, entry.shingles) >= self.threshold:
+                self._union(other, index)
+                return
+
+        # 重複でなければ代表としてバケットに入れる
+        for bucket in buckets:
+            if len(bucket) < MAX_BUCKET_REPRESENTATIVES:
+                bucket.append(index)
+
+    def add_all(self, questions: Iterable[dict], source: str):
+        for number, q in enumerate(questions, start=1):
+            self.add(q, source, number)
+
+    def _find(self, i: int) -> int:
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _union(self, a: int, b: int):
+        ra, rb = self._find(a), self._find(b)
+        if ra != rb:
+            # 先に読んだ問題を根にする（残す問題になる）
+            self._parent[max(ra, rb)] = min(ra, rb)
+
+    def clusters(self) -> list[Cluster]:
+        """2問以上のまとまりを、大きい順に返す"""
+        groups: dict[int, Cluster] = {}
+        for i, entry in enumerate(self.entries):
+            groups.setdefault(self._find(i), Cluster()).entries.append(entry)
+        result = [c for c in groups.values() if len(c.entries) > 1]
+        result.sort(key=lambda c: (-len(c.entries), c.keep.label))
+        return result
+
+    def dropped(self) -> dict[str, set[int]]:
+        """入力ごとの、除く問題の番号（まとまりごとに最初に読んだ1問以外）"""
+        result: dict[str, set[int]] = {}
+        for i, entry in enumerate(self.entries):
+            if self._find(i) != i:
+                result.setdefault(entry.source, set()).add(entry.number)
+        return result
+
+
+def write_questions(questions: Iterable[dict], path: Path) -> int:
+    """問題を JSON 配列または NDJSON（.ndjson / .jsonl）で書き出す"""
+    count = 0
+    ndjson = path.suffix.lower() in iq.NDJSON_SUFFIXES
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        if not ndjson:
+            f.write("[\n")
+        for q in questions:
+            text = json.dumps(q, ensure_ascii=False)
+            if ndjson:
+                f.write(text + "\n")
+            else:
+                f.write(("  " if count == 0 else ",\n  ") + text)
+            count += 1
+        if not ndjson:
+            f.write("\n]\n")
+    return count
+
+
+def write_deduplicated(path: Path, drop: set[int], output: Path) -> tuple[int, int]:
+    """path から drop の番号の問題を除き、入力と同じ形式で output に書き出す
+
+    (残した問題数, 除いた問題数) を返す。問題番号は iter_file と同じ1始まりの順番。
+    """
+    if is_book_file(path):
+        with open(path, "r", encoding="utf-8") as f:
+            book = json.load(f)
+        questions = book.get("questions", [])
+        book["questions"] = [q for n, q in enumerate(questions, start=1) if n not in drop]
+        atomic_write_text(output, json.dumps(book, ensure_ascii=False, indent=2))
+        return len(book["questions"]), len(questions) - len(book["questions"])
+
+    if path.suffix.lower() in iq.TSV_SUFFIXES:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f, delimiter="\t")
+            rows = list(reader)
+            fieldnames = reader.fieldnames or []
+        kept = [row for n, row in enumerate(rows, start=1) if n not in drop]
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter="\t", extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(kept)
+        return len(kept), len(rows) - len(kept)
+
+    # インポート用の JSON / NDJSON は読んだ問題をそのまま書き戻す
+    questions = list(iter_file(path))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    count = write_questions((q for n, q in enumerate(questions, start=1) if n not in drop), output)
+    return count, len(questions) - count
+
+
+def write_outputs(paths: list[Path], dropped: dict[str, set[int]], output_dir: Path) -> bool:
+    """読めた入力ごとに重複を除いたファイルを output_dir に書き出す（入力は上書きしない）"""
+    names = [p.name for p in paths]
+    clashes = sorted({name for name in names if names.count(name) > 1})
+    if clashes:
+        print(f"エラー: 同じ名前の入力があるため書き出せません: {', '.join(clashes)}")
+        return False
+    if any(p.resolve().parent == output_dir.resolve() for p in paths):
+        print("エラー: --output-dir は入力と別のディレクトリを指定してください")
+        return False
+
+    print(f"\n重複を除いて書き出します: {output_dir}")
+    for path in paths:
+        kept, removed = write_deduplicated(path, dropped.get(str(path), set()),
+                                           output_dir / path.name)
+        print(f"  {path.name}: {kept}問（除いた問題 {removed}）")
+    return True
+
+
+def print_clusters(clusters: list[Cluster], show: int):
+    for n, cluster in enumerate(clusters[:show], start=1):
+        print(f"\n[{n}] {len(cluster.entries)}問")
+        for entry in cluster.entries:
+            mark = "残す" if entry is cluster.keep else "重複"
+            text = entry.question.get("question_text", "")
+            print(f"  {mark} {entry.label}  {text}  → {entry.answer}")
+    if len(clusters) > show:
+        print(f"\n... 他{len(clusters) - show}件のまとまり")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ほぼ同じ問題の検出（MinHash / LSH）")
+    parser.add_argument("files", nargs="*",
+                        help="TSV / JSON / NDJSON / 参考書 JSON（グロブ可、省略時は data/ 以下の全ファイル）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"重複とみなす類似度 (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--show", type=int, default=10, help="表示するまとまりの数 (default: 10)")
+    parser.add_argument("--output-dir", type=Path,
+                        help="重複を除いた問題を入力ごとに同じ形式で書き出すディレクトリ")
+    parser.add_argument("--report", type=Path, help="まとまりの一覧を JSON で書き出す")
+
+    args = parser.parse_args()
+
+    if args.files:
+        paths = expand_paths(args.files)
+    else:
+        paths = [p for pattern in DEFAULT_PATTERNS for p in sorted(PROJECT_ROOT.glob(pattern))]
+    if not paths:
+        print("エラー: 対象のファイルがありません")
+        return
+
+    index = DedupIndex(args.threshold)
+    started = time.perf_counter()
+    loaded = []
+    for path in paths:
+        try:
+            index.add_all(iter_file(path), str(path))
+            loaded.append(path)
+        except (ValueError, KeyError) as e:
+            print(f"警告: {path} を読めませんでした: {e}")
+    clusters = index.clusters()
+    elapsed = time.perf_counter() - started
+
+    duplicates = sum(len(c.drop) for c in clusters)
+    print(f"ファイル: {len(paths)} / 問題: {len(index.entries)} "
+          f"(問題文のないもの {index.skipped}) / {elapsed:.2f}秒")
+    print(f"比較したペア: {index.compared} / 重複のまとまり: {len(clusters)} / 除ける問題: {duplicates}")
+    print_clusters(clusters, args.show)
+
+    if args.report:
+        report = [{"keep": c.keep.label,
+                   "duplicates": [e.label for e in c.drop],
+                   "question_text": c.keep.question.get("question_text", "")}
+                  for c in clusters]
+        args.report.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nまとまりの一覧: {args.report}")
+    if args.output_dir:
+        write_outputs(loaded, index.dropped(), args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+チャンク並列ディスパッチ用の部品
+
+generate_questions.py から利用する。
+- TokenBucket: 固定 sleep の代わりのレート制限
+- OrderedWriter: 完了順に関係なくチャンク番号順に書き出す
+- run_parallel: 上限付きワーカープールでジョブを実行
+- call_with_retry: 一時的なAPIエラーを指数バックオフで再試行
+"""
+
+import http.client
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Iterable, Optional
+
+
+class TokenBucket:
+    """トークンバケット方式のレートリミッター
+
+    rate: 1秒あたりに補充するトークン数（= 平均リクエスト数/秒）
+    capacity: バースト上限（一度に連続して取得できるトークン数）
+    rate が 0 以下の場合は制限なし。
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def acquire(self, tokens: float = 1.0):
+        """トークンを取得する（足りなければ補充されるまで待つ）"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class OrderedWriter:
+    """チャンクを番号順に書き出すライター
+
+    submit() はどの順番で呼ばれてもよい。1 から連番で揃った分だけ
+    write_fn(rows, append) に渡す。最初の書き込みは append=False。
+    全チャンク揃ったら on_complete(total_rows) を呼ぶ。
+    """
+
+    def __init__(self, total_chunks: int,
+                 write_fn: Callable[[list, bool], None],
+                 on_complete: Optional[Callable[[int], None]] = None):
+        self.total_chunks = total_chunks
+        self.write_fn = write_fn
+        self.on_complete = on_complete
+        self.next_index = 1
+        self.written_rows = 0
+        self._pending: dict[int, list] = {}
+        self._started = False
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.next_index > self.total_chunks
+
+    def submit(self, index: int, rows: list):
+        """チャンク index（1始まり）の結果を登録する。失敗チャンクは空リストで登録"""
+        with self._lock:
+            if index < self.next_index or index in self._pending:
+                raise ValueError(f"チャンク {index} は登録済みです")
+            self._pending[index] = rows
+            while self.next_index in self._pending:
+                chunk_rows = self._pending.pop(self.next_index)
+                if chunk_rows:
+                    self.write_fn(chunk_rows, self._started)
+                    self._started = True
+                    self.written_rows += len(chunk_rows)
+                self.next_index += 1
+            if self.done and self.on_complete:
+                self.on_complete(self.written_rows)
+
+
+def run_parallel(jobs: Iterable, worker: Callable, concurrency: int,
+                 on_result: Callable, on_error: Callable,
+                 max_pending: Optional[int] = None):
+    """jobs を最大 concurrency 並列で worker に渡す
+
+    結果は完了順に on_result(job, result)、例外は on_error(job, exc) に渡す。
+    コールバックは呼び出し元スレッドで実行される。
+    max_pending を指定すると投入済みで未完了のジョブをその数までに抑え、jobs は
+    必要になった分だけ取り出す（ジェネレーターを渡せばメモリ使用量が一定になる）。
+    中断時（KeyboardInterrupt 等）は未着手のジョブをキャンセルして例外を再送出する。
+    """
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    try:
+        if max_pending is None:
+            futures = {executor.submit(worker, job): job for job in jobs}
+            for future in as_completed(futures):
+                _deliver(future, futures.pop(future), on_result, on_error)
+        else:
+            futures = {}
+            job_iter = iter(jobs)
+            exhausted = False
+            while True:
+                while not exhausted and len(futures) < max(max_pending, 1):
+                    job = next(job_iter, _END)
+                    if job is _END:
+                        exhausted = True
+                    else:
+                        futures[executor.submit(worker, job)] = job
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _deliver(future, futures.pop(future), on_result, on_error)
+    except BaseException:
+        # Ctrl-C などで中断された場合は未着手のジョブを捨てて即座に戻る
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+_END = object()
+
+
+def _deliver(future, job, on_result: Callable, on_error: Callable):
+    try:
+        result = future.result()
+    except Exception as e:
+        on_error(job, e)
+    else:
+        on_result(job, result)
+
+
+# 再試行する HTTP ステータス（タイムアウト・レート制限・サーバー側の一時障害）
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient_error(e: BaseException) -> bool:
+    """再試行すれば成功する見込みのあるエラーか"""
+    if isinstance(e, (ConnectionError, TimeoutError, http.client.HTTPException)):
+        return True
+    for attr in ("code", "status_code", "status"):
+        value = getattr(e, attr, None)
+        if isinstance(value, int):
+            return value in TRANSIENT_STATUS
+    return False
+
+
+def call_with_retry(fn: Callable, retries: int = 3, base_delay: float = 1.0,
+                    max_delay: float = 30.0, sleep: Callable[[float], None] = time.sleep,
+                    on_retry: Optional[Callable[[int, BaseException, float], None]] = None):
+    """fn() を呼び、一時的なエラーなら指数バックオフ（ジッター付き）で最大 retries 回再試行する
+
+    一時的でないエラー（APIキー未設定、不正なリクエストなど）はそのまま送出する。
+    on_retry(attempt, exc, delay) は待機前に呼ばれる。
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_transient_error(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt)) * (0.5 + random.random() / 2)
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, e, delay)
+            sleep(delay)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+GAS Web App のローカルスタブサーバー（インポート用）
+
+import_questions.py の送信先として使い、スプレッドシートに書かずに
+バッチ分割・並列送信・再送時の重複防止を確認する。
+GAS 側と同じく batch_key が登録済みのバッチは追加せずに duplicate を返す。
+参考書の作成（create_book、tools/pipeline.py の送信先）も受け付ける。
+chunked 転送・Content-Encoding: gzip・gzip+base64 形式のボディも受け付ける。
+
+Usage:
+    python tools/gas_stub.py --port 8766
+    python tools/gas_stub.py --port 8766 --row-latency 0.01 --error-rate 0.1
+
+    # 別ターミナルで
+    python tools/import_questions.py data/new_questions.tsv --url http://127.0.0.1:8766/exec
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeQuestionSheet:
+    """インポート先シートの代わり（メモリ上に行を持つ）
+
+    row_latency は1行あたりの書き込み時間、error_rate は HTTP 500 を返す割合。
+    GAS と同様にインポートはロックで直列化する。
+    """
+
+    def __init__(self, row_latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.row_latency = row_latency
+        self.error_rate = error_rate
+        self.rows: list[dict] = []
+        self.batches: dict[str, dict] = {}
+        self.books: dict[str, list[dict]] = {}
+        self.requests = 0
+        self.duplicates = 0
+        self.received_bytes = 0
+        self._max_numbers: dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self, received: int) -> bool:
+        with self._lock:
+            self.requests += 1
+            self.received_bytes += received
+            return self._random.random() < self.error_rate
+
+    def import_questions(self, params: dict) -> dict:
+        questions = params.get("questions")
+        if not questions or not isinstance(questions, list):
+            return {"success": False, "error": "問題データが必要です"}
+
+        batch_id = params.get("batch_id") or "batch_stub"
+        batch_key = params.get("batch_key")
+        with self._lock:
+            if batch_key and batch_key in self.batches:
+                self.duplicates += 1
+                done = self.batches[batch_key]
+                return {
+                    "success": True,
+                    "duplicate": True,
+                    "batch_id": done["batch_id"],
+                    "imported_count": done["count"],
+                    "generated_ids": done["generated_ids"],
+                    "message": f"バッチ {batch_key} は取り込み済みです",
+                }
+
+            generated_ids = []
+            for q in questions:
+                genre_id = q.get("genre_id", "XX00")
+                number = self._max_numbers.get(genre_id, 0) + 1
+                self._max_numbers[genre_id] = number
+                question_id = f"{genre_id}_{number:03d}"
+                generated_ids.append(question_id)
+                self.rows.append(dict(q, question_id=question_id, import_batch_id=batch_id))
+            if self.row_latency:
+                time.sleep(self.row_latency * len(questions))
+            if batch_key:
+                self.batches[batch_key] = {
+                    "batch_id": batch_id,
+                    "count": len(questions),
+                    "generated_ids": generated_ids,
+                }
+
+        return {
+            "success": True,
+            "batch_id": batch_id,
+            "imported_count": len(questions),
+            "generated_ids": generated_ids,
+            "message": f"{len(questions)}問をインポートしました",
+        }
+
+
+    def create_book(self, params: dict) -> dict:
+        """GAS の createBook と同じく、同名のシートがあればエラーにする"""
+        subject, title = params.get("subject"), params.get("title")
+        questions = params.get("questions") or []
+        if subject not in ("jp", "math", "sci", "soc"):
+            return {"success": False, "error": "教科は jp, math, sci, soc のいずれかを指定してください"}
+        if not title or not str(title).strip():
+            return {"success": False, "error": "参考書名を指定してください"}
+
+        sheet_name = f"{subject}_{title}"
+        with self._lock:
+            if sheet_name in self.books:
+                return {"success": False, "error": f"シート「{sheet_name}」は既に存在します"}
+            self.books[sheet_name] = list(questions)
+            if self.row_latency:
+                time.sleep(self.row_latency * len(questions))
+        return {
+            "success": True,
+            "book_id": sheet_name,
+            "subject": subject,
+            "title": title,
+            "question_count": len(questions),
+            "message": f"参考書「{title}」を作成しました",
+        }
+
+
+def make_handler(sheet: FakeQuestionSheet):
+    class GasStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self._read_body()
+            if sheet.should_fail(len(body)):
+                self._respond(500, {"success": False, "error": "疑似エラー"})
+                return
+            try:
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                params = json.loads(body.decode("utf-8"))
+                if params.get("encoding") == "gzip+base64":
+                    # GAS の decodeCompressedParams と同じ展開
+                    inner = json.loads(gzip.decompress(base64.b64decode(params.pop("data"))))
+                    params = dict(params, **inner)
+            except (OSError, ValueError) as e:
+                self._respond(200, {"success": False, "error": str(e)})
+                return
+            if params.get("action") == "import_questions":
+                result = sheet.import_questions(params)
+            elif params.get("action") == "create_book":
+                result = sheet.create_book(params)
+            else:
+                result = {"success": False, "error": "Unknown action: " + str(params.get("action"))}
+            self._respond(200, result)
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            data = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(data)
+                data += self.rfile.read(size)
+                self.rfile.readline()
+
+        def _respond(self, status: int, result: dict):
+            data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return GasStubHandler
+
+
+def start_server(sheet: FakeQuestionSheet, host: str = "127.0.0.1",
+                 port: int = 0) -> ThreadingHTTPServer:
+    """バックグラウンドスレッドでスタブサーバーを起動する（port=0 で空きポート）"""
+    server = ThreadingHTTPServer((host, port), make_handler(sheet))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/exec"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GAS Web App のローカルスタブサーバー（インポート用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--row-latency", type=float, default=0.0,
+                        help="1行あたりの書き込み時間（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="HTTP 500 を返す割合（0〜1）")
+
+    args = parser.parse_args()
+
+    sheet = FakeQuestionSheet(args.row_latency, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(sheet))
+    print(f"GASスタブ起動: {server_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n終了します。登録 {len(sheet.rows)}行 / 参考書 {len(sheet.books)}冊 / "
+              f"重複バッチ {sheet.duplicates} / "
+              f"受信 {sheet.received_bytes}バイト")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Gemini API 共通クライアント層
+
+generate_questions.py / ask_gemini.py から共有する。
+- クライアントはプロセス内で1つだけ遅延生成し、コネクションプールを使い回す
+- トランスポートは差し替え可能（ローカルのスタブサーバーでAPIを代替できる）
+
+環境変数:
+    GEMINI_API_KEY: Gemini API キー
+    GEMINI_STUB_URL: 指定時は Gemini API の代わりにこのURLのスタブサーバーへ送る
+                     （例: http://127.0.0.1:8765）
+"""
+
+import codecs
+import http.client
+import json
+import os
+import threading
+from typing import Iterator, Optional, Protocol
+from urllib.parse import urlsplit
+
+
+# コネクションプールの上限（並列数より大きめにしておく）
+DEFAULT_POOL_SIZE = 16
+
+
+class TransportError(RuntimeError):
+    """HTTP エラー応答（code に HTTP ステータスを持つ）"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class Transport(Protocol):
+    """モデル呼び出しのトランスポート
+
+    config は GenerateContentConfig のキーワード引数と同じ形の dict。
+    """
+
+    def generate(self, model: str, contents: str, config: Optional[dict] = None) -> str:
+        ...
+
+    def generate_stream(self, model: str, contents: str,
+                        config: Optional[dict] = None) -> Iterator[str]:
+        """レスポンステキストを届いた断片ごとに返す"""
+        ...
+
+    def create_cache(self, model: str, system_instruction: str, contents: str,
+                     ttl_seconds: int) -> Optional[str]:
+        """コンテキストキャッシュを作成して名前を返す（非対応なら None）"""
+        ...
+
+    def delete_cache(self, name: str):
+        ...
+
+
+class GenAITransport:
+    """google-genai SDK を使うトランスポート（本番用）
+
+    genai.Client は最初の呼び出し時に1度だけ作成し、内部の httpx クライアントの
+    keep-alive コネクションを全スレッドで共有する。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, pool_size: int = DEFAULT_POOL_SIZE):
+        self._api_key = api_key
+        self._pool_size = pool_size
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        from google import genai
+        from google.genai import types
+
+        api_key = self._api_key or os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "環境変数 GEMINI_API_KEY が設定されていません。\n"
+                "設定方法: export GEMINI_API_KEY='your-api-key'"
+            )
+
+        try:
+            import httpx
+            limits = httpx.Limits(max_connections=self._pool_size,
+                                  max_keepalive_connections=self._pool_size)
+            http_options = types.HttpOptions(client_args={"limits": limits})
+            return genai.Client(api_key=api_key, http_options=http_options)
+        except (ImportError, TypeError, ValueError):
+            # client_args 非対応の古い SDK は既定のプールを使う
+            return genai.Client(api_key=api_key)
+
+    def generate(self, model: str, contents: str, config: Optional[dict] = None) -> str:
+        from google.genai import types
+
+        kwargs = {"model": model, "contents": contents}
+        if config:
+            kwargs["config"] = types.GenerateContentConfig(**config)
+        response = self.client.models.generate_content(**kwargs)
+        return response.text
+
+    def generate_stream(self, model: str, contents: str,
+                        config: Optional[dict] = None) -> Iterator[str]:
+        from google.genai import types
+
+        kwargs = {"model": model, "contents": contents}
+        if config:
+            kwargs["config"] = types.GenerateContentConfig(**config)
+        for chunk in self.client.models.generate_content_stream(**kwargs):
+            if chunk.text:
+                yield chunk.text
+
+    def create_cache(self, model: str, system_instruction: str, contents: str,
+                     ttl_seconds: int) -> Optional[str]:
+        from google.genai import types
+
+        cache = self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                contents=[contents],
+                ttl=f"{ttl_seconds}s",
+            )
+        )
+        return cache.name
+
+    def delete_cache(self, name: str):
+        self.client.caches.delete(name=name)
+
+
+class HttpTransport:
+    """ローカルのスタブサーバーに JSON で POST するトランスポート（ベンチマーク・テスト用）
+
+    POST {base_url}/generate
+        {"model": ..., "contents": ..., "config": {...}} → {"text": ...}
+    POST {base_url}/stream
+        同じリクエスト → レスポンステキストをそのまま chunked で返す
+
+    HTTP/1.1 の keep-alive 接続をスレッドごとに保持して使い回す。
+    """
+
+    def __init__(self, base_url: str, timeout: float = 300):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _post(self, endpoint: str, model: str, contents: str,
+              config: Optional[dict]) -> http.client.HTTPResponse:
+        body = json.dumps({"model": model, "contents": contents, "config": config or {}},
+                          ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", self.base_path + endpoint, body=body, headers=headers)
+                response = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # サーバー側で切られた keep-alive 接続は1度だけ張り直す
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+        if response.status != 200:
+            data = response.read()
+            raise TransportError(response.status, f"スタブサーバーエラー: {data[:200]!r}")
+        return response
+
+    def generate(self, model: str, contents: str, config: Optional[dict] = None) -> str:
+        response = self._post("/generate", model, contents, config)
+        return json.loads(response.read().decode("utf-8"))["text"]
+
+    def generate_stream(self, model: str, contents: str,
+                        config: Optional[dict] = None) -> Iterator[str]:
+        response = self._post("/stream", model, contents, config)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while True:
+            data = response.read1(8192)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def create_cache(self, model: str, system_instruction: str, contents: str,
+                     ttl_seconds: int) -> Optional[str]:
+        # スタブはコンテキストキャッシュに対応しない（呼び出し側は通常送信にフォールバック）
+        return None
+
+    def delete_cache(self, name: str):
+        pass
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """共有トランスポートを取得（初回呼び出し時に作成）"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                stub_url = os.environ.get("GEMINI_STUB_URL")
+                _transport = HttpTransport(stub_url) if stub_url else GenAITransport()
+    return _transport
+
+
+def set_transport(transport: Optional[Transport]):
+    """トランスポートを差し替える（None で既定に戻す）"""
+    global _transport
+    with _transport_lock:
+        _transport = transport
+
+
+def get_client():
+    """共有の genai.Client を取得（SDK を直接使いたい場合用）"""
+    transport = get_transport()
+    if not isinstance(transport, GenAITransport):
+        raise RuntimeError("genai.Client はスタブトランスポート使用中は取得できません")
+    return transport.client
+
+
+def generate(model: str, contents: str, config: Optional[dict] = None) -> str:
+    """共有トランスポートでモデルを呼び出してテキストを返す"""
+    return get_transport().generate(model, contents, config)
+
+
+def generate_stream(model: str, contents: str, config: Optional[dict] = None) -> Iterator[str]:
+    """共有トランスポートでモデルを呼び出し、テキストを届いた断片ごとに返す"""
+    return get_transport().generate_stream(model, contents, config)
+
+
+def create_cache(model: str, system_instruction: str, contents: str,
+                 ttl_seconds: int = 3600) -> Optional[str]:
+    """システムインストラクション + 固定コンテンツをコンテキストキャッシュに載せる
+
+    返した名前を generate の config["cached_content"] に渡すと、キャッシュ済みの
+    部分は再送されない。キャッシュ対象はモデルごとの最小トークン数以上が必要。
+    """
+    return get_transport().create_cache(model, system_instruction, contents, ttl_seconds)
+
+
+def delete_cache(name: str):
+    get_transport().delete_cache(name)
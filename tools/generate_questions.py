@@ -9,9 +9,16 @@ Usage:
     python tools/generate_questions.py KNOWLEDGE/jp/JP01.json --mode max
     python tools/generate_questions.py --all --subject jp
     python tools/generate_questions.py --all
+    python tools/generate_questions.py --all --concurrency 8 --rate 2
+    python tools/generate_questions.py --all --refresh   # キャッシュを使わず再生成
+    python tools/generate_questions.py --all --resume    # 中断したランを再開
+    python tools/generate_questions.py --all --token-budget 32768 --dry-run  # トークン予算で分割
+    python tools/generate_questions.py --all --prompt-format table --prefix-cache
+    python tools/generate_questions.py --all --shard 1/3   # 3台で分担する1台目
 
 環境変数:
     GEMINI_API_KEY: Gemini API キー
+    GEMINI_STUB_URL: ローカルのスタブサーバーで代替する場合のURL（tools/stub_server.py）
 """
 
 import os
@@ -19,10 +26,24 @@ import sys
 import json
 import csv
 import re
+import math
 import time
+import shutil
+import threading
 import argparse
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional
+
+import gemini_client
+import validation
+from dispatcher import OrderedWriter, TokenBucket, call_with_retry, run_parallel
+from question import TSV_FIELDS
+from response_cache import ResponseCache, make_cache_key
+from chunk_packer import estimate_chunk, estimate_tokens, pack_chunks
+from run_manifest import OK, FAILED, PENDING, RunManifest, default_manifest_path, part_path, parts_dir
 
 
 # プロジェクトルート
@@ -37,8 +58,23 @@ SYSTEM_INSTRUCTION_FILE = KNOWLEDGE_DIR / "SYSTEM＿INSTRUCTION.txt"
 # 出力ディレクトリ
 DEFAULT_OUTPUT_DIR = PROJECT_ROOT / "data" / "generated"
 
+# レスポンスキャッシュ
+DEFAULT_CACHE_DIR = DEFAULT_OUTPUT_DIR / ".cache"
+
 # モデル
 MODEL_ID = "models/gemini-3-flash-preview"
+TEMPERATURE = 0.7
+MAX_OUTPUT_TOKENS = 65536
+
+# チャンクあたりのアイテム数（--token-budget 未指定時）
+DEFAULT_CHUNK_SIZE = 20
+
+# 知識データのプロンプト形式（build_items_block 参照）
+PROMPT_FORMATS = ["json", "compact", "table"]
+DEFAULT_PROMPT_FORMAT = "compact"
+
+# 接頭辞キャッシュの有効期間（秒）
+PREFIX_CACHE_TTL = 3600
 
 # ジャンル名マッピング
 GENRE_NAMES = {
@@ -66,6 +102,8 @@ SUBJECT_MAP = {
     "JP": "jp", "MA": "math", "SC": "sci", "SO": "soc"
 }
 
+# 出力TSVの列は question.TSV_FIELDS（import_questions.py などと共通）
+
 
 def load_env():
     """プロジェクトルートの.envファイルを読み込む"""
@@ -119,8 +157,83 @@ def chunk_list(items: list, chunk_size: int) -> list[list]:
     return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
 
 
-def build_user_prompt(items: list[dict], mode: str, genre_id: str) -> str:
-    """ユーザープロンプトを構築"""
+def split_chunks(items: list[dict], mode: str, chunk_size: Optional[int],
+                 token_budget: Optional[int],
+                 prompt_format: str = DEFAULT_PROMPT_FORMAT) -> list[list[dict]]:
+    """アイテムをチャンクに分割
+
+    token_budget 指定時は出力トークンの見積もりで詰める（chunk_size は1チャンクの上限件数）。
+    未指定時は chunk_size 件ずつの固定分割。
+    """
+    if token_budget:
+        return pack_chunks(items, mode, token_budget, max_items=chunk_size,
+                           serializer=item_serializer(prompt_format))
+    return chunk_list(items, chunk_size or DEFAULT_CHUNK_SIZE)
+
+
+def describe_chunking(chunk_size: Optional[int], token_budget: Optional[int]) -> str:
+    if token_budget:
+        limit = f"、最大{chunk_size}件" if chunk_size else ""
+        return f"出力予算 {token_budget}トークン/チャンク{limit}"
+    return f"{chunk_size or DEFAULT_CHUNK_SIZE}件/チャンク"
+
+
+def print_dry_run_report(chunks: list[list[dict]], mode: str, genre_id: str,
+                         system_instruction: str = "",
+                         prompt_format: str = DEFAULT_PROMPT_FORMAT,
+                         prefix_cache: bool = False):
+    """ドライラン: チャンクごとの件数・プロンプト長・出力見積もりと、
+    整形済みJSONで毎回全文を送る場合と比べた送信量の削減を表示"""
+    max_output = 0
+    baseline_bytes = baseline_tokens = 0
+    sent_bytes = sent_tokens = 0
+    cached_bytes = cached_tokens = 0
+    prefix = system_instruction + build_prompt_prefix(mode, genre_id)
+    prefix_bytes, prefix_tokens = len(prefix.encode("utf-8")), estimate_tokens(prefix)
+
+    for i, chunk in enumerate(chunks, start=1):
+        user_prompt = build_user_prompt(chunk, mode, genre_id, prompt_format)
+        output_tokens = estimate_chunk(chunk, mode, item_serializer(prompt_format)).output_tokens
+
+        baseline = system_instruction + build_user_prompt(chunk, mode, genre_id, "json")
+        baseline_bytes += len(baseline.encode("utf-8"))
+        baseline_tokens += estimate_tokens(baseline)
+        sent_bytes += len(user_prompt.encode("utf-8")) + len(system_instruction.encode("utf-8"))
+        sent_tokens += estimate_tokens(user_prompt) + estimate_tokens(system_instruction)
+        block = build_items_block(chunk, prompt_format)
+        cached_bytes += len(block.encode("utf-8"))
+        cached_tokens += estimate_tokens(block)
+
+        max_output = max(max_output, output_tokens)
+        print(f"  チャンク {i}/{len(chunks)}: [ドライラン] {len(chunk)}件 / "
+              f"プロンプト長: {len(user_prompt)}文字 (約{estimate_tokens(user_prompt)}トークン) / "
+              f"出力見積もり: 約{output_tokens}トークン")
+
+    if chunks:
+        average = sum(len(c) for c in chunks) / len(chunks)
+        print(f"  予測: {len(chunks)}チャンク / 平均 {average:.1f}件/チャンク / "
+              f"最大出力見積もり 約{max_output}トークン")
+    if max_output > MAX_OUTPUT_TOKENS:
+        print(f"  警告: 出力見積もりが max_output_tokens ({MAX_OUTPUT_TOKENS}) を超えるチャンクがあります")
+
+    if not chunks:
+        return
+    print(f"  送信量: json {baseline_bytes:,}B (約{baseline_tokens:,}トークン) → "
+          f"{prompt_format} {sent_bytes:,}B (約{sent_tokens:,}トークン) / "
+          f"削減 {baseline_bytes - sent_bytes:,}B (約{baseline_tokens - sent_tokens:,}トークン)")
+    if prefix_cache:
+        # キャッシュ作成時に固定部分を1回だけ送る
+        cached_bytes += prefix_bytes
+        cached_tokens += prefix_tokens
+        print(f"  接頭辞キャッシュ使用時: {cached_bytes:,}B (約{cached_tokens:,}トークン) / "
+              f"削減 {baseline_bytes - cached_bytes:,}B (約{baseline_tokens - cached_tokens:,}トークン)")
+
+
+def build_prompt_prefix(mode: str, genre_id: str) -> str:
+    """プロンプトの固定部分（指示・メタ情報・品質要件・出力形式）を構築
+
+    同じモード・ジャンルの全チャンクで同一になるため、接頭辞キャッシュの対象にできる。
+    """
     genre_name = GENRE_NAMES.get(genre_id, genre_id)
     subject = get_subject_from_genre_id(genre_id)
 
@@ -131,7 +244,7 @@ def build_user_prompt(items: list[dict], mode: str, genre_id: str) -> str:
         mode_instruction = """【標準プラン】で問題を生成してください。
 各知識データから1問ずつ、シンプルな問題を作成してください。"""
 
-    prompt = f"""以下の知識データから4択クイズを生成してください。
+    return f"""以下の知識データから4択クイズを生成してください。
 
 ## 指示
 {mode_instruction}
@@ -151,13 +264,73 @@ def build_user_prompt(items: list[dict], mode: str, genre_id: str) -> str:
 - 確認は不要です。直接TSVを出力してください。
 - ヘッダー行を含めてください。
 - コードブロック（```tsv ... ```）で囲んでください。
+"""
+
+
+def _table_cell(value) -> str:
+    """表形式の1セル（タブ・改行を含まない1行の文字列にする）"""
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return value.replace("\t", " ").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def table_columns(items: list[dict]) -> list[str]:
+    """表形式の列（全アイテムのキーを出現順に）"""
+    columns = []
+    for item in items:
+        for key in item:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def serialize_item(item: dict, prompt_format: str) -> str:
+    """知識データ1件をプロンプト形式でシリアライズ（トークン見積もり用）"""
+    if prompt_format == "json":
+        return json.dumps(item, ensure_ascii=False, indent=2)
+    if prompt_format == "table":
+        return "\t".join(_table_cell(v) for v in item.values())
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+
+
+def item_serializer(prompt_format: str) -> Callable[[dict], str]:
+    """チャンクの詰め込みとドライランの見積もりで共通のシリアライザー"""
+    return lambda item: serialize_item(item, prompt_format)
+
+
+def build_items_block(items: list[dict], prompt_format: str = "compact") -> str:
+    """プロンプトの知識データ部分を構築
+
+    prompt_format:
+        json: 整形済みJSON（indent=2）
+        compact: 空白なしの1行JSON
+        table: 1行目が列名のタブ区切り表（値が配列・オブジェクトの場合はJSON）
+    """
+    if prompt_format == "table":
+        columns = table_columns(items)
+        lines = ["\t".join(columns)]
+        lines.extend("\t".join(_table_cell(item.get(c, "")) for c in columns) for item in items)
+        body = "\n".join(lines)
+        fence = ""
+    elif prompt_format == "json":
+        body = json.dumps(items, ensure_ascii=False, indent=2)
+        fence = "json"
+    else:
+        body = json.dumps(items, ensure_ascii=False, separators=(",", ":"))
+        fence = "json"
 
+    return f"""
 ## 知識データ（{len(items)}件）
-```json
-{json.dumps(items, ensure_ascii=False, indent=2)}
+```{fence}
+{body}
 ```
 """
-    return prompt
+
+
+def build_user_prompt(items: list[dict], mode: str, genre_id: str,
+                      prompt_format: str = "compact") -> str:
+    """ユーザープロンプトを構築"""
+    return build_prompt_prefix(mode, genre_id) + build_items_block(items, prompt_format)
 
 
 def extract_tsv_from_response(response_text: str) -> str:
@@ -181,105 +354,258 @@ def extract_tsv_from_response(response_text: str) -> str:
 
 
 def validate_tsv_row(row: dict) -> tuple[bool, str]:
-    """TSV行をバリデーション"""
-    required = ["subject", "genre_id", "genre_name", "question_text",
-                "choices", "correct_index", "correct_answer"]
+    """TSV行を1行だけバリデーション（複数行は validation.validate_batch で検査する）"""
+    errors = validation.validate_row(0, row)
+    if errors:
+        return False, validation.join_messages(errors)
+    return True, ""
 
-    for field in required:
-        if field not in row or not row[field]:
-            return False, f"Missing field: {field}"
 
-    # choices のバリデーション
-    try:
-        choices = json.loads(row["choices"])
-        if not isinstance(choices, list):
-            return False, "choices must be array"
-        if len(choices) != 4:
-            return False, f"choices must have exactly 4 items, got {len(choices)}"
-        # 選択肢内の重複チェック
-        if len(set(choices)) != len(choices):
-            return False, f"choices has duplicates: {choices}"
-    except json.JSONDecodeError:
-        return False, "choices is not valid JSON"
-
-    # correct_index のバリデーション
-    try:
-        idx = int(row["correct_index"])
-        if idx < 0 or idx >= len(choices):
-            return False, f"correct_index {idx} out of range"
-    except ValueError:
-        return False, "correct_index is not a number"
+def parse_tsv_line(header: list[str], line: str) -> dict:
+    """TSVの1行をヘッダーに合わせて dict にする"""
+    fields = line.split('\t')
+    if len(fields) < len(header):
+        # 足りないフィールドを空文字で埋める
+        fields.extend([''] * (len(header) - len(fields)))
+    return dict(zip(header, fields))
 
-    return True, ""
 
+def report_tsv_errors(errors: list[str]):
+    """バリデーションエラーを表示"""
+    if errors:
+        print(f"  警告: {len(errors)}行でエラー")
+        for err in errors[:5]:  # 最初の5件だけ表示
+            print(f"    - {err}")
+        if len(errors) > 5:
+            print(f"    - ... 他{len(errors)-5}件")
 
-def parse_tsv(tsv_text: str) -> list[dict]:
-    """TSVテキストをパースしてバリデーション"""
+
+@dataclass
+class RejectedRow:
+    """バリデーションで不採用になった行"""
+    line_no: int
+    row: dict
+    error: str
+
+    def __str__(self) -> str:
+        return f"行{self.line_no}: {self.error}"
+
+
+def format_tsv_row(row: dict) -> str:
+    """行を TSV_FIELDS の順で1行のTSVにする（修正依頼・トークン見積もり用）"""
+    return '\t'.join(str(row.get(field, "")) for field in TSV_FIELDS)
+
+
+def parse_tsv_detailed(tsv_text: str) -> tuple[list[dict], list[RejectedRow]]:
+    """TSVテキストをパースし、有効な行と不採用の行に分ける"""
     lines = tsv_text.strip().split('\n')
     if not lines:
-        return []
+        return [], []
 
     # ヘッダー行を取得
     header = lines[0].split('\t')
 
-    questions = []
-    errors = []
-
+    rows = []
+    line_nos = []
     for i, line in enumerate(lines[1:], start=2):
         if not line.strip():
             continue
+        rows.append(parse_tsv_line(header, line))
+        line_nos.append(i)
 
-        fields = line.split('\t')
-        if len(fields) < len(header):
-            # 足りないフィールドを空文字で埋める
-            fields.extend([''] * (len(header) - len(fields)))
+    # 全行をまとめてバリデーション
+    questions, by_row = validation.split_valid(rows, validation.validate_batch(rows))
+    rejected = [RejectedRow(line_nos[i], rows[i], validation.join_messages(errors))
+                for i, errors in by_row.items()]
+    return questions, rejected
 
-        row = dict(zip(header, fields))
 
+def parse_tsv(tsv_text: str) -> list[dict]:
+    """TSVテキストをパースしてバリデーション"""
+    questions, rejected = parse_tsv_detailed(tsv_text)
+    report_tsv_errors([str(r) for r in rejected])
+    return questions
+
+
+class StreamingTSVParser:
+    """ストリーミングで届くレスポンスから TSV 行を逐次取り出すパーサー
+
+    feed() に任意の長さの断片を渡すと、行が完成するたびに validate_tsv_row を通し、
+    有効な行を on_row に渡す。抽出規則は extract_tsv_from_response と同じで、
+    コードブロック（```tsv / ```）があればその中だけを、なければタブを含む行を対象にする。
+    コードブロックなしの応答はブロックが来ないと確定できないため close() 時にまとめて処理する。
+    """
+
+    def __init__(self, on_row: Optional[Callable[[dict], None]] = None):
+        self.on_row = on_row
+        self.questions: list[dict] = []
+        self.rejected: list[RejectedRow] = []
+        self._buffer = ""
+        self._state = "before"  # before → fence → after
+        self._header: Optional[list[str]] = None
+        self._line_no = 0
+        self._loose_lines: list[str] = []
+
+    def feed(self, text: str):
+        """レスポンスの断片を追加する"""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self._handle_line(line)
+
+    def close(self) -> list[dict]:
+        """残りのバッファを処理して、有効な行の一覧を返す"""
+        if self._buffer:
+            self._handle_line(self._buffer)
+            self._buffer = ""
+        if self._state == "before":
+            # コードブロックがなかった場合はタブを含む行を TSV とみなす
+            for line in self._loose_lines:
+                self._handle_row(line)
+            self._loose_lines = []
+        self._state = "after"
+        return self.questions
+
+    def _handle_line(self, line: str):
+        if self._state == "after":
+            return
+        if self._state == "before":
+            if line.strip() in ("```", "```tsv"):
+                self._state = "fence"
+                self._loose_lines = []
+            elif '\t' in line:
+                self._loose_lines.append(line)
+            return
+
+        # コードブロック内
+        if "```" in line:
+            line = line[:line.index("```")]
+            self._state = "after"
+            if not line.strip():
+                return
+        self._handle_row(line)
+
+    def _handle_row(self, line: str):
+        if self._header is None:
+            if line.strip():
+                self._header = line.strip().split('\t')
+                self._line_no = 1
+            return
+
+        self._line_no += 1
+        if not line.strip():
+            return
+        row = parse_tsv_line(self._header, line)
         is_valid, error = validate_tsv_row(row)
         if is_valid:
-            questions.append(row)
+            self.questions.append(row)
+            if self.on_row:
+                self.on_row(row)
         else:
-            errors.append(f"行{i}: {error}")
+            self.rejected.append(RejectedRow(self._line_no, row, error))
 
-    if errors:
-        print(f"  警告: {len(errors)}行でエラー")
-        for err in errors[:5]:  # 最初の5件だけ表示
-            print(f"    - {err}")
-        if len(errors) > 5:
-            print(f"    - ... 他{len(errors)-5}件")
+    @property
+    def errors(self) -> list[str]:
+        return [str(r) for r in self.rejected]
 
-    return questions
 
+def build_repair_prompt(rejected: list[RejectedRow], mode: str, genre_id: str) -> str:
+    """不採用になった行だけを修正させるプロンプトを構築"""
+    errors = "\n".join(f"{i}. {r.error}" for i, r in enumerate(rejected, start=1))
+    rows = "\n".join(format_tsv_row(r.row) for r in rejected)
+    return build_prompt_prefix(mode, genre_id) + f"""
+## 修正依頼（{len(rejected)}件）
+以下のTSV行は品質要件を満たさず不採用になりました。
+各行のエラーを修正し、同じ内容の問題を修正済みのTSVとして出力してください（1行につき1問、ヘッダー行を含める）。
+
+### エラー内容
+{errors}
+
+### 不採用の行
+```tsv
+{chr(9).join(TSV_FIELDS)}
+{rows}
+```
+"""
 
-def call_gemini_api(system_instruction: str, user_prompt: str) -> str:
-    """Gemini APIを呼び出す"""
-    from google import genai
-    from google.genai import types
-
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("環境変数 GEMINI_API_KEY が設定されていません")
-
-    client = genai.Client(api_key=api_key)
-
-    response = client.models.generate_content(
-        model=MODEL_ID,
-        contents=user_prompt,
-        config=types.GenerateContentConfig(
-            system_instruction=system_instruction,
-            temperature=0.7,
-            max_output_tokens=65536,
-        )
-    )
 
-    return response.text
+def generation_config(system_instruction: Optional[str] = None,
+                      cache_name: Optional[str] = None) -> dict:
+    """生成設定（cache_name 指定時はシステムインストラクションをキャッシュから参照する）"""
+    config = {
+        "temperature": TEMPERATURE,
+        "max_output_tokens": MAX_OUTPUT_TOKENS,
+    }
+    if cache_name:
+        config["cached_content"] = cache_name
+    else:
+        config["system_instruction"] = system_instruction
+    return config
 
 
-def write_tsv(questions: list[dict], output_file: Path, append: bool = False):
+def call_gemini_api(system_instruction: str, user_prompt: str) -> str:
+    """Gemini APIを呼び出す（共有クライアントを使用）"""
+    return gemini_client.generate(MODEL_ID, user_prompt, generation_config(system_instruction))
+
+
+def call_gemini_api_cached(cache_name: str, user_prompt: str) -> str:
+    """コンテキストキャッシュ（システムインストラクション + 固定部）を使って呼び出す"""
+    return gemini_client.generate(MODEL_ID, user_prompt, generation_config(cache_name=cache_name))
+
+
+def call_gemini_api_stream(system_instruction: str, user_prompt: str) -> Iterator[str]:
+    """Gemini APIをストリーミングで呼び出し、レスポンスを断片ごとに返す"""
+    return gemini_client.generate_stream(MODEL_ID, user_prompt,
+                                         generation_config(system_instruction))
+
+
+def call_gemini_api_stream_cached(cache_name: str, user_prompt: str) -> Iterator[str]:
+    """コンテキストキャッシュを使ってストリーミングで呼び出す"""
+    return gemini_client.generate_stream(MODEL_ID, user_prompt,
+                                         generation_config(cache_name=cache_name))
+
+
+class PromptPrefixCache:
+    """システムインストラクション + プロンプト固定部をモデル側のコンテキストキャッシュに載せる
+
+    (mode, genre_id) ごとに初回利用時に作成する。作成に失敗した場合（最小トークン数未満、
+    スタブ使用中など）は None を記録し、そのジャンルは通常送信にフォールバックする。
+    """
+
+    def __init__(self, system_instruction: str, ttl_seconds: int = PREFIX_CACHE_TTL):
+        self.system_instruction = system_instruction
+        self.ttl_seconds = ttl_seconds
+        self._names: dict[tuple[str, str], Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, mode: str, genre_id: str) -> Optional[str]:
+        key = (mode, genre_id)
+        with self._lock:
+            if key not in self._names:
+                try:
+                    self._names[key] = gemini_client.create_cache(
+                        MODEL_ID, self.system_instruction,
+                        build_prompt_prefix(mode, genre_id), self.ttl_seconds)
+                except Exception as e:
+                    print(f"  接頭辞キャッシュを作成できません（通常送信にします）: {e}")
+                    self._names[key] = None
+            return self._names[key]
+
+    def close(self):
+        """作成したキャッシュを削除する"""
+        with self._lock:
+            for name in self._names.values():
+                if name:
+                    try:
+                        gemini_client.delete_cache(name)
+                    except Exception:
+                        pass
+            self._names.clear()
+
+
+def write_tsv(questions: Iterable, output_file: Path, append: bool = False):
     """TSVファイルに書き込む"""
-    fieldnames = ["subject", "genre_id", "genre_name", "question_text",
-                  "choices", "correct_index", "correct_answer", "hint", "difficulty"]
+    fieldnames = TSV_FIELDS
 
     mode = 'a' if append else 'w'
     write_header = not append or not output_file.exists() or output_file.stat().st_size == 0
@@ -291,68 +617,539 @@ def write_tsv(questions: list[dict], output_file: Path, append: bool = False):
         writer.writerows(questions)
 
 
-def process_file(
-    file_path: Path,
-    system_instruction: str,
-    mode: str,
-    output_dir: Path,
-    chunk_size: int,
-    dry_run: bool
-) -> int:
-    """1つのJSONファイルを処理"""
-    genre_id = get_genre_id_from_filename(file_path)
-    print(f"\n処理中: {file_path.name} ({genre_id})")
+def write_tsv_atomic(questions: list[dict], output_file: Path):
+    """TSVファイルを一時ファイル経由で書き込む（途中で落ちても壊れたファイルを残さない）"""
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = temp_path(output_file)
+    write_tsv(questions, tmp_file)
+    os.replace(tmp_file, output_file)
 
-    # JSON読み込み
-    items = load_json_file(file_path)
-    print(f"  データ数: {len(items)}件")
 
-    # 出力ファイル
-    output_file = output_dir / f"{genre_id}.tsv"
+def read_tsv(file_path: Path) -> list[dict]:
+    """write_tsv で書いたTSVファイルを読み込む"""
+    with open(file_path, "r", encoding="utf-8", newline='') as f:
+        return list(csv.DictReader(f, delimiter='\t'))
 
-    # チャンク分割
-    chunks = chunk_list(items, chunk_size)
-    print(f"  チャンク数: {len(chunks)} ({chunk_size}件/チャンク)")
 
-    total_questions = 0
+def temp_path(output_file: Path) -> Path:
+    """書き込み途中のファイル名（完了後に rename する）"""
+    return output_file.with_name(f".{output_file.name}.tmp")
 
-    for i, chunk in enumerate(chunks, start=1):
-        print(f"  チャンク {i}/{len(chunks)} 処理中...")
 
-        # プロンプト構築
-        user_prompt = build_user_prompt(chunk, mode, genre_id)
+# (system_instruction, user_prompt) -> レスポンステキスト
+ModelFn = Callable[[str, str], str]
 
-        if dry_run:
-            print(f"    [ドライラン] プロンプト長: {len(user_prompt)}文字")
-            continue
+# (system_instruction, user_prompt) -> レスポンステキストの断片（ストリーミング）
+StreamModelFn = Callable[[str, str], Iterable[str]]
 
-        # API呼び出し
-        try:
-            response_text = call_gemini_api(system_instruction, user_prompt)
-        except Exception as e:
-            print(f"    エラー: {e}")
-            continue
 
-        # TSV抽出
-        tsv_text = extract_tsv_from_response(response_text)
+@dataclass
+class ChunkJob:
+    """1チャンク分のAPI呼び出し単位"""
+    genre_id: str
+    index: int  # 1始まり
+    total: int
+    items: list[dict]
+
+    @property
+    def label(self) -> str:
+        return f"{self.genre_id} {self.index}/{self.total}"
+
+
+@dataclass
+class ChunkResult:
+    """1チャンクの処理結果"""
+    questions: list[dict]
+    latency: float = 0.0     # API呼び出しの所要時間（秒）、キャッシュヒット時は0
+    bytes: int = 0           # レスポンスのバイト数
+    from_cache: bool = False
+    accepted: int = 0        # 1回目の生成でそのまま採用した問題数
+    repaired: int = 0        # 修正依頼で採用できた問題数
+    dropped: int = 0         # 修正できず破棄した問題数
+    tokens: int = 0          # 1回目の生成で消費したトークン（見積もり、キャッシュヒット時は0）
+    repair_tokens: int = 0   # 修正依頼で消費したトークン（見積もり）
+    dropped_tokens: int = 0  # 破棄した行の出力に使われたトークン（見積もり）
+
+
+class YieldStats:
+    """ラン全体の歩留まり（採用・修正・破棄の問題数とトークン）"""
+
+    def __init__(self):
+        self.accepted = self.repaired = self.dropped = 0
+        self.tokens = self.repair_tokens = self.dropped_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, result: ChunkResult):
+        with self._lock:
+            self.accepted += result.accepted
+            self.repaired += result.repaired
+            self.dropped += result.dropped
+            self.tokens += result.tokens
+            self.repair_tokens += result.repair_tokens
+            self.dropped_tokens += result.dropped_tokens
+
+    def summary(self) -> str:
+        return (f"採用 {self.accepted}問 (生成 約{self.tokens:,}トークン) / "
+                f"修正 {self.repaired}問 (修正依頼 約{self.repair_tokens:,}トークン) / "
+                f"破棄 {self.dropped}問 (約{self.dropped_tokens:,}トークン)")
+
+
+class StageTimes:
+    """処理段階ごとの所要時間（ベンチマーク用、tools/bench_generate.py 参照）
+
+    prompt=プロンプト組み立て, rate_wait=レート制限の待ち, network=API呼び出し,
+    extract=TSV抽出, validate=行の検証, cache=レスポンスキャッシュ読み書き, write=TSV書き出し。
+    chunk はチャンク1件の処理全体（レイテンシの分布用で、段階別の内訳には含めない）。
+    """
+
+    STAGES = ["prompt", "rate_wait", "network", "extract", "validate", "cache", "write"]
 
-        # パース・バリデーション
-        questions = parse_tsv(tsv_text)
-        print(f"    生成数: {len(questions)}問")
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
 
-        # 書き込み
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def total(self, stage: str) -> float:
+        return sum(self.samples.get(stage, []))
+
+    def percentile(self, stage: str, p: float) -> float:
+        """stage の p パーセンタイル（最近傍法、サンプルがなければ0）"""
+        values = sorted(self.samples.get(stage, []))
+        if not values:
+            return 0.0
+        rank = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+        return values[rank]
+
+
+def measure(timer: Optional[StageTimes], stage: str):
+    """timer があれば stage の時間を計測するコンテキストマネージャを返す"""
+    return timer.measure(stage) if timer else nullcontext()
+
+
+def process_chunk(job: ChunkJob, system_instruction: str, mode: str,
+                  model_fn: ModelFn, limiter: Optional[TokenBucket] = None,
+                  cache: Optional[ResponseCache] = None,
+                  prompt_format: str = DEFAULT_PROMPT_FORMAT,
+                  prefix_cache: Optional[PromptPrefixCache] = None,
+                  stream_fn: Optional[StreamModelFn] = None,
+                  retries: int = 0, repair_rounds: int = 0,
+                  timer: Optional[StageTimes] = None) -> ChunkResult:
+    """1チャンクを生成してバリデーション済みの問題リストを返す
+
+    キャッシュにヒットすれば API を呼ばない。有効な問題が1問以上取れた
+    レスポンスだけをキャッシュする（失敗チャンクは次回再送される）。
+    prefix_cache があれば固定部分はコンテキストキャッシュを参照し、知識データ部分だけ送る。
+    stream_fn があればストリーミングで受信し、届いた行から順にバリデーションする。
+    一時的なAPIエラーは retries 回まで指数バックオフで再試行し、不採用の行は
+    repair_rounds 回まで1回の修正依頼にまとめて再生成させる。
+    timer を渡すと段階ごとの所要時間を記録する。
+    """
+    def on_retry(attempt: int, e: BaseException, delay: float):
+        print(f"  [{job.label}] 一時エラー、{delay:.1f}秒後に再試行 ({attempt}/{retries}): {e}")
+
+    def generate():
+        if stream_fn:
+            return generate_chunk_stream(job, system_instruction, mode, stream_fn, limiter,
+                                         cache, prompt_format, prefix_cache, timer)
+        return generate_chunk(job, system_instruction, mode, model_fn, limiter,
+                              cache, prompt_format, prefix_cache, timer)
+
+    result, rejected = call_with_retry(generate, retries, on_retry=on_retry)
+    result.accepted = len(result.questions)
+
+    if rejected and repair_rounds > 0:
+        repaired, rejected, result.repair_tokens = repair_rows(
+            job, system_instruction, mode, model_fn, limiter, cache, rejected,
+            retries, repair_rounds, on_retry, timer)
+        result.questions.extend(repaired)
+        result.repaired = len(repaired)
+
+    result.dropped = len(rejected)
+    result.dropped_tokens = sum(estimate_tokens(format_tsv_row(r.row)) for r in rejected)
+    return result
+
+
+def generate_chunk(job: ChunkJob, system_instruction: str, mode: str,
+                   model_fn: ModelFn, limiter: Optional[TokenBucket] = None,
+                   cache: Optional[ResponseCache] = None,
+                   prompt_format: str = DEFAULT_PROMPT_FORMAT,
+                   prefix_cache: Optional[PromptPrefixCache] = None,
+                   timer: Optional[StageTimes] = None
+                   ) -> tuple[ChunkResult, list[RejectedRow]]:
+    """1回目の生成（非ストリーミング）。結果と不採用の行を返す"""
+    key = None
+    response_text = None
+    if cache:
+        key = make_cache_key(system_instruction, MODEL_ID, mode, job.genre_id,
+                             job.items, TEMPERATURE, prompt_format)
+        with measure(timer, "cache"):
+            response_text = cache.get(key)
+
+    from_cache = response_text is not None
+    latency = 0.0
+    tokens = 0
+    if not from_cache:
+        cache_name = prefix_cache.get(mode, job.genre_id) if prefix_cache else None
+        with measure(timer, "prompt"):
+            if cache_name:
+                user_prompt = build_items_block(job.items, prompt_format)
+            else:
+                user_prompt = build_user_prompt(job.items, mode, job.genre_id, prompt_format)
+                tokens += estimate_tokens(system_instruction)
+        if limiter:
+            with measure(timer, "rate_wait"):
+                limiter.acquire()
+        started = time.monotonic()
+        with measure(timer, "network"):
+            if cache_name:
+                response_text = call_gemini_api_cached(cache_name, user_prompt)
+            else:
+                response_text = model_fn(system_instruction, user_prompt)
+        latency = time.monotonic() - started
+        tokens += estimate_tokens(user_prompt) + estimate_tokens(response_text)
+
+    with measure(timer, "extract"):
+        tsv_text = extract_tsv_from_response(response_text)
+    with measure(timer, "validate"):
+        questions, rejected = parse_tsv_detailed(tsv_text)
+    report_tsv_errors([str(r) for r in rejected])
+
+    if cache and not from_cache and questions:
+        with measure(timer, "cache"):
+            cache.put(key, response_text)
+    result = ChunkResult(questions, latency, len(response_text.encode("utf-8")), from_cache,
+                         tokens=tokens)
+    return result, rejected
+
+
+# ストリーミング受信中に進捗を表示する間隔（問）
+STREAM_PROGRESS_INTERVAL = 50
+
+
+def generate_chunk_stream(job: ChunkJob, system_instruction: str, mode: str,
+                          stream_fn: StreamModelFn, limiter: Optional[TokenBucket] = None,
+                          cache: Optional[ResponseCache] = None,
+                          prompt_format: str = DEFAULT_PROMPT_FORMAT,
+                          prefix_cache: Optional[PromptPrefixCache] = None,
+                          timer: Optional[StageTimes] = None
+                          ) -> tuple[ChunkResult, list[RejectedRow]]:
+    """generate_chunk のストリーミング版
+
+    レスポンス全文をメモリに持たず、断片を StreamingTSVParser とキャッシュファイルに
+    直接流す。キャッシュヒット時は保存済みレスポンスを同じパーサーで処理する。
+    受信中のパース（抽出と検証）は validate、それ以外の待ち時間は network として記録する。
+    """
+    def on_row(row: dict):
+        if len(parser.questions) % STREAM_PROGRESS_INTERVAL == 0:
+            print(f"  [{job.label}] 受信中: {len(parser.questions)}問")
+
+    parser = StreamingTSVParser(on_row)
+
+    key = None
+    if cache:
+        key = make_cache_key(system_instruction, MODEL_ID, mode, job.genre_id,
+                             job.items, TEMPERATURE, prompt_format)
+        with measure(timer, "cache"):
+            cached_text = cache.get(key)
+        if cached_text is not None:
+            with measure(timer, "validate"):
+                parser.feed(cached_text)
+                questions = parser.close()
+            report_tsv_errors(parser.errors)
+            result = ChunkResult(questions, 0.0, len(cached_text.encode("utf-8")), True)
+            return result, parser.rejected
+
+    cache_name = prefix_cache.get(mode, job.genre_id) if prefix_cache else None
+    with measure(timer, "prompt"):
+        if cache_name:
+            user_prompt = build_items_block(job.items, prompt_format)
+            tokens = estimate_tokens(user_prompt)
+        else:
+            user_prompt = build_user_prompt(job.items, mode, job.genre_id, prompt_format)
+            tokens = estimate_tokens(system_instruction) + estimate_tokens(user_prompt)
+
+    if limiter:
+        with measure(timer, "rate_wait"):
+            limiter.acquire()
+    entry = cache.open_entry(key) if cache else None
+    received = 0
+    parse_time = 0.0
+    started = time.monotonic()
+    try:
+        if cache_name:
+            fragments = call_gemini_api_stream_cached(cache_name, user_prompt)
+        else:
+            fragments = stream_fn(system_instruction, user_prompt)
+        for fragment in fragments:
+            received += len(fragment.encode("utf-8"))
+            tokens += estimate_tokens(fragment)
+            parse_started = time.perf_counter()
+            parser.feed(fragment)
+            parse_time += time.perf_counter() - parse_started
+            if entry:
+                entry.write(fragment)
+        questions = parser.close()
+    except BaseException:
+        if entry:
+            entry.discard()
+        raise
+    latency = time.monotonic() - started
+    if timer:
+        timer.add("network", latency - parse_time)
+        timer.add("validate", parse_time)
+
+    if entry:
         if questions:
-            write_tsv(questions, output_file, append=(i > 1))
-            total_questions += len(questions)
+            entry.commit()
+        else:
+            entry.discard()
+    report_tsv_errors(parser.errors)
+    return ChunkResult(questions, latency, received, tokens=tokens), parser.rejected
+
+
+def repair_rows(job: ChunkJob, system_instruction: str, mode: str, model_fn: ModelFn,
+                limiter: Optional[TokenBucket], cache: Optional[ResponseCache],
+                rejected: list[RejectedRow], retries: int, rounds: int,
+                on_retry: Optional[Callable] = None,
+                timer: Optional[StageTimes] = None
+                ) -> tuple[list[dict], list[RejectedRow], int]:
+    """不採用の行をまとめて修正依頼し、(修正できた行, 残った不採用行, 消費トークン) を返す
+
+    修正依頼のレスポンスも通常の生成と同じキャッシュに保存する。
+    修正依頼自体が失敗した場合は、残りの行を不採用のまま返す。
+    """
+    repaired: list[dict] = []
+    tokens = 0
+
+    for round_no in range(1, rounds + 1):
+        if not rejected:
+            break
+        prompt = build_repair_prompt(rejected, mode, job.genre_id)
+
+        key = None
+        response_text = None
+        if cache:
+            key = make_cache_key(system_instruction, MODEL_ID, f"{mode}:repair", job.genre_id,
+                                 [format_tsv_row(r.row) for r in rejected], TEMPERATURE)
+            response_text = cache.get(key)
+
+        from_cache = response_text is not None
+        if not from_cache:
+            try:
+                if limiter:
+                    with measure(timer, "rate_wait"):
+                        limiter.acquire()
+                with measure(timer, "network"):
+                    response_text = call_with_retry(
+                        lambda: model_fn(system_instruction, prompt), retries, on_retry=on_retry)
+            except Exception as e:
+                print(f"  [{job.label}] 修正依頼エラー: {e}")
+                break
+            tokens += (estimate_tokens(system_instruction) + estimate_tokens(prompt)
+                       + estimate_tokens(response_text))
+
+        with measure(timer, "extract"):
+            tsv_text = extract_tsv_from_response(response_text)
+        with measure(timer, "validate"):
+            questions, still_rejected = parse_tsv_detailed(tsv_text)
+        # 依頼した件数を超えて返ってきた行は採用しない
+        questions = questions[:len(rejected)]
+        if cache and not from_cache and questions:
+            cache.put(key, response_text)
+
+        print(f"  [{job.label}] 修正依頼 {round_no}回目: {len(rejected)}問中 {len(questions)}問を修正")
+        repaired.extend(questions)
+        # 修正結果は依頼順に1行ずつ返る前提で対応付け、返ってこなかった行は元の行のまま残す
+        returned = len(questions) + len(still_rejected)
+        remaining = len(rejected) - len(questions)
+        rejected = (still_rejected + rejected[returned:])[:remaining]
+
+    return repaired, rejected, tokens
+
+
+def process_files(
+    files: list[Path],
+    system_instruction: str,
+    mode: str,
+    output_dir: Path,
+    chunk_size: Optional[int],
+    dry_run: bool,
+    concurrency: int = 1,
+    rate: float = 1.0,
+    model_fn: Optional[ModelFn] = None,
+    cache: Optional[ResponseCache] = None,
+    manifest: Optional[RunManifest] = None,
+    token_budget: Optional[int] = None,
+    prompt_format: str = DEFAULT_PROMPT_FORMAT,
+    prefix_cache: Optional[PromptPrefixCache] = None,
+    stream: bool = False,
+    stream_fn: Optional[StreamModelFn] = None,
+    retries: int = 0,
+    repair_rounds: int = 0,
+    stats: Optional[YieldStats] = None,
+    file_times: Optional[dict[Path, float]] = None,
+    timer: Optional[StageTimes] = None
+) -> dict[Path, int]:
+    """複数ファイルのチャンクを共通のワーカープールで処理
+
+    全ファイルのチャンクを concurrency 並列で投げ、レートは rate（回/秒）で制限する。
+    出力は OrderedWriter でチャンク番号順に一時ファイルへ書き、全チャンク揃ったら
+    rename する。cache を渡すとレスポンスキャッシュにヒットしたチャンクは API を呼ばない。
+    manifest を渡すとチャンクごとの状態と中間TSVを記録し、ok 済みのチャンクは再送しない。
+    token_budget を渡すと出力トークンの見積もりでチャンクを詰める（split_chunks 参照）。
+    prompt_format は知識データの埋め込み形式、prefix_cache は固定部分のコンテキストキャッシュ。
+    stream=True（または stream_fn 指定）でレスポンスをストリーミング受信する。
+    retries / repair_rounds は一時エラーの再試行回数と不採用行の修正依頼回数、
+    stats を渡すと採用・修正・破棄の集計を加算する。
+    ジョブは残りチャンク数の多いファイルから投入し、全体の末尾が長引かないようにする。
+    file_times を渡すとファイルごとの所要時間（最初のチャンク開始〜書き出し完了）を記録する。
+    timer を渡すと段階ごとの所要時間とチャンクごとのレイテンシを記録する（StageTimes 参照）。
+    """
+    model_fn = model_fn or call_gemini_api
+    if stream and stream_fn is None:
+        stream_fn = call_gemini_api_stream
+    results: dict[Path, int] = {}
+    writers: dict[str, OrderedWriter] = {}
+    jobs: list[ChunkJob] = []
+    done_chunks: list[tuple[str, int, list[dict]]] = []
+    started: dict[str, float] = {}
+
+    for file_path in files:
+        genre_id = get_genre_id_from_filename(file_path)
+        print(f"\n処理中: {file_path.name} ({genre_id})")
+
+        items = load_json_file(file_path)
+        print(f"  データ数: {len(items)}件")
 
-        # レート制限対策
-        if i < len(chunks):
-            time.sleep(1)
+        output_file = output_dir / f"{genre_id}.tsv"
+        chunks = split_chunks(items, mode, chunk_size, token_budget, prompt_format)
+        print(f"  チャンク数: {len(chunks)} ({describe_chunking(chunk_size, token_budget)})")
+        results[file_path] = 0
 
-    if not dry_run:
-        print(f"  完了: {total_questions}問 → {output_file}")
+        if dry_run:
+            print_dry_run_report(chunks, mode, genre_id, system_instruction,
+                                 prompt_format, prefix_cache is not None)
+            continue
 
-    return total_questions
+        if manifest:
+            entry = manifest.register_file(genre_id, file_path, output_file, len(chunks))
+            # 問題が0問で完了したファイルは出力がない
+            if entry["status"] == OK and (output_file.exists() or not entry["questions"]):
+                results[file_path] = entry["questions"]
+                print(f"  スキップ（完了済み）: {entry['questions']}問 → {output_file}")
+                continue
+
+        def write(rows, append, output_file=output_file):
+            with measure(timer, "write"):
+                write_tsv(rows, temp_path(output_file), append=append)
+
+        def complete(count, file_path=file_path, genre_id=genre_id, output_file=output_file):
+            if count:
+                os.replace(temp_path(output_file), output_file)
+            results[file_path] = count
+            if file_times is not None:
+                now = time.monotonic()
+                file_times[file_path] = now - started.get(genre_id, now)
+            status = manifest.finish_file(genre_id, count) if manifest else OK
+            if status == OK:
+                print(f"  完了: {count}問 → {output_file}")
+                if manifest:
+                    shutil.rmtree(parts_dir(output_dir, genre_id), ignore_errors=True)
+            else:
+                print(f"  完了（失敗チャンクあり、--resume で再実行可）: {count}問 → {output_file}")
+
+        writers[genre_id] = OrderedWriter(len(chunks), write, complete)
+        if not chunks:
+            # チャンクが1つもなければ submit が呼ばれないので、ここで完了にする
+            complete(0)
+            continue
+
+        for i, chunk in enumerate(chunks, start=1):
+            if manifest and manifest.chunk(genre_id, i)["status"] == OK:
+                part = part_path(output_dir, genre_id, i)
+                if part.exists():
+                    done_chunks.append((genre_id, i, read_tsv(part)))
+                    continue
+            jobs.append(ChunkJob(genre_id, i, len(chunks), chunk))
+
+    if dry_run:
+        return results
+
+    # 前回までに完了したチャンクを先に流し込む
+    if done_chunks:
+        print(f"\n再開: 完了済み {len(done_chunks)}チャンクを再利用")
+    for genre_id, index, rows in done_chunks:
+        writers[genre_id].submit(index, rows)
+
+    if not jobs:
+        return results
+
+    # 大きいファイルから先に投入する（同じファイル内はチャンク番号順のまま）
+    remaining = Counter(job.genre_id for job in jobs)
+    jobs.sort(key=lambda job: -remaining[job.genre_id])
+
+    limiter = TokenBucket(rate, capacity=1)
+
+    def worker(job: ChunkJob) -> ChunkResult:
+        started.setdefault(job.genre_id, time.monotonic())
+        with measure(timer, "chunk"):
+            return process_chunk(job, system_instruction, mode, model_fn, limiter, cache,
+                                 prompt_format, prefix_cache, stream_fn, retries, repair_rounds,
+                                 timer)
+
+    def on_result(job: ChunkJob, result: ChunkResult):
+        questions = result.questions
+        if stats:
+            stats.add(result)
+        source = "キャッシュ" if result.from_cache else f"{result.latency:.1f}秒"
+        print(f"  [{job.label}] 生成数: {len(questions)}問 ({source})")
+        if manifest:
+            status = OK if questions else FAILED
+            if questions:
+                with measure(timer, "write"):
+                    write_tsv_atomic(questions, part_path(output_dir, job.genre_id, job.index))
+            manifest.update_chunk(job.genre_id, job.index, status,
+                                  questions=len(questions),
+                                  latency=round(result.latency, 3),
+                                  bytes=result.bytes)
+        writers[job.genre_id].submit(job.index, questions)
+
+    def on_error(job: ChunkJob, e: Exception):
+        print(f"  [{job.label}] エラー: {e}")
+        if manifest:
+            manifest.update_chunk(job.genre_id, job.index, FAILED, error=str(e))
+        writers[job.genre_id].submit(job.index, [])
+
+    print(f"\n並列数: {concurrency} / レート: {rate}回/秒 / 総チャンク数: {len(jobs)}")
+    run_parallel(jobs, worker, concurrency, on_result, on_error)
+
+    return results
+
+
+def process_file(
+    file_path: Path,
+    system_instruction: str,
+    mode: str,
+    output_dir: Path,
+    chunk_size: Optional[int],
+    dry_run: bool,
+    **options
+) -> int:
+    """1つのJSONファイルを処理（options は process_files と同じ）"""
+    results = process_files([file_path], system_instruction, mode, output_dir,
+                            chunk_size, dry_run, **options)
+    return results[file_path]
 
 
 def get_all_json_files(subject: Optional[str] = None) -> list[Path]:
@@ -380,6 +1177,63 @@ def get_all_json_files(subject: Optional[str] = None) -> list[Path]:
     return files
 
 
+def subject_of(file_path: Path) -> str:
+    """ファイルの教科（KNOWLEDGE/{教科}/ のディレクトリ名）"""
+    return file_path.parent.name
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """--shard の値 "i/N"（1始まり）を (i, N) にする"""
+    try:
+        index, count = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard は i/N の形式で指定してください: {value}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"--shard の i は 1〜N の範囲で指定してください: {value}")
+    return index, count
+
+
+def order_largest_first(files: list[Path]) -> list[Path]:
+    """ファイルサイズの大きい順に並べる（同サイズはパス順）"""
+    return sorted(files, key=lambda p: (-p.stat().st_size, str(p)))
+
+
+def shard_files(files: list[Path], index: int, count: int, by: str = "file") -> list[Path]:
+    """ファイル一覧を count 個のシャードに分け、index 番目（1始まり）を返す
+
+    by="file" はファイル単位、by="subject" は教科ディレクトリ単位で割り当てる。
+    単位をサイズの大きい順に、その時点で合計サイズが最小のシャードへ詰める（LPT）。
+    入力が同じならどのマシンで実行しても同じ割り当てになる。
+    """
+    groups: dict[str, list[Path]] = {}
+    for f in files:
+        key = subject_of(f) if by == "subject" else str(f)
+        groups.setdefault(key, []).append(f)
+
+    units = sorted(
+        ((sum(f.stat().st_size for f in group), key, group) for key, group in groups.items()),
+        key=lambda u: (-u[0], u[1])
+    )
+    loads = [0] * count
+    assigned: list[list[Path]] = [[] for _ in range(count)]
+    for size, _, group in units:
+        target = loads.index(min(loads))
+        loads[target] += size
+        assigned[target].extend(group)
+    return order_largest_first(assigned[index - 1])
+
+
+def print_timing_report(wall: float, file_times: dict[Path, float]):
+    """全体の実時間とファイル別所要時間の合計を並べて表示する"""
+    if not file_times:
+        return
+    total = sum(file_times.values())
+    ratio = total / wall if wall > 0 else 0
+    print(f"実行時間: 全体 {wall:.1f}秒 / ファイル別合計 {total:.1f}秒 (並列度 {ratio:.1f}倍)")
+    slowest = max(file_times, key=file_times.get)
+    print(f"  最長: {slowest.name} {file_times[slowest]:.1f}秒")
+
+
 def main():
     parser = argparse.ArgumentParser(description="KNOWLEDGEデータから問題を生成")
     parser.add_argument("file", type=Path, nargs="?", help="処理するJSONファイル")
@@ -390,10 +1244,49 @@ def main():
                         help="対象教科（--allと併用）")
     parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
                         help=f"出力ディレクトリ (default: {DEFAULT_OUTPUT_DIR})")
-    parser.add_argument("--chunk-size", type=int, default=20,
-                        help="1回のAPI呼び出しに含めるアイテム数 (default: 20)")
+    parser.add_argument("--chunk-size", type=int,
+                        help=f"1回のAPI呼び出しに含めるアイテム数 (default: {DEFAULT_CHUNK_SIZE}、"
+                             "--token-budget 併用時は上限件数)")
+    parser.add_argument("--token-budget", type=int,
+                        help="1チャンクの出力トークン見積もりの目標値。指定するとアイテムの長さに"
+                             "応じてチャンクを詰める（例: 32768）")
     parser.add_argument("--dry-run", action="store_true",
                         help="API呼び出しせずプロンプト確認")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="同時に投げるAPI呼び出し数 (default: 4)")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="API呼び出しの上限レート（回/秒、0で無制限） (default: 1.0)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="レスポンスキャッシュを使わない")
+    parser.add_argument("--refresh", action="store_true",
+                        help="キャッシュを読まずに再生成し、結果でキャッシュを更新")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f"キャッシュディレクトリ (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-max-mb", type=float, default=500,
+                        help="キャッシュの合計サイズ上限MB (default: 500)")
+    parser.add_argument("--cache-max-age-days", type=float, default=30,
+                        help="キャッシュの保持日数 (default: 30)")
+    parser.add_argument("--prompt-format", choices=PROMPT_FORMATS, default=DEFAULT_PROMPT_FORMAT,
+                        help="知識データの埋め込み形式: json=整形済み, compact=1行JSON, "
+                             f"table=タブ区切り表 (default: {DEFAULT_PROMPT_FORMAT})")
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="システムインストラクションとプロンプト固定部をコンテキストキャッシュに載せる")
+    parser.add_argument("--stream", action="store_true",
+                        help="レスポンスをストリーミング受信し、届いた行から順に検証する")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="一時的なAPIエラー（429/5xx等）の再試行回数 (default: 3)")
+    parser.add_argument("--repair-rounds", type=int, default=1,
+                        help="不採用行の修正依頼の最大回数、0で修正しない (default: 1)")
+    parser.add_argument("--resume", action="store_true",
+                        help="マニフェストを読み込み、中断したランを続きから再開")
+    parser.add_argument("--manifest", type=Path,
+                        help="ランマニフェストのパス (default: {出力先}/.manifest.json、"
+                             "--shard 指定時は .manifest.{i}of{N}.json)")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N",
+                        help="--all の対象を N 個に分けた i 番目だけ処理（複数マシンでの分担用）")
+    parser.add_argument("--shard-by", choices=["file", "subject"], default="file",
+                        help="シャードの割り当て単位: file=ジャンルファイル, subject=教科ディレクトリ "
+                             "(default: file)")
 
     args = parser.parse_args()
 
@@ -403,6 +1296,12 @@ def main():
     # 処理対象ファイル
     if args.all:
         files = get_all_json_files(args.subject)
+        if args.shard:
+            index, count = args.shard
+            files = shard_files(files, index, count, by=args.shard_by)
+            print(f"シャード: {index}/{count} ({args.shard_by}単位)")
+        else:
+            files = order_largest_first(files)
     elif args.file:
         files = [args.file]
     else:
@@ -424,23 +1323,88 @@ def main():
     system_instruction = load_system_instruction()
     print(f"システムインストラクション: {len(system_instruction)}文字")
 
+    # レスポンスキャッシュ
+    cache = None
+    if not args.no_cache and not args.dry_run:
+        cache = ResponseCache(
+            args.cache_dir,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            max_age_days=args.cache_max_age_days,
+            refresh=args.refresh
+        )
+
+    # ランマニフェスト
+    manifest = None
+    if not args.dry_run:
+        manifest_path = args.manifest or default_manifest_path(args.output_dir)
+        if args.shard and not args.manifest:
+            # 出力先を共有する場合もシャード同士でマニフェストを上書きしないようにする
+            manifest_path = manifest_path.with_name(
+                f".manifest.{args.shard[0]}of{args.shard[1]}.json")
+        settings = {"mode": args.mode, "chunk_size": args.chunk_size,
+                    "token_budget": args.token_budget, "prompt_format": args.prompt_format}
+        manifest = RunManifest.open(manifest_path, settings, resume=args.resume)
+        print(f"マニフェスト: {manifest_path}")
+
+    # 接頭辞キャッシュ（ドライランでは削減見積もりの表示のみ）
+    prefix_cache = None
+    if args.prefix_cache:
+        prefix_cache = PromptPrefixCache(system_instruction)
+
     # 処理実行
-    total = 0
-    for file_path in files:
-        count = process_file(
-            file_path,
+    stats = YieldStats()
+    file_times: dict[Path, float] = {}
+    start = time.monotonic()
+    try:
+        results = process_files(
+            files,
             system_instruction,
             args.mode,
             args.output_dir,
             args.chunk_size,
-            args.dry_run
+            args.dry_run,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            cache=cache,
+            manifest=manifest,
+            token_budget=args.token_budget,
+            prompt_format=args.prompt_format,
+            prefix_cache=prefix_cache,
+            stream=args.stream,
+            retries=args.retries,
+            repair_rounds=args.repair_rounds,
+            stats=stats,
+            file_times=file_times
         )
-        total += count
-
-    print(f"\n=== 完了 ===")
+    except KeyboardInterrupt:
+        print("\n中断しました。--resume で続きから再開できます。")
+        sys.exit(130)
+    finally:
+        if prefix_cache:
+            prefix_cache.close()
+    wall = time.monotonic() - start
+    total = sum(results.values())
+
+    if cache:
+        cache.evict()
+
+    print("\n=== 完了 ===")
     print(f"総生成数: {total}問")
     if not args.dry_run:
         print(f"出力先: {args.output_dir}")
+    if not args.dry_run:
+        print(f"歩留まり: {stats.summary()}")
+    if cache:
+        print(f"キャッシュ: {cache.summary()}")
+    if manifest:
+        counts = manifest.summary()
+        print(f"チャンク: 成功 {counts[OK]} / 失敗 {counts[FAILED]} / 未処理 {counts[PENDING]}")
+    if not args.dry_run:
+        print_timing_report(wall, file_times)
+    if manifest and (counts[FAILED] or counts[PENDING]):
+        # 出力の一部が欠けているので、呼び出し側（build_data.py など）が成功扱いしないようにする
+        print("失敗・未処理のチャンクがあります。--resume で再実行できます。")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -2,22 +2,45 @@
 """
 問題データインポートスクリプト
 
-TSV または JSON ファイルを読み込み、GAS Web App に POST してスプレッドシートに投入する。
+TSV / JSON / NDJSON ファイルを読み込み、GAS Web App に POST してスプレッドシートに投入する。
+ファイルは先頭から1問ずつ読むため、大きなファイルでもメモリ使用量は一定。
+問題はサイズ上限付きのバッチに分けて並列に送る。バッチごとに内容から決まる
+batch_key を付けるため、再送しても GAS 側で二重に登録されない。
+受け付けられたバッチは進捗ファイルに記録し、再実行時は残りのバッチだけを送る。
 
 使用方法:
     python tools/import_questions.py data/new_questions.tsv
     python tools/import_questions.py data/new_questions.json
     python tools/import_questions.py data/new_questions.tsv --batch-id batch_20251229_1500
+    python tools/import_questions.py data/new_questions.tsv --workers 4 --batch-bytes 262144
+    python tools/import_questions.py data/new_questions.tsv --compress gzip-base64
+    python tools/import_questions.py data/new_questions.ndjson --stream   # 読みながら送信
+    python tools/import_questions.py data/new_questions.tsv --mirror data/generated/questions.db  # 差分だけ送信
+
+    # ローカルの GAS スタブで動作確認
+    python tools/gas_stub.py --port 8766
+    python tools/import_questions.py data/new_questions.tsv --url http://127.0.0.1:8766/exec
 """
 
 import sys
 import json
 import csv
+import time
+import zlib
+import base64
+import hashlib
 import argparse
+import threading
 from pathlib import Path
 from datetime import datetime
+from typing import Iterable, Iterator, Optional
 from urllib import request, error
 
+from dispatcher import call_with_retry, run_parallel
+from question import parse_choices
+from run_manifest import atomic_write_text, file_hash
+import validation
+
 # GAS Web App URL
 GAS_WEB_APP_URL = "https://script.google.com/macros/s/AKfycbwlfAC4Zu1bPyXbu6hHpyNoOSZg4oaTpuIQF_qB_dqkJmdtnt72zzklIWQiYCmC12Tg/exec"
 
@@ -32,6 +55,39 @@ REQUIRED_FIELDS = [
     "correct_answer"
 ]
 
+# 1バッチの上限（JSON のバイト数と問題数）。GAS の実行時間制限（6分）に十分収まる大きさにする
+DEFAULT_BATCH_BYTES = 256 * 1024
+DEFAULT_BATCH_SIZE = 200
+
+# 同時に送るバッチ数
+DEFAULT_WORKERS = 4
+
+# ストリーミング読み込み時にまとめてバリデーションする問題数
+VALIDATE_CHUNK_SIZE = 1000
+
+# 一時的なエラー（タイムアウト・5xx）の再試行回数
+DEFAULT_RETRIES = 3
+
+# 1バッチあたりのタイムアウト（秒）
+BATCH_TIMEOUT = 120
+
+# リクエストボディの圧縮方式
+#   none:        UTF-8 の JSON をそのまま送る
+#   gzip:        Content-Encoding: gzip（gzip を展開できる送信先用。GAS は展開しない）
+#   gzip-base64: gzip を base64 にして {"encoding": "gzip+base64", "data": ...} で包む（GAS 対応）
+COMPRESS_MODES = ["none", "gzip", "gzip-base64"]
+
+# ストリーミング送信で1回に書き出す目安のバイト数
+BODY_CHUNK_BYTES = 64 * 1024
+
+# JSON 配列を読み込む単位（文字数）
+JSON_READ_SIZE = 64 * 1024
+
+# 対応するファイル形式（拡張子）
+TSV_SUFFIXES = {".tsv"}
+JSON_SUFFIXES = {".json"}
+NDJSON_SUFFIXES = {".ndjson", ".jsonl"}
+
 # オプションフィールド
 OPTIONAL_FIELDS = [
     "question_id",  # 省略時はGAS側で自動採番
@@ -40,97 +96,538 @@ OPTIONAL_FIELDS = [
 ]
 
 
-def load_tsv(file_path: Path) -> list[dict]:
-    """TSVファイルを読み込む"""
-    questions = []
+def convert_tsv_row(row: dict) -> dict:
+    """TSVの1行を問題データに変換"""
+    q = {}
+    for field in REQUIRED_FIELDS + OPTIONAL_FIELDS:
+        if field in row:
+            value = row[field]
+            # choices は JSON としてパース（だめならカンマ区切り）
+            if field == "choices":
+                q[field] = parse_choices(value)
+            # correct_index は整数
+            elif field == "correct_index":
+                q[field] = int(value)
+            else:
+                q[field] = value
+    return q
+
+
+def iter_tsv(file_path: Path) -> Iterator[dict]:
+    """TSVファイルを1行ずつ読んで問題データを返す"""
     with open(file_path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f, delimiter="\t")
         for row in reader:
-            q = {}
-            for field in REQUIRED_FIELDS + OPTIONAL_FIELDS:
-                if field in row:
-                    value = row[field]
-                    # choices は JSON としてパース
-                    if field == "choices":
-                        try:
-                            q[field] = json.loads(value)
-                        except json.JSONDecodeError:
-                            # カンマ区切りとして処理
-                            q[field] = [s.strip() for s in value.split(",")]
-                    # correct_index は整数
-                    elif field == "correct_index":
-                        q[field] = int(value)
-                    else:
-                        q[field] = value
-            questions.append(q)
-    return questions
+            yield convert_tsv_row(row)
+
+
+def load_tsv(file_path: Path) -> list[dict]:
+    """TSVファイルを読み込む"""
+    return list(iter_tsv(file_path))
+
+
+def iter_json_array(file_path: Path, read_size: int = JSON_READ_SIZE) -> Iterator:
+    """JSON 配列のファイルを少しずつ読み、要素を1件ずつ返す
+
+    ファイル全体を読み込まず、read_size 文字ずつ読み足しながら
+    JSONDecoder.raw_decode で要素を1つずつ取り出す。
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        expect = "["  # [ → 要素または ] → , または ] → 終了
+
+        def read_more() -> bool:
+            nonlocal buf, pos, eof
+            chunk = f.read(read_size)
+            buf, pos = buf[pos:] + chunk, 0
+            eof = not chunk
+            return not eof
+
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos >= len(buf):
+                if eof or not read_more():
+                    break
+                continue
+
+            char = buf[pos]
+            if expect == "[":
+                # 配列でない場合はエラー
+                if char != "[":
+                    raise ValueError("JSONファイルは問題オブジェクトの配列である必要があります")
+                pos += 1
+                expect = "item_or_end"
+                continue
+            if expect == "end":
+                raise ValueError("JSON配列の後に余分なデータがあります")
+            if expect == "separator" or (expect == "item_or_end" and char == "]"):
+                pos += 1
+                if char == "]":
+                    expect = "end"
+                elif char == ",":
+                    expect = "item"
+                else:
+                    raise ValueError(f"JSON配列の区切りが不正です: {char!r}")
+                continue
+
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # 要素が読み込み単位の境界で切れている場合は読み足して再試行
+                if eof or not read_more():
+                    raise
+                continue
+            if end == len(buf) and not eof and read_more():
+                # 数値などの末尾が切れている可能性があるので読み足してから確定する
+                continue
+            pos = end
+            expect = "separator"
+            yield value
+
+        if expect != "end":
+            raise ValueError("JSON配列が閉じていません")
 
 
 def load_json(file_path: Path) -> list[dict]:
     """JSONファイルを読み込む"""
+    return list(iter_json_array(file_path))
+
+
+def iter_ndjson(file_path: Path) -> Iterator[dict]:
+    """NDJSON（1行1問の JSON）ファイルを1行ずつ読んで問題データを返す"""
     with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{line_no}行目: JSON のパースに失敗しました: {e}") from e
 
-    # 配列でない場合はエラー
-    if not isinstance(data, list):
-        raise ValueError("JSONファイルは問題オブジェクトの配列である必要があります")
 
-    return data
+def question_loader(file_path: Path):
+    """拡張子に応じたストリーミングローダーを返す（未対応の形式は None）"""
+    suffix = file_path.suffix.lower()
+    if suffix in TSV_SUFFIXES:
+        return iter_tsv
+    if suffix in JSON_SUFFIXES:
+        return iter_json_array
+    if suffix in NDJSON_SUFFIXES:
+        return iter_ndjson
+    return None
 
 
-def validate_questions(questions: list[dict]) -> list[str]:
-    """問題データをバリデーション"""
-    errors = []
-    for i, q in enumerate(questions):
-        for field in REQUIRED_FIELDS:
-            if field not in q or q[field] is None or q[field] == "":
-                errors.append(f"問題 {i+1}: {field} がありません")
-
-        # choices のバリデーション
-        if "choices" in q:
-            if not isinstance(q["choices"], list):
-                errors.append(f"問題 {i+1}: choices は配列である必要があります")
-            elif len(q["choices"]) < 2:
-                errors.append(f"問題 {i+1}: choices は2つ以上必要です")
-
-        # correct_index のバリデーション
-        if "correct_index" in q and "choices" in q:
-            if isinstance(q["choices"], list):
-                if q["correct_index"] < 0 or q["correct_index"] >= len(q["choices"]):
-                    errors.append(f"問題 {i+1}: correct_index が範囲外です")
+def validate_question(number: int, q) -> list[str]:
+    """問題1件をバリデーション（number は1始まりの問題番号）"""
+    return validate_questions([q], start=number)
+
+
+def validate_questions(questions: Iterable[dict], start: int = 1) -> list[str]:
+    """問題データをまとめてバリデーション（start は先頭の問題番号）"""
+    return [message for _, message in question_errors(list(questions), start)]
+
 
+def question_errors(questions: list, start: int = 1) -> list[tuple[int, str]]:
+    """問題データをまとめてバリデーションし、(問題番号, メッセージ) を番号順に返す"""
+    errors = []
+    objects = []
+    numbers = []
+    for number, q in enumerate(questions, start=start):
+        if isinstance(q, dict):
+            objects.append(q)
+            numbers.append(number)
+        else:
+            errors.append((number, f"問題 {number}: オブジェクトである必要があります"))
+    for e in validation.validate_batch(objects):
+        number = numbers[e.index]
+        errors.append((number, f"問題 {number}: {e.message}"))
+    errors.sort(key=lambda item: item[0])
     return errors
 
 
-def import_to_gas(questions: list[dict], batch_id: str = None) -> dict:
-    """GAS Web App に問題を POST"""
-    payload = {
-        "action": "import_questions",
-        "questions": questions
-    }
+class QuestionScan:
+    """ストリーミングで読んだ問題の件数・教科別内訳・バリデーションエラー
+
+    問題は chunk_size 件ずつまとめてバリデーションする。
+    """
+
+    def __init__(self, chunk_size: int = VALIDATE_CHUNK_SIZE):
+        self.count = 0
+        self.subjects: dict[str, int] = {}
+        self.errors: list[str] = []
+        self.chunk_size = chunk_size
+
+    def check(self, questions: Iterable[dict]) -> Iterator[dict]:
+        """questions を検証し、有効な問題だけを返す"""
+        chunk = []
+        for q in questions:
+            chunk.append(q)
+            if len(chunk) >= self.chunk_size:
+                yield from self._check_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._check_chunk(chunk)
+
+    def _check_chunk(self, chunk: list) -> Iterator[dict]:
+        start = self.count + 1
+        self.count += len(chunk)
+        errors = question_errors(chunk, start)
+        self.errors.extend(message for _, message in errors)
+        invalid = {number - start for number, _ in errors}
+        for i, q in enumerate(chunk):
+            if i in invalid:
+                continue
+            subj = q.get("subject", "unknown")
+            self.subjects[subj] = self.subjects.get(subj, 0) + 1
+            yield q
+
+
+class MirrorDiff:
+    """ローカルストア（question_store.QuestionStore）にない、または内容が変わった問題だけを通す"""
+
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.counts = {"new": 0, "changed": 0, "same": 0}
+
+    def filter(self, questions: Iterable[dict]) -> Iterator[dict]:
+        for status, q, _ in self.mirror.diff(questions):
+            self.counts[status] += 1
+            if status != "same":
+                yield q
+
+    def report(self):
+        c = self.counts
+        print(f"\nローカルストアとの差分: 新規 {c['new']} / 変更 {c['changed']} / "
+              f"変更なし {c['same']}（変更なしは送信しない）")
+
+
+def print_errors(errors: list[str], limit: int = 50):
+    print("\nバリデーションエラー:")
+    for err in errors[:limit]:
+        print(f"  - {err}")
+    if len(errors) > limit:
+        print(f"  - ... 他{len(errors) - limit}件")
+
+
+def print_subjects(subjects: dict[str, int]):
+    print("\n教科別内訳:")
+    for subj, count in sorted(subjects.items()):
+        print(f"  {subj}: {count}問")
+
+
+def question_bytes(q: dict) -> int:
+    """問題1件を JSON にしたときのバイト数"""
+    return len(json.dumps(q, ensure_ascii=False).encode("utf-8"))
+
+
+def iter_batches(questions: Iterable[dict], max_bytes: int = DEFAULT_BATCH_BYTES,
+                 max_count: int = DEFAULT_BATCH_SIZE) -> Iterator[list[dict]]:
+    """問題をバイト数・件数の上限に収まるバッチに分けて順に返す（並び順は保つ）
+
+    上限を単独で超える問題は1件だけのバッチにする。
+    """
+    current = []
+    current_bytes = 0
+    for q in questions:
+        size = question_bytes(q) + 1  # 区切りのカンマ分
+        if current and (current_bytes + size > max_bytes or len(current) >= max_count):
+            yield current
+            current, current_bytes = [], 0
+        current.append(q)
+        current_bytes += size
+    if current:
+        yield current
+
+
+def split_batches(questions: Iterable[dict], max_bytes: int = DEFAULT_BATCH_BYTES,
+                  max_count: int = DEFAULT_BATCH_SIZE) -> list[list[dict]]:
+    """問題をバイト数・件数の上限に収まるバッチに分ける"""
+    return list(iter_batches(questions, max_bytes, max_count))
+
+
+def make_batch_key(questions: list[dict]) -> str:
+    """バッチの内容から決まるキー（同じ内容のバッチは何度送っても同じキーになる）"""
+    payload = json.dumps(questions, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def default_progress_path(file_path: Path) -> Path:
+    return file_path.with_name(f".{file_path.name}.import.json")
+
+
+class ImportProgress:
+    """インポートの進捗ファイル
+
+    GAS が受け付けたバッチの batch_key と結果を記録する。入力ファイルの内容と
+    バッチ分割の設定が前回と同じ場合だけ引き継ぎ、batch_id も前回のものを使う。
+    """
+
+    def __init__(self, path: Path, data: dict):
+        self.path = path
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: Path, source: Path, batch_id: str, settings: dict,
+             restart: bool = False) -> "ImportProgress":
+        source_hash = file_hash(source)
+        if path.exists() and not restart:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("source_hash") == source_hash and data.get("settings") == settings:
+                return cls(path, data)
+        data = {
+            "source": str(source),
+            "source_hash": source_hash,
+            "batch_id": batch_id,
+            "settings": settings,
+            "batches": {},
+        }
+        return cls(path, data)
+
+    @property
+    def batch_id(self) -> str:
+        return self.data["batch_id"]
+
+    def acked(self, key: str) -> Optional[dict]:
+        return self.data["batches"].get(key)
+
+    def record(self, key: str, result: dict):
+        with self._lock:
+            self.data["batches"][key] = {
+                "imported_count": result.get("imported_count", 0),
+                "generated_ids": result.get("generated_ids", []),
+            }
+            self.save()
+
+    def save(self):
+        atomic_write_text(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+class BatchBody:
+    """1バッチ分のリクエストボディを少しずつ組み立てる iterable
+
+    問題を1件ずつ JSON にしながら（必要なら gzip 圧縮して）BODY_CHUNK_BYTES ごとに返す。
+    ペイロード全体の文字列を作らないため、バッチが大きくてもメモリは増えない。
+    urllib に渡すと chunked 転送で送られる。
+    反復後に raw_bytes（圧縮前の JSON）・sent_bytes（送信バイト数）・
+    encode_seconds（組み立てと圧縮にかかった時間）が分かる。
+    """
+
+    def __init__(self, fields: dict, questions: list[dict], compress: str = "none",
+                 chunk_bytes: int = BODY_CHUNK_BYTES):
+        if compress not in COMPRESS_MODES:
+            raise ValueError(f"不明な圧縮方式: {compress}")
+        self.fields = fields
+        self.questions = questions
+        self.compress = compress
+        self.chunk_bytes = chunk_bytes
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.encode_seconds = 0.0
+
+    @property
+    def headers(self) -> dict:
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if self.compress == "gzip":
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    def _json_pieces(self) -> Iterator[bytes]:
+        """{...fields, "questions": [...]} を問題1件ずつの断片で返す"""
+        head = json.dumps(self.fields, ensure_ascii=False)[:-1]
+        yield (head + (', ' if self.fields else '') + '"questions": [').encode("utf-8")
+        for i, q in enumerate(self.questions):
+            piece = json.dumps(q, ensure_ascii=False)
+            yield ((", " if i else "") + piece).encode("utf-8")
+        yield b"]}"
+
+    def _encoded(self) -> Iterator[bytes]:
+        """圧縮方式に応じて変換した断片を返す"""
+        if self.compress == "none":
+            for piece in self._json_pieces():
+                self.raw_bytes += len(piece)
+                yield piece
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 で gzip 形式
+        for piece in self._json_pieces():
+            self.raw_bytes += len(piece)
+            yield compressor.compress(piece)
+        yield compressor.flush()
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.raw_bytes = self.sent_bytes = 0
+        self.encode_seconds = 0.0
+        buffer = bytearray()
+        pending_b64 = b""  # base64 は3バイト単位で変換するので端数を持ち越す
+
+        if self.compress == "gzip-base64":
+            envelope = dict(self.fields, encoding="gzip+base64")
+            buffer += (json.dumps(envelope, ensure_ascii=False)[:-1] + ', "data": "').encode("utf-8")
+
+        started = time.perf_counter()
+        for data in self._encoded():
+            if self.compress == "gzip-base64":
+                data = pending_b64 + data
+                cut = len(data) - len(data) % 3
+                pending_b64 = data[cut:]
+                data = base64.b64encode(data[:cut])
+            buffer += data
+            if len(buffer) >= self.chunk_bytes:
+                self.encode_seconds += time.perf_counter() - started
+                self.sent_bytes += len(buffer)
+                yield bytes(buffer)
+                buffer.clear()
+                started = time.perf_counter()
+
+        if self.compress == "gzip-base64":
+            buffer += base64.b64encode(pending_b64) + b'"}'
+        self.encode_seconds += time.perf_counter() - started
+        if buffer:
+            self.sent_bytes += len(buffer)
+            yield bytes(buffer)
+
+
+def post_batch(url: str, questions: list[dict], batch_id: Optional[str] = None,
+               batch_key: Optional[str] = None, timeout: float = BATCH_TIMEOUT,
+               compress: str = "none") -> tuple[dict, BatchBody]:
+    """1バッチを GAS Web App に POST して (レスポンス, 送信したボディ) を返す
+
+    ボディは BatchBody で組み立てながら chunked 転送で送る。
+    通信エラーは例外として送出する（再試行は呼び出し側で行う）。
+    接続できない場合は ConnectionError にして一時的なエラーとして扱えるようにする。
+    """
+    fields = {"action": "import_questions"}
 
     if batch_id:
-        payload["batch_id"] = batch_id
+        fields["batch_id"] = batch_id
+    if batch_key:
+        fields["batch_key"] = batch_key
 
-    data = json.dumps(payload).encode("utf-8")
+    body = BatchBody(fields, questions, compress)
 
     req = request.Request(
-        GAS_WEB_APP_URL,
-        data=data,
-        headers={"Content-Type": "application/json"},
+        url,
+        data=body,
+        headers=body.headers,
         method="POST"
     )
 
     try:
-        with request.urlopen(req, timeout=300) as response:
-            result = json.loads(response.read().decode("utf-8"))
-            return result
-    except error.HTTPError as e:
-        return {"success": False, "error": f"HTTP Error: {e.code} {e.reason}"}
+        with request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8")), body
+    except error.HTTPError:
+        raise
     except error.URLError as e:
-        return {"success": False, "error": f"URL Error: {e.reason}"}
-    except json.JSONDecodeError:
-        return {"success": False, "error": "レスポンスのパースに失敗しました"}
+        raise ConnectionError(f"URL Error: {e.reason}") from e
+
+
+def format_bytes(n: float) -> str:
+    return f"{n / 1024:.1f}KB" if n < 1024 * 1024 else f"{n / 1024 / 1024:.2f}MB"
+
+
+def import_to_gas(questions: Iterable[dict], batch_id: str = None,
+                  url: str = GAS_WEB_APP_URL,
+                  batch_bytes: int = DEFAULT_BATCH_BYTES,
+                  batch_size: int = DEFAULT_BATCH_SIZE,
+                  workers: int = DEFAULT_WORKERS,
+                  retries: int = DEFAULT_RETRIES,
+                  progress: Optional[ImportProgress] = None,
+                  compress: str = "none", mirror=None) -> dict:
+    """GAS Web App に問題をバッチに分けて POST
+
+    最大 workers 並列で送り、一時的なエラーは retries 回まで再試行する。
+    questions はジェネレーターでもよく、バッチは送信枠が空いた分だけ読み進める
+    （メモリに載るのは送信中のバッチだけ）。
+    progress を渡すと受け付け済みのバッチは送らず、結果を進捗ファイルに記録する。
+    compress はリクエストボディの圧縮方式（COMPRESS_MODES 参照）。
+    mirror（question_store.QuestionStore）を渡すと、受け付けられたバッチの問題を記録する。
+    戻り値は全バッチをまとめた結果（success / imported_count / generated_ids /
+    raw_bytes / sent_bytes など）。
+    """
+    results: dict[int, dict] = {}
+    errors: dict[int, str] = {}
+    totals = {"raw_bytes": 0, "sent_bytes": 0}
+    counts = {"batches": 0, "skipped": 0}
+
+    def jobs() -> Iterator[tuple[int, str, list[dict]]]:
+        for index, batch in enumerate(iter_batches(questions, batch_bytes, batch_size)):
+            counts["batches"] += 1
+            key = make_batch_key(batch)
+            done = progress.acked(key) if progress else None
+            if done is not None:
+                results[index] = done
+                counts["skipped"] += 1
+                continue
+            yield index, key, batch
+
+    def worker(job: tuple[int, str, list[dict]]) -> tuple[dict, BatchBody, float]:
+        index, key, batch = job
+        started = time.monotonic()
+        result, body = call_with_retry(
+            lambda: post_batch(url, batch, batch_id, key, compress=compress), retries)
+        return result, body, time.monotonic() - started
+
+    def on_result(job: tuple[int, str, list[dict]], value: tuple[dict, BatchBody, float]):
+        index, key, batch = job
+        result, body, elapsed = value
+        label = f"[{index + 1}]"
+        totals["raw_bytes"] += body.raw_bytes
+        totals["sent_bytes"] += body.sent_bytes
+        if not result.get("success"):
+            errors[index] = result.get("error", "不明なエラー")
+            print(f"  {label} エラー: {errors[index]}")
+            return
+        results[index] = result
+        if progress:
+            progress.record(key, result)
+        if mirror is not None:
+            ids = result.get("generated_ids") or []
+            if len(ids) == len(batch):
+                batch = [dict(q, question_id=qid) for q, qid in zip(batch, ids)]
+            mirror.upsert(batch, source="import", import_batch_id=result.get("batch_id") or batch_id)
+        note = "（登録済み）" if result.get("duplicate") else ""
+        ratio = body.sent_bytes / body.raw_bytes * 100 if body.raw_bytes else 0
+        print(f"  {label} {len(batch)}問 OK{note} ({elapsed:.1f}秒, "
+              f"{format_bytes(body.raw_bytes)} → {format_bytes(body.sent_bytes)} {ratio:.0f}%, "
+              f"組み立て {body.encode_seconds * 1000:.0f}ms)")
+
+    def on_error(job: tuple[int, str, list[dict]], e: Exception):
+        errors[job[0]] = str(e)
+        print(f"  [{job[0] + 1}] エラー: {e}")
+
+    print(f"並列数: {workers}")
+    run_parallel(jobs(), worker, workers, on_result, on_error, max_pending=workers * 2)
+
+    total = counts["batches"]
+    if counts["skipped"]:
+        print(f"再開: 受け付け済み {counts['skipped']}/{total}バッチをスキップ")
+
+    ordered = [results[i] for i in sorted(results)]
+    imported = sum(r.get("imported_count", 0) for r in ordered)
+    generated_ids = [qid for r in ordered for qid in r.get("generated_ids", [])]
+    summary = {
+        "success": not errors,
+        "batch_id": batch_id,
+        "imported_count": imported,
+        "generated_ids": generated_ids,
+        "batches": total,
+        "failed_batches": len(errors),
+        **totals,
+    }
+    if errors:
+        summary["error"] = f"{len(errors)}/{total}バッチが失敗しました（再実行で残りを送信します）"
+    else:
+        summary["message"] = f"{imported}問をインポートしました（{total}バッチ）"
+    return summary
 
 
 def generate_batch_id() -> str:
@@ -141,9 +638,31 @@ def generate_batch_id() -> str:
 
 def main():
     parser = argparse.ArgumentParser(description="問題データをGAS経由でスプレッドシートにインポート")
-    parser.add_argument("file", type=Path, help="インポートするファイル（TSV または JSON）")
+    parser.add_argument("file", type=Path, help="インポートするファイル（TSV / JSON / NDJSON）")
     parser.add_argument("--batch-id", type=str, help="バッチID（省略時は自動生成）")
     parser.add_argument("--dry-run", action="store_true", help="実際には送信せず、バリデーションのみ行う")
+    parser.add_argument("--url", default=GAS_WEB_APP_URL, help="送信先の GAS Web App URL")
+    parser.add_argument("--batch-bytes", type=int, default=DEFAULT_BATCH_BYTES,
+                        help=f"1バッチの JSON サイズ上限（バイト） (default: {DEFAULT_BATCH_BYTES})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"1バッチの問題数上限 (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"同時に送るバッチ数 (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"一時的なエラーの再試行回数 (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--progress", type=Path,
+                        help="進捗ファイルのパス (default: 入力ファイルと同じ場所の .{ファイル名}.import.json)")
+    parser.add_argument("--restart", action="store_true",
+                        help="進捗ファイルを無視して最初から送る（GAS 側で登録済みのバッチは重複しない）")
+    parser.add_argument("--compress", choices=COMPRESS_MODES, default="none",
+                        help="リクエストボディの圧縮: none, gzip=Content-Encoding（展開できる送信先用）, "
+                             "gzip-base64=GAS で展開できる形式 (default: none)")
+    parser.add_argument("--stream", action="store_true",
+                        help="事前のバリデーションを省き、読みながら送信する"
+                             "（不正な問題は送らずに最後に報告）")
+    parser.add_argument("--mirror", type=Path,
+                        help="ローカルストア（tools/question_store.py の SQLite）と比べて"
+                             "新規・変更された問題だけを送り、送った問題を記録する")
 
     args = parser.parse_args()
 
@@ -152,63 +671,109 @@ def main():
         print(f"エラー: ファイルが見つかりません: {args.file}")
         sys.exit(1)
 
-    # ファイル形式判定と読み込み
-    suffix = args.file.suffix.lower()
-    if suffix == ".tsv":
-        print(f"TSVファイルを読み込み中: {args.file}")
-        questions = load_tsv(args.file)
-    elif suffix == ".json":
-        print(f"JSONファイルを読み込み中: {args.file}")
-        questions = load_json(args.file)
-    else:
-        print(f"エラー: サポートされていないファイル形式です: {suffix}")
-        print("TSV (.tsv) または JSON (.json) を使用してください")
+    # ファイル形式判定
+    loader = question_loader(args.file)
+    if loader is None:
+        print(f"エラー: サポートされていないファイル形式です: {args.file.suffix.lower()}")
+        print("TSV (.tsv)、JSON (.json)、NDJSON (.ndjson / .jsonl) を使用してください")
         sys.exit(1)
 
-    print(f"読み込んだ問題数: {len(questions)}")
+    # 事前バリデーション（ファイルを1問ずつ読むので、送信時と合わせて2回読む）
+    if not args.stream or args.dry_run:
+        print(f"読み込み中: {args.file}")
+        scan = QuestionScan()
+        try:
+            for _ in scan.check(loader(args.file)):
+                pass
+        except ValueError as e:
+            print(f"エラー: {e}")
+            sys.exit(1)
 
-    # バリデーション
-    errors = validate_questions(questions)
-    if errors:
-        print("\nバリデーションエラー:")
-        for err in errors:
-            print(f"  - {err}")
-        sys.exit(1)
+        print(f"読み込んだ問題数: {scan.count}")
 
-    print("バリデーション: OK")
+        if scan.errors:
+            print_errors(scan.errors)
+            sys.exit(1)
 
-    # 教科別の内訳表示
-    subjects = {}
-    for q in questions:
-        subj = q.get("subject", "unknown")
-        subjects[subj] = subjects.get(subj, 0) + 1
+        print("バリデーション: OK")
+        print_subjects(scan.subjects)
 
-    print("\n教科別内訳:")
-    for subj, count in sorted(subjects.items()):
-        print(f"  {subj}: {count}問")
+    # ローカルストアとの差分（新規・変更された問題だけを送る）
+    mirror = None
+    if args.mirror:
+        from question_store import QuestionStore  # question_store はこのモジュールを使う
+        mirror = QuestionStore(args.mirror)
 
     # ドライラン
     if args.dry_run:
+        if mirror is not None:
+            diff = MirrorDiff(mirror)
+            for _ in diff.filter(loader(args.file)):
+                pass
+            diff.report()
         print("\n[ドライラン] 実際の送信はスキップしました")
         sys.exit(0)
 
+    # 進捗ファイル（前回の続きなら batch_id も引き継ぐ）
+    progress_path = args.progress or default_progress_path(args.file)
+    settings = {"batch_bytes": args.batch_bytes, "batch_size": args.batch_size}
+    progress = ImportProgress.open(progress_path, args.file, args.batch_id or generate_batch_id(),
+                                   settings, restart=args.restart)
+
     # バッチID
-    batch_id = args.batch_id or generate_batch_id()
+    batch_id = progress.batch_id
     print(f"\nバッチID: {batch_id}")
+    print(f"進捗ファイル: {progress_path}")
 
-    # GAS に送信
+    # GAS に送信（読みながらバッチに分けて送る）
     print("GAS Web App に送信中...")
-    result = import_to_gas(questions, batch_id)
+    scan = QuestionScan()
+    questions = scan.check(loader(args.file))
+    if mirror is not None:
+        diff = MirrorDiff(mirror)
+        questions = diff.filter(questions)
+    try:
+        result = import_to_gas(
+            questions,
+            batch_id,
+            url=args.url,
+            batch_bytes=args.batch_bytes,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            retries=args.retries,
+            progress=progress,
+            compress=args.compress,
+            mirror=mirror
+        )
+    except ValueError as e:
+        # --stream でファイルの途中に壊れた箇所があった場合（送信済みのバッチは進捗ファイルに残る）
+        print(f"\n❌ エラー: {e}")
+        sys.exit(1)
+
+    if mirror is not None:
+        diff.report()
+
+    if args.stream:
+        print(f"\n読み込んだ問題数: {scan.count}")
+        print_subjects(scan.subjects)
+        if scan.errors:
+            # 不正な問題は送っていない（修正して再実行すれば残りだけ送られる）
+            print_errors(scan.errors)
+            result["success"] = False
+            result.setdefault("error", f"{len(scan.errors)}件のバリデーションエラーがあります")
 
     if result.get("success"):
         print(f"\n✅ 成功: {result.get('message', 'インポート完了')}")
         print(f"   バッチID: {result.get('batch_id')}")
         print(f"   インポート数: {result.get('imported_count')}問")
+        if result.get("raw_bytes"):
+            print(f"   送信量: {format_bytes(result['raw_bytes'])} → {format_bytes(result['sent_bytes'])}")
         generated_ids = result.get('generated_ids', [])
         if generated_ids:
-            print(f"   生成されたID:")
+            print("   生成されたID:")
             for qid in generated_ids:
                 print(f"     - {qid}")
+        progress.remove()
     else:
         print(f"\n❌ エラー: {result.get('error', '不明なエラー')}")
         sys.exit(1)
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+参考書パイプライン（結合 → シャッフル → 検証 → 登録）
+
+data/PIPELINE.md の手順（merge_json.py → shuffle_json.py → create_book API）を
+1つのプロセスでジェネレーターの段としてつなぐ。Markdown の JSON ブロックを読むたびに
+問題がシャッフル・検証へ流れ、--import ではそのまま create_book のリクエストボディとして
+chunked 転送で送られる。中間ファイル（.json / _shuffled.json）は
+--write-merged / --write-shuffled を指定したときだけ書く（内容は手順どおりに実行した場合と同じ）。
+
+段ごとの処理時間と1秒あたりの問題数を表示する。--watch では Markdown を監視し、
+内容が変わったファイルだけ、そのファイルの段を実行し直す。
+
+--import では参考書を途中まで作らないよう、ブロックの解析エラーや検証エラーが
+1件でもあれば送信を中断する（create_book は同じ参考書を2回作れないため）。
+選択肢の重複は create_book が受け付け、既存の参考書にも含まれるので警告にとどめる。
+
+Usage:
+    python tools/pipeline.py "data/参考書名.md"                          # 検証だけ
+    python tools/pipeline.py "data/参考書名.md" --seed 42 --write-shuffled
+    python tools/pipeline.py "data/参考書名.md" --seed 42 --balance --import
+    python tools/pipeline.py data/*.md --watch --write-merged --write-shuffled
+
+    # ローカルの GAS スタブで動作確認
+    python tools/gas_stub.py --port 8766
+    python tools/pipeline.py "data/参考書名.md" --import --url http://127.0.0.1:8766/exec
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import chain
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from urllib import request, error
+
+import import_questions as iq
+import validation
+from question import CHOICE_COUNT, Question, book_questions, raw_book_index
+from run_manifest import file_hash
+
+# プロジェクトルート
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# merge_json.py / shuffle_json.py は data/ にある
+DATA_DIR = PROJECT_ROOT / "data"
+sys.path.insert(0, str(DATA_DIR))
+
+import merge_json  # noqa: E402
+import shuffle_json  # noqa: E402
+
+
+# create_book の送信タイムアウト（秒）
+BOOK_TIMEOUT = 300
+
+# --watch の確認間隔（秒）
+DEFAULT_INTERVAL = 1.0
+
+# 参考書では警告にとどめる検査（create_book は受け付け、既存の参考書にも含まれる）
+BOOK_WARNING_CODES = {"choices_duplicate"}
+
+# 表示する警告の上限
+WARNING_LIMIT = 10
+
+
+class PipelineError(Exception):
+    """パイプラインを中断するエラー"""
+
+
+class StageTimer:
+    """ジェネレーターの段ごとの処理時間と件数
+
+    各段の next() にかかった時間は上流の段の時間を含むので、
+    段ごとの時間は1つ上流の段との差で出す。
+    """
+
+    def __init__(self):
+        self.stages: list[str] = []
+        self.seconds: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    def wrap(self, stage: str, items: Iterable) -> Iterator:
+        """items を stage として計測するジェネレーターを返す（上流から順に wrap する）"""
+        self.stages.append(stage)
+        self.seconds[stage] = 0.0
+        self.counts[stage] = 0
+        return self._timed(stage, iter(items))
+
+    def _timed(self, stage: str, it: Iterator) -> Iterator:
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    self.seconds[stage] += time.perf_counter() - started
+                    return
+                self.seconds[stage] += time.perf_counter() - started
+                self.counts[stage] += 1
+                yield item
+        finally:
+            # 中断されたときも上流の段（書きかけの一時ファイルなど）を後始末する
+            if hasattr(it, "close"):
+                it.close()
+
+    def breakdown(self, total: float, sink: Optional[str] = None) -> list[tuple[str, float, int]]:
+        """(段, 時間, 件数) のリスト。sink を渡すと最後の段より後ろ（登録）の時間も加える"""
+        rows = []
+        upstream = 0.0
+        for stage in self.stages:
+            inclusive = self.seconds[stage]
+            rows.append((stage, max(0.0, inclusive - upstream), self.counts[stage]))
+            upstream = inclusive
+        if sink and self.stages:
+            rows.append((sink, max(0.0, total - upstream), self.counts[self.stages[-1]]))
+        return rows
+
+
+class MarkdownSource:
+    """Markdown の JSON ブロックを1つずつデコードして問題を返す（結合の段）
+
+    メタ情報（action / subject / title）は最初に読めたブロックから取る。
+    strict=True ではブロックのエラーで PipelineError を送出する。
+    """
+
+    def __init__(self, path: Path, strict: bool = False):
+        self.path = path
+        self.strict = strict
+        self.meta: Optional[dict] = None
+        self.blocks = 0
+        self.errors: list[str] = []
+        self.warnings: list[str] = []
+
+    def _error(self, message: str):
+        self.errors.append(message)
+        if self.strict:
+            raise PipelineError(message)
+
+    def __iter__(self) -> Iterator[dict]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                for i, (start, text) in enumerate(merge_json.iter_json_blocks(f)):
+                    self.blocks += 1
+                    label = f"ブロック {i + 1}（{start}行目〜）"
+                    try:
+                        data = json.loads(text)
+                    except json.JSONDecodeError as e:
+                        self._error(f"{label}: {start + e.lineno - 1}行目 {e.colno}列目: {e.msg}")
+                        continue
+                    if not isinstance(data, dict):
+                        self._error(f"{label}: オブジェクトではありません")
+                        continue
+                    if self.meta is None:
+                        self.meta = {
+                            "action": data.get("action", "create_book"),
+                            "subject": data.get("subject", "jp"),
+                            "title": data.get("title", "Unknown"),
+                        }
+                    questions = data.get("questions")
+                    if not isinstance(questions, list):
+                        self.warnings.append(f"{label}: 'questions' リストが含まれていません")
+                        continue
+                    yield from questions
+            except ValueError as e:
+                self._error(str(e))
+
+
+class ShuffleStage:
+    """選択肢を shuffle_json.py と同じ並べ替えでシャッフルする段
+
+    balance=False では問題番号ごとに並べ替えが決まるので1問ずつ流す。
+    balance=True では参考書全体の問題数が必要なため、この段で問題を溜める。
+
+    index_base は元の correct_index が何始まりか。None の場合、balance=True では
+    shuffle_json.py と同じく参考書全体の値から決め、1問ずつ流す場合は
+    merge_json.py の出力と同じ 1始まりとみなす。
+    """
+
+    def __init__(self, source: MarkdownSource, seed: int, balance: bool = False,
+                 index_base: Optional[int] = None):
+        self.source = source
+        self.seed = seed
+        self.balance = balance
+        self.index_base = index_base
+        self.stats = {i: 0 for i in range(CHOICE_COUNT)}
+
+    def run(self, questions: Iterable[dict]) -> Iterator[dict]:
+        if self.balance:
+            questions = list(questions)
+            key = self._key()
+            try:
+                _, items = book_questions({"questions": questions}, self.index_base,
+                                          shuffle_json.DEFAULT_INDEX_BASE)
+            except ValueError as e:
+                raise PipelineError(str(e)) from None
+            stats, _ = shuffle_json.shuffle_questions(items, key, True)
+            self.stats.update(stats)
+            for item in items:
+                yield item.to_book()
+            return
+
+        base = shuffle_json.DEFAULT_INDEX_BASE if self.index_base is None else self.index_base
+        key = None
+        for i, q in enumerate(questions):
+            if key is None:
+                key = self._key()
+            try:
+                value = raw_book_index(q)
+            except (TypeError, ValueError) as e:
+                raise PipelineError(f"問題 {i + 1}: correct_index を整数にできません: {e}") from None
+            if not 0 <= value - base < CHOICE_COUNT:
+                raise PipelineError(f"問題 {i + 1}: correct_index {value} が{base}始まりの範囲外です"
+                                    "（--index-base で指定できます）")
+            item = Question.from_book(q, base)
+            shuffle_json.apply_permutation(item, shuffle_json.permutation_at(key, i))
+            self.stats[item.correct_index] += 1
+            yield item.to_book()
+
+    def _key(self) -> int:
+        meta = self.source.meta or {}
+        return shuffle_json.book_key(self.seed, meta.get("title", ""))
+
+
+class ValidateStage:
+    """validation.validate_batch でまとめて検証する段（不正な問題は下流に流さない）
+
+    BOOK_WARNING_CODES の検査は警告として記録し、その問題は下流に流す。
+    """
+
+    def __init__(self, source: MarkdownSource, strict: bool = False,
+                 chunk_size: int = iq.VALIDATE_CHUNK_SIZE):
+        self.source = source
+        self.strict = strict
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.errors: list[str] = []
+        self.warnings: list[str] = []
+
+    def run(self, questions: Iterable[dict]) -> Iterator[dict]:
+        chunk = []
+        for q in questions:
+            chunk.append(q)
+            if len(chunk) >= self.chunk_size:
+                yield from self._check(chunk)
+                chunk = []
+        if chunk:
+            yield from self._check(chunk)
+
+    def _check(self, chunk: list[dict]) -> Iterator[dict]:
+        start = self.count + 1
+        self.count += len(chunk)
+        rows = [self._row(q) for q in chunk]
+        by_row = validation.errors_by_row(validation.validate_batch(rows, check_answer=False))
+        rejected = set()
+        for i, errors in sorted(by_row.items()):
+            warnings = [e for e in errors if e.code in BOOK_WARNING_CODES]
+            errors = [e for e in errors if e.code not in BOOK_WARNING_CODES]
+            if warnings:
+                self.warnings.append(f"問題 {start + i}: {validation.join_messages(warnings)}")
+            if errors:
+                self.errors.append(f"問題 {start + i}: {validation.join_messages(errors)}")
+                rejected.add(i)
+        if rejected and self.strict:
+            raise PipelineError(self.errors[-len(rejected)])
+        for i, q in enumerate(chunk):
+            if i not in rejected:
+                yield q
+
+    def _row(self, q: dict) -> dict:
+        """参考書の問題を検証用の行にする（シャッフル後の correct_index は 0〜3）"""
+        meta = self.source.meta
+        item = Question.from_book(q, 0)
+        item.subject = meta["subject"]
+        item.genre_id = f"{meta['subject']}_{meta['title']}"
+        item.genre_name = meta["title"]
+        return item.to_row()
+
+
+class BookFileWriter:
+    """問題を流しながら参考書 JSON に書き出す段（merge_json.QuestionWriter を使う）
+
+    一時ファイルに書き、最後まで書けたら置き換える（中断時は元のファイルを残す）。
+    """
+
+    def __init__(self, source: MarkdownSource, path: Path):
+        self.source = source
+        self.path = path
+
+    def run(self, questions: Iterable[dict]) -> Iterator[dict]:
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                writer = merge_json.QuestionWriter(f, "json")
+                for q in questions:
+                    if writer.meta is None:
+                        writer.start(self.source.meta)
+                    writer.write([q])
+                    yield q
+                if writer.meta is None and self.source.meta:
+                    writer.start(self.source.meta)
+                writer.finish()
+            os.replace(tmp, self.path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+def post_book(url: str, meta: dict, questions: Iterable[dict], compress: str = "none",
+              timeout: float = BOOK_TIMEOUT) -> tuple[dict, "iq.BatchBody"]:
+    """create_book を POST する（ボディは問題を読みながら chunked 転送で送る）
+
+    questions の途中で例外が出た場合は送信を中断し、GAS にはリクエストが届かない。
+    """
+    fields = {"action": "create_book", "subject": meta["subject"], "title": meta["title"]}
+    body = iq.BatchBody(fields, questions, compress)
+    req = request.Request(url, data=body, headers=body.headers, method="POST")
+    try:
+        with request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8")), body
+    except error.HTTPError:
+        raise
+    except error.URLError as e:
+        raise ConnectionError(f"URL Error: {e.reason}") from e
+
+
+@dataclass
+class PipelineOptions:
+    seed: int
+    balance: bool = False
+    write_merged: bool = False
+    write_shuffled: bool = False
+    import_url: Optional[str] = None     # None なら登録しない
+    compress: str = "none"
+    index_base: Optional[int] = None     # 元の correct_index が何始まりか（None なら ShuffleStage 参照）
+
+
+@dataclass
+class PipelineResult:
+    path: Path
+    meta: Optional[dict] = None
+    questions: int = 0
+    valid: int = 0
+    errors: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+    stats: dict = field(default_factory=dict)
+    stages: list[tuple[str, float, int]] = field(default_factory=list)
+    seconds: float = 0.0
+    response: Optional[dict] = None
+    failure: Optional[str] = None
+    outputs: list[Path] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        if self.failure or self.errors:
+            return False
+        return self.response is None or bool(self.response.get("success"))
+
+
+def merged_path(md_path: Path) -> Path:
+    return md_path.with_suffix(".json")
+
+
+def shuffled_path(md_path: Path) -> Path:
+    return md_path.with_name(f"{md_path.stem}{shuffle_json.OUTPUT_SUFFIX}.json")
+
+
+def run_pipeline(md_path: Path, options: PipelineOptions) -> PipelineResult:
+    """1つの Markdown について、結合から登録までの段をつないで実行する"""
+    strict = options.import_url is not None
+    result = PipelineResult(md_path)
+    timer = StageTimer()
+    source = MarkdownSource(md_path, strict)
+    shuffle = ShuffleStage(source, options.seed, options.balance, options.index_base)
+    check = ValidateStage(source, strict)
+
+    stream = timer.wrap("merge", source)
+    if options.write_merged:
+        result.outputs.append(merged_path(md_path))
+        stream = timer.wrap("write-merged", BookFileWriter(source, merged_path(md_path)).run(stream))
+    stream = timer.wrap("shuffle", shuffle.run(stream))
+    if options.write_shuffled:
+        result.outputs.append(shuffled_path(md_path))
+        stream = timer.wrap("write-shuffled",
+                            BookFileWriter(source, shuffled_path(md_path)).run(stream))
+    stream = timer.wrap("validate", check.run(stream))
+
+    started = time.perf_counter()
+    try:
+        if options.import_url:
+            first = next(stream, None)
+            if source.meta is None:
+                raise PipelineError("JSONブロックが見つかりませんでした")
+            questions = stream if first is None else chain([first], stream)
+            result.response, _ = post_book(options.import_url, source.meta, questions,
+                                           options.compress)
+        else:
+            deque(stream, maxlen=0)
+    except PipelineError as e:
+        result.failure = str(e)
+    except (ConnectionError, error.HTTPError, OSError) as e:
+        result.failure = f"送信に失敗しました: {e}"
+    finally:
+        stream.close()
+    result.seconds = time.perf_counter() - started
+
+    result.meta = source.meta
+    result.questions = timer.counts.get("merge", 0)
+    result.valid = timer.counts.get("validate", 0)
+    result.errors = source.errors + check.errors
+    result.warnings = source.warnings + check.warnings
+    result.stats = shuffle.stats
+    result.stages = timer.breakdown(result.seconds, "import" if options.import_url else None)
+    if result.failure is None and source.meta is None:
+        result.failure = "JSONブロックが見つかりませんでした"
+    return result
+
+
+def print_result(result: PipelineResult):
+    meta = result.meta or {}
+    print(f"\n[{result.path}]")
+    print(f"  {meta.get('title', '-')}（{meta.get('subject', '-')}） / 問題 {result.questions} / "
+          f"有効 {result.valid} / {result.seconds:.2f}秒")
+    print(f"  {'段階':<16} {'時間':>8} {'問題数':>8} {'問/秒':>10}")
+    for stage, seconds, count in result.stages:
+        rate = f"{count / seconds:,.0f}" if seconds > 0 else "-"
+        print(f"  {stage:<16} {seconds:>7.3f}秒 {count:>8} {rate:>10}")
+
+    if result.questions:
+        dist = " / ".join(f"{k}: {v}" for k, v in sorted(result.stats.items()))
+        print(f"  正解分布（0-3）: {dist}")
+    for message in result.warnings[:WARNING_LIMIT]:
+        print(f"  警告: {message}")
+    if len(result.warnings) > WARNING_LIMIT:
+        print(f"  警告: ... 他{len(result.warnings) - WARNING_LIMIT}件")
+    if result.errors:
+        iq.print_errors(result.errors)
+    for path in result.outputs:
+        if path.exists() and result.failure is None:
+            print(f"  出力: {path}")
+    if result.response is not None:
+        if result.response.get("success"):
+            print(f"  登録: {result.response.get('message')}（{result.response.get('book_id')}）")
+        else:
+            print(f"  登録エラー: {result.response.get('error')}")
+    if result.failure:
+        print(f"  中断: {result.failure}")
+
+
+def watch(paths: list[Path], options: PipelineOptions, interval: float):
+    """Markdown を監視し、内容が変わったファイルだけパイプラインを実行し直す
+
+    更新日時とサイズで変更を見つけ、内容のハッシュが変わった場合だけ実行する。
+    """
+    signatures: dict[Path, tuple] = {}
+    hashes: dict[Path, str] = {}
+    for path in paths:
+        signatures[path] = signature(path)
+        hashes[path] = file_hash(path) if path.exists() else ""
+    print(f"\n{len(paths)} ファイルを監視しています（Ctrl+C で終了）...")
+    try:
+        while True:
+            time.sleep(interval)
+            for path in paths:
+                current = signature(path)
+                if current == signatures[path]:
+                    continue
+                signatures[path] = current
+                digest = file_hash(path) if path.exists() else ""
+                if digest == hashes[path] or not digest:
+                    continue
+                hashes[path] = digest
+                print(f"\n変更を検出しました: {path}（{time.strftime('%H:%M:%S')}）")
+                print_result(run_pipeline(path, options))
+    except KeyboardInterrupt:
+        print("\n監視を終了します。")
+
+
+def signature(path: Path) -> tuple:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return ()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="参考書パイプライン（結合 → シャッフル → 検証 → 登録）")
+    parser.add_argument("files", type=Path, nargs="+", help="参考書の Markdown（LLM の出力）")
+    parser.add_argument("--seed", type=int,
+                        help="シャッフルのシード（省略時はランダムに決めて表示）")
+    parser.add_argument("--balance", action="store_true",
+                        help="参考書全体で正解の位置を均等にする（シャッフルの段で問題を溜める）")
+    parser.add_argument("--write-merged", action="store_true",
+                        help="結合した JSON（参考書名.json）を書き出す")
+    parser.add_argument("--write-shuffled", action="store_true",
+                        help="シャッフル済み JSON（参考書名_shuffled.json）を書き出す")
+    parser.add_argument("--import", dest="do_import", action="store_true",
+                        help="create_book API で登録する（エラーが1件でもあれば送信を中断）")
+    parser.add_argument("--url", default=iq.GAS_WEB_APP_URL, help="GAS Web App の URL")
+    parser.add_argument("--compress", choices=iq.COMPRESS_MODES, default="none",
+                        help="リクエストボディの圧縮方式 (default: none)")
+    parser.add_argument("--index-base", choices=["auto", "0", "1"], default="auto",
+                        help="Markdown の correct_index が何始まりか（省略時は 1始まり。"
+                             "--balance では参考書全体の値から決める）")
+    parser.add_argument("--watch", action="store_true",
+                        help="Markdown を監視し、変更されたファイルだけ実行し直す")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"--watch の確認間隔（秒） (default: {DEFAULT_INTERVAL})")
+
+    args = parser.parse_args()
+
+    if args.watch and args.do_import:
+        parser.error("--watch と --import は同時に指定できません（同じ参考書は2回作れないため）")
+    missing = [p for p in args.files if not p.exists()]
+    if missing and not args.watch:
+        for path in missing:
+            print(f"エラー: 入力ファイル '{path}' が見つかりません。")
+        return 1
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 63)
+    options = PipelineOptions(seed=seed, balance=args.balance,
+                              write_merged=args.write_merged, write_shuffled=args.write_shuffled,
+                              import_url=args.url if args.do_import else None,
+                              compress=args.compress,
+                              index_base=None if args.index_base == "auto" else int(args.index_base))
+    print(f"シード: {seed}" + ("（--balance）" if args.balance else ""))
+
+    results = [run_pipeline(path, options) for path in args.files if path.exists()]
+    for result in results:
+        print_result(result)
+    if len(results) > 1:
+        ok = sum(r.ok for r in results)
+        print("=" * 50)
+        print(f"{ok}/{len(results)} ファイル / 問題 {sum(r.questions for r in results)} / "
+              f"{sum(r.seconds for r in results):.2f}秒")
+
+    if args.watch:
+        watch(args.files, options, args.interval)
+        return 0
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+問題データの共通の型（Question）
+
+問題はツールごとに違う形の dict で流れている:
+
+    生成済み TSV:   choices は JSON の文字列、correct_index は 0始まりの文字列
+    インポート:     choices はリスト、correct_index は 0始まりの整数
+    参考書 JSON:    choice_1〜choice_4。correct_index は merge_json.py の出力（Markdown の
+                    まま）では 1始まり、shuffle_json.py の出力では 0始まり
+
+Question は参考書 JSON の問題から作り（from_book）、correct_index を 0始まりの整数で持つ。
+参考書 JSON（to_book）とインポートの形（to_row）に書き戻せる。生成済み TSV の行は
+generate_questions.py / import_questions.py がそれぞれ dict のまま扱う。
+__slots__ を使うので1問あたりのメモリは dict より小さい。
+choices のリストや各文字列は作り直さずにそのまま参照する。
+参考書 JSON から作った Question は元の dict も参照し、to_book では元の dict の
+キー（知らないキーも含む）と順番を残したまま、選択肢と correct_index を書き換える。
+
+参考書 JSON の correct_index が 0始まりか 1始まりかは、問題ごとではなく参考書全体の
+値から決める（detect_index_base）。0 と 4 が両方ある参考書はエラーにする。
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+
+# 4択
+CHOICE_COUNT = 4
+
+# 参考書 JSON の選択肢のキー
+BOOK_CHOICE_KEYS = [f"choice_{i + 1}" for i in range(CHOICE_COUNT)]
+
+# 生成済み TSV の列
+TSV_FIELDS = ["subject", "genre_id", "genre_name", "question_text",
+              "choices", "correct_index", "correct_answer", "hint", "difficulty"]
+
+# インポートで送る必須フィールド（validation.REQUIRED_FIELDS と同じ）と、空なら省くフィールド
+ROW_FIELDS = ["subject", "genre_id", "genre_name", "question_text",
+              "choices", "correct_index", "correct_answer"]
+OPTIONAL_ROW_FIELDS = ["question_id", "hint", "difficulty"]
+
+# correct_index がない参考書の問題は GAS の createBook と同じく 1 とみなす
+BOOK_DEFAULT_INDEX = 1
+
+
+def parse_choices(value) -> list:
+    """choices の値をリストにする（JSON の文字列、だめならカンマ区切り。リストはそのまま）"""
+    if not isinstance(value, str):
+        return value if value is not None else []
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return [s.strip() for s in value.split(",")]
+
+
+def raw_book_index(q: dict) -> int:
+    """参考書の問題の correct_index（書かれたままの値）"""
+    index = q.get("correct_index")
+    return BOOK_DEFAULT_INDEX if index is None else int(index)
+
+
+def _uses_choice_list(q: dict) -> bool:
+    """参考書の問題が choice_1〜4 ではなく choices のリストで選択肢を持っているか"""
+    return not any(q.get(k) for k in BOOK_CHOICE_KEYS) and bool(q.get("choices"))
+
+
+def detect_index_base(values: Iterable[int], default: Optional[int] = None) -> int:
+    """参考書全体の correct_index の値から 0始まりか 1始まりかを決める
+
+    0 があれば 0始まり、4 があれば 1始まり。1〜3 しかない場合は default
+    （None ならエラー）。0 と 4 が両方ある、または 0〜4 の外の値は ValueError。
+    """
+    seen = set(values)
+    outside = sorted(v for v in seen if not 0 <= v <= CHOICE_COUNT)
+    if outside:
+        raise ValueError(f"correct_index {outside[0]} が範囲外です")
+    if 0 in seen and CHOICE_COUNT in seen:
+        raise ValueError("correct_index に 0 と 4 が混在しています（0始まりと1始まりのどちらか決められません）")
+    if 0 in seen:
+        return 0
+    if CHOICE_COUNT in seen:
+        return 1
+    if default is None:
+        raise ValueError("correct_index が 1〜3 だけのため、0始まりか1始まりか決められません")
+    return default
+
+
+@dataclass(slots=True)
+class Question:
+    """1問（correct_index は常に 0始まり）"""
+    question_text: str = ""
+    choices: list = field(default_factory=list)
+    correct_index: int = 0
+    correct_answer: str = ""
+    subject: str = ""
+    genre_id: str = ""
+    genre_name: str = ""
+    hint: Optional[str] = ""
+    difficulty: str = ""
+    question_id: str = ""
+    source: Optional[dict] = field(default=None, repr=False, compare=False)
+
+    # ---- 読み込み ----
+
+    @classmethod
+    def from_book(cls, q: dict, index_base: int) -> "Question":
+        """参考書 JSON の問題から作る（index_base は参考書の correct_index が何始まりか）
+
+        選択肢は GAS の createBook と同じく choice_1〜4、なければ choices を使う。
+        """
+        choices = [q.get(k) for k in BOOK_CHOICE_KEYS]
+        if _uses_choice_list(q):
+            listed = list(q["choices"])[:CHOICE_COUNT]
+            choices = listed + [""] * (CHOICE_COUNT - len(listed))
+        choices = [c if c is not None else "" for c in choices]
+        index = raw_book_index(q) - index_base
+        return cls(
+            question_text=q.get("question_text", ""),
+            choices=choices,
+            correct_index=index,
+            correct_answer=choices[index] if 0 <= index < len(choices) else "",
+            hint=q.get("hint", ""),
+            source=q,
+        )
+
+    # ---- 書き出し ----
+
+    def to_book(self, index_base: int = 0) -> dict:
+        """参考書 JSON の1問（キーの順は merge_json.py / shuffle_json.py の出力と同じ）
+
+        from_book で作った場合は元の dict をコピーして書き換える（他のキーと順番はそのまま。
+        選択肢は元と同じく choice_1〜4 か choices に書く）。
+        """
+        if self.source is None:
+            q = {"question_text": self.question_text}
+            q.update(zip(BOOK_CHOICE_KEYS, self.choices))
+            q["correct_index"] = self.correct_index + index_base
+            q["hint"] = self.hint
+            return q
+
+        q = dict(self.source)
+        for name in ("question_text", "hint"):
+            if name in q:
+                q[name] = getattr(self, name)
+        if _uses_choice_list(q):
+            q["choices"] = list(self.choices)
+        else:
+            q.update(zip(BOOK_CHOICE_KEYS, self.choices))
+        q["correct_index"] = self.correct_index + index_base
+        return q
+
+    def to_row(self) -> dict:
+        """インポートで送る形（choices はリスト。空の任意フィールドは省く）"""
+        row = {name: getattr(self, name) for name in ROW_FIELDS}
+        for name in OPTIONAL_ROW_FIELDS:
+            value = getattr(self, name)
+            if value:
+                row[name] = value
+        return row
+
+
+def book_questions(book: dict, index_base: Optional[int] = None,
+                   default_base: Optional[int] = None) -> tuple[int, list[Question]]:
+    """参考書 JSON の問題を Question にする（index_base を省くと参考書全体から決める）
+
+    (使った index_base, 問題のリスト) を返す。correct_index が範囲外の問題は ValueError。
+    """
+    questions = book.get("questions", [])
+    values = []
+    for number, q in enumerate(questions, start=1):
+        try:
+            values.append(raw_book_index(q))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"問題 {number}: correct_index を整数にできません: {e}") from None
+    if index_base is None:
+        index_base = detect_index_base(values, default_base)
+    result = []
+    for number, (q, value) in enumerate(zip(questions, values), start=1):
+        if not 0 <= value - index_base < CHOICE_COUNT:
+            raise ValueError(f"問題 {number}: correct_index {value} が"
+                             f"{index_base}始まりの範囲外です")
+        result.append(Question.from_book(q, index_base))
+    return index_base, result
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+問題データのバイナリ形式（.qbank、列ごとの配列 + 文字列テーブル、mmap で開く）
+
+参考書 JSON（indent=2）や生成済み TSV は、使うたびに全体をパースし直す
+（TSV は行ごとに choices の json.loads も走る）。.qbank は問題文・選択肢・ヒントなどの
+文字列を1つの文字列テーブルにまとめ（同じ文字列は1つにする）、問題ごとの値は
+固定長の配列で持つ。mmap で開くと、読み込みは先頭のヘッダーを読むだけで、
+i 番目の問題は配列と文字列テーブルから直接取り出せる。
+
+形式（リトルエンディアン、各セクションは 8 バイト境界から始まる）:
+    ヘッダー       magic "QBNK", version u16, flags u16, 問題数 n u32, 文字列数 m u32,
+                   メタデータ長 u32
+    メタデータ     JSON（kind: "book" / "tsv"、参考書の action・subject・title、
+                   ジャンル表 [[subject, genre_id, genre_name], ...]）
+    文字列の位置   u32 × (m + 1)（文字列 k は blob[offsets[k]:offsets[k + 1]]）
+    列             question_text u32 × n, choices u32 × 4n, hint u32 × n,
+                   correct_answer u32 × n, difficulty u32 × n, extra u32 × n
+                   （文字列番号。キーなしは 0xFFFFFFFF、null は 0xFFFFFFFE）
+                   usage_count u32 × n, genre u16 × n（ジャンル表の番号）,
+                   correct_index i8 × n（元の値のまま。キーなしは -128、null は -127）
+    文字列         UTF-8 の blob
+
+参考書の問題は、キーが BOOK_KEYS の順に並び値が文字列（correct_index は整数）なら列に入れ、
+それ以外のキーがある・順番が違う・値の型が違う問題は、問題全体の JSON を extra の列に
+文字列として持つ。そのため参考書 JSON ⇔ .qbank は、問題ごとのキー・順番・値が元どおりに戻る
+（merge_json.py / shuffle_json.py が書いた参考書なら、ファイルもバイト単位で同じになる。
+トップレベルのキーは questions を最後に書く）。TSV ⇔ .qbank は import_questions.py で
+読んだ内容が同じになる（choices の JSON の書き方は揃える）。
+
+Usage:
+    python tools/question_bank.py pack "data/中学入試でる順ポケでる国語 漢字・熟語 四訂版_shuffled.json"
+    python tools/question_bank.py pack data/generated/JP01.tsv -o JP01.qbank
+    python tools/question_bank.py unpack JP01.qbank -o JP01.tsv
+    python tools/question_bank.py info JP01.qbank
+    python tools/question_bank.py bench "data/中学入試でる順ポケでる国語 漢字・熟語 四訂版_shuffled.json" --scale 1 10 100
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import Iterator, Optional
+
+import import_questions as iq
+from generate_questions import write_tsv
+from question_store import is_book_file
+from run_manifest import atomic_write_text
+
+
+MAGIC = b"QBNK"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIII")
+
+SUFFIX = ".qbank"
+
+CHOICE_COUNT = 4
+
+# キーがないこと・値が null であることを表す文字列番号と correct_index の値
+NO_STRING = 0xFFFFFFFF
+NULL_STRING = 0xFFFFFFFE
+NO_INDEX = -128
+NULL_INDEX = -127
+
+_MISSING = object()
+
+# 文字列番号の列（この順でファイルに並ぶ。choices は1問4つ）
+STRING_COLUMNS = ["question_text", "choices", "hint", "correct_answer", "difficulty", "extra"]
+
+# 参考書 JSON の1問のキー（この順で書き戻す）
+BOOK_KEYS = ["question_text", "choice_1", "choice_2", "choice_3", "choice_4", "correct_index", "hint"]
+
+# メタデータで使うキー（参考書のトップレベルにあると区別できない）
+META_KEYS = ("kind", "genres")
+
+_ALIGN = 8
+
+
+def _padding(position: int) -> bytes:
+    return b"\0" * (-position % _ALIGN)
+
+
+def _plain_book_value(key: str, value) -> bool:
+    """列に入れて同じ値に戻せるか"""
+    if value is None:
+        return True
+    if key == "correct_index":
+        return type(value) is int and NULL_INDEX < value < 128
+    return isinstance(value, str)
+
+
+def _is_plain_book_question(q: dict) -> bool:
+    """キーが BOOK_KEYS の順に並び、値をすべて列に入れられる参考書の問題か"""
+    return list(q) == [k for k in BOOK_KEYS if k in q] \
+        and all(_plain_book_value(k, v) for k, v in q.items())
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class BankWriter:
+    """問題を1問ずつ受け取って .qbank を組み立てる"""
+
+    def __init__(self, kind: str, meta: Optional[dict] = None):
+        self.kind = kind
+        self.meta = dict(meta or {})
+        self.strings: dict[str, int] = {}
+        self.genres: dict[tuple, int] = {}
+        self.columns = {name: array("I") for name in STRING_COLUMNS}
+        self.usage = array("I")
+        self.genre = array("H")
+        self.correct_index = array("b")
+
+    def _string(self, value) -> int:
+        if value is _MISSING:
+            return NO_STRING
+        if value is None:
+            return NULL_STRING
+        value = str(value)
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        return index
+
+    def add(self, q: dict):
+        """1問追加する（参考書 JSON の形でも、import_questions.py で読んだ形でもよい）"""
+        extra = _MISSING
+        if self.kind == "book" and not _is_plain_book_question(q):
+            # 問題全体を JSON で持ち、列には入れられる値だけを入れる
+            extra = json.dumps(q, ensure_ascii=False)
+            q = {k: v for k, v in q.items() if k in BOOK_KEYS and _plain_book_value(k, v)}
+
+        choices = q.get("choices")
+        if choices is None:
+            choices = [q.get(f"choice_{i}", _MISSING) for i in range(1, CHOICE_COUNT + 1)]
+        if len(choices) > CHOICE_COUNT:
+            raise ValueError(f"選択肢が {CHOICE_COUNT} 個より多い問題は入れられません: {len(choices)} 個")
+        choices = list(choices) + [_MISSING] * (CHOICE_COUNT - len(choices))
+
+        self.columns["question_text"].append(self._string(q.get("question_text", _MISSING)))
+        self.columns["choices"].extend(map(self._string, choices))
+        for name in ("hint", "correct_answer", "difficulty"):
+            self.columns[name].append(self._string(q.get(name, _MISSING)))
+        self.columns["extra"].append(self._string(extra))
+
+        index = q.get("correct_index", _MISSING)
+        if index is _MISSING:
+            index = NO_INDEX
+        elif index is None:
+            index = NULL_INDEX
+        elif not NULL_INDEX < int(index) < 128:
+            raise ValueError(f"correct_index {index} が範囲外です")
+        else:
+            index = int(index)
+        self.correct_index.append(index)
+        self.usage.append(int(q.get("usage_count") or 0))
+
+        key = (q.get("subject", ""), q.get("genre_id", ""), q.get("genre_name", ""))
+        genre = self.genres.get(key)
+        if genre is None:
+            genre = self.genres[key] = len(self.genres)
+            if genre > 0xFFFF:
+                raise ValueError("ジャンルが多すぎます")
+        self.genre.append(genre)
+
+    def to_bytes(self) -> bytes:
+        meta = dict(self.meta, kind=self.kind, genres=[list(k) for k in self.genres])
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+
+        encoded = [s.encode("utf-8") for s in self.strings]
+        offsets = array("I", [0])
+        total = 0
+        for data in encoded:
+            total += len(data)
+            offsets.append(total)
+        if total >= NO_STRING:
+            raise ValueError("文字列の合計が 4GB を超えます")
+
+        parts = [HEADER.pack(MAGIC, VERSION, 0, len(self.usage), len(self.strings), len(meta_bytes)),
+                 meta_bytes]
+        sections = [offsets] + [self.columns[name] for name in STRING_COLUMNS] \
+            + [self.usage, self.genre, self.correct_index]
+        position = HEADER.size + len(meta_bytes)
+        for values in sections:
+            parts.append(_padding(position))
+            position += len(parts[-1])
+            parts.append(_little_endian(values))
+            position += len(parts[-1])
+        parts.append(_padding(position))
+        parts.extend(encoded)
+        return b"".join(parts)
+
+    def write(self, path: Path):
+        data = self.to_bytes()
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+class QuestionBank:
+    """mmap で開いた .qbank（問題は必要になったときに1問ずつ取り出す）
+
+    列は memoryview（配列の値をそのまま読む）、文字列は raw_string でコピーせずに
+    バイト列として読める。閉じるまで開いたファイルを参照する。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{self.path} は .qbank ではありません（空のファイル）") from None
+        self._views = []
+        self._strings = None
+        view = self._view(0, len(self._mmap))
+        try:
+            magic, version, _, count, string_count, meta_length = HEADER.unpack_from(view)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} は .qbank（バージョン {VERSION}）ではありません")
+        self.count = count
+        self.string_count = string_count
+        position = HEADER.size + meta_length
+        self.meta = json.loads(bytes(view[HEADER.size:position]))
+        self.kind = self.meta["kind"]
+        self.genres = [tuple(g) for g in self.meta["genres"]]
+
+        def column(typecode: str, length: int):
+            nonlocal position
+            position += -position % _ALIGN
+            size = array(typecode).itemsize * length
+            values = self._view(position, size).cast(typecode)
+            self._views.append(values)
+            position += size
+            if sys.byteorder != "little":
+                values = array(typecode, values)
+                values.byteswap()
+            return values
+
+        self.string_offsets = column("I", string_count + 1)
+        self.columns = {name: column("I", count * (CHOICE_COUNT if name == "choices" else 1))
+                        for name in STRING_COLUMNS}
+        self.usage = column("I", count)
+        self.genre = column("H", count)
+        self.correct_index = column("b", count)
+        self._blob = position + (-position % _ALIGN)
+
+    def _view(self, start: int, size: int) -> memoryview:
+        view = memoryview(self._mmap)[start:start + size]
+        self._views.append(view)
+        return view
+
+    def close(self):
+        # mmap を閉じる前に memoryview を解放する（残っていると BufferError になる）
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def raw_string(self, index: int) -> Optional[memoryview]:
+        """文字列番号 index の UTF-8 バイト列（コピーしない。close の前に release すること）"""
+        if index >= NULL_STRING:
+            return None
+        start = self._blob + self.string_offsets[index]
+        return memoryview(self._mmap)[start:self._blob + self.string_offsets[index + 1]]
+
+    def load_strings(self) -> list[str]:
+        """文字列テーブル全体を一度にデコードする（以降の string は同じ str を返す）"""
+        if self._strings is None:
+            offsets = self.string_offsets.tolist()
+            blob = self._mmap[self._blob:self._blob + offsets[-1]]
+            self._strings = [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return self._strings
+
+    def string(self, index: int):
+        """文字列番号 index の文字列（null は None、キーなしは _MISSING）"""
+        if index < NULL_STRING and self._strings is not None:
+            return self._strings[index]
+        if index == NO_STRING:
+            return _MISSING
+        raw = self.raw_string(index)
+        if raw is None:
+            return None
+        with raw:
+            return str(raw, "utf-8")
+
+    def question_text(self, i: int) -> Optional[str]:
+        text = self.string(self.columns["question_text"][i])
+        return None if text is _MISSING else text
+
+    def choices(self, i: int) -> list[Optional[str]]:
+        ids = self.columns["choices"][i * CHOICE_COUNT:(i + 1) * CHOICE_COUNT]
+        return [self.string(k) for k in ids if k != NO_STRING]
+
+    def question(self, i: int) -> dict:
+        """i 番目の問題（kind が book なら参考書 JSON の形、tsv なら import_questions.py で読んだ形）"""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        index = self.correct_index[i]
+        index = _MISSING if index == NO_INDEX else None if index == NULL_INDEX else index
+        ids = self.columns["choices"][i * CHOICE_COUNT:(i + 1) * CHOICE_COUNT]
+        if self.kind == "book":
+            extra = self.string(self.columns["extra"][i])
+            if extra is not _MISSING:
+                return json.loads(extra)
+            values = [self.string(self.columns["question_text"][i])] + [self.string(k) for k in ids] \
+                + [index, self.string(self.columns["hint"][i])]
+            return {k: v for k, v in zip(BOOK_KEYS, values) if v is not _MISSING}
+
+        subject, genre_id, genre_name = self.genres[self.genre[i]]
+        q = {"subject": subject, "genre_id": genre_id, "genre_name": genre_name}
+        for name in ("question_text", "choices", "correct_index", "correct_answer", "hint", "difficulty"):
+            if name == "choices":
+                q[name] = self.choices(i)
+            elif name == "correct_index":
+                q[name] = index
+            else:
+                q[name] = self.string(self.columns[name][i])
+        return {k: v for k, v in q.items() if v is not _MISSING}
+
+    def __iter__(self) -> Iterator[dict]:
+        """全問（文字列テーブルを先にデコードし、同じ文字列は同じ str を共有する）"""
+        self.load_strings()
+        return map(self.question, range(self.count))
+
+
+# ---- 変換 ----
+
+def pack(source: Path, output: Path) -> BankWriter:
+    """参考書 JSON / 生成済み TSV を .qbank にする"""
+    if is_book_file(source):
+        with open(source, "r", encoding="utf-8") as f:
+            book = json.load(f)
+        clash = [k for k in META_KEYS if k in book]
+        if clash:
+            raise ValueError(f"参考書のトップレベルに使えないキーがあります: {', '.join(clash)}")
+        writer = BankWriter("book", {k: v for k, v in book.items() if k != "questions"})
+        questions = book.get("questions", [])
+    elif source.suffix.lower() in iq.TSV_SUFFIXES:
+        writer = BankWriter("tsv")
+        questions = iq.iter_tsv(source)
+    else:
+        raise ValueError(f"参考書 JSON か TSV を指定してください: {source}")
+    for number, q in enumerate(questions, start=1):
+        try:
+            writer.add(q)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"問題 {number}: {e}") from None
+    writer.write(output)
+    return writer
+
+
+def unpack(bank: QuestionBank, output: Path):
+    """.qbank を元の形式（参考書 JSON / TSV）に戻す"""
+    if bank.kind == "book":
+        book = {k: v for k, v in bank.meta.items() if k not in META_KEYS}
+        book["questions"] = list(bank)
+        atomic_write_text(output, json.dumps(book, ensure_ascii=False, indent=2))
+        return
+    rows = []
+    for q in bank:
+        row = dict(q, choices=json.dumps(q["choices"], ensure_ascii=False))
+        if "correct_index" in row:
+            row["correct_index"] = str(row["correct_index"])
+        rows.append(row)
+    tmp = output.with_name(f".{output.name}.tmp")
+    write_tsv(rows, tmp)
+    os.replace(tmp, output)
+
+
+def default_output(source: Path, suffix: str) -> Path:
+    return source.with_suffix(suffix)
+
+
+# ---- ベンチマーク ----
+
+def current_rss() -> int:
+    """いまの RSS（バイト。Linux の /proc から。読めなければ ru_maxrss）"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(mode: str, path: Path) -> dict:
+    """1つの読み方の時間と RSS の増分（別プロセスで呼ぶ）"""
+    rss_before = current_rss()
+    started = time.perf_counter()
+    if mode == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        count = len(data["questions"])
+    elif mode == "tsv":
+        data = iq.load_tsv(path)
+        count = len(data)
+    elif mode == "bank-open":
+        data = QuestionBank(path)
+        count = len(data)
+        data.question(random.randrange(count))
+    elif mode == "bank-all":
+        data = QuestionBank(path)
+        questions = list(data)
+        count = len(questions)
+    else:
+        raise ValueError(mode)
+    elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "rss": current_rss() - rss_before, "count": count}
+
+
+def scaled_book(source: Path, scale: int, directory: Path) -> Path:
+    """参考書の問題を scale 回繰り返した参考書 JSON（問題文には番号を付けて別の文字列にする）"""
+    with open(source, "r", encoding="utf-8") as f:
+        book = json.load(f)
+    questions = book["questions"]
+    book["questions"] = [dict(q, question_text=f"{q.get('question_text', '')} ({n})")
+                         for n in range(scale) for q in questions]
+    path = directory / f"book_x{scale}.json"
+    path.write_text(json.dumps(book, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def run_measure(mode: str, path: Path, repeat: int) -> dict:
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, __file__, "_measure", mode, str(path)],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout))
+    return {"seconds": min(r["seconds"] for r in results),
+            "rss": min(r["rss"] for r in results), "count": results[0]["count"]}
+
+
+def run_bench(args):
+    source = Path(args.source)
+    text_mode = "json" if is_book_file(source) else "tsv"
+    print(f"入力: {source} / {args.repeat}回中の最小値（読み込みごとに別プロセス）")
+    print(f"\n{'倍率':>5} {'問題数':>8} {'元':>8} {'.qbank':>8} {'読込(元)':>10} {'RSS(元)':>9}"
+          f" {'開く':>8} {'RSS':>7} {'全問':>9} {'RSS':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for scale in args.scale:
+            path = source if scale == 1 or text_mode == "tsv" else scaled_book(source, scale, tmp)
+            bank_path = tmp / f"x{scale}{SUFFIX}"
+            pack(path, bank_path)
+            text = run_measure(text_mode, path, args.repeat)
+            opened = run_measure("bank-open", bank_path, args.repeat)
+            loaded = run_measure("bank-all", bank_path, args.repeat)
+            print(f"{scale:>5} {text['count']:>8,} {iq.format_bytes(path.stat().st_size):>8}"
+                  f" {iq.format_bytes(bank_path.stat().st_size):>8}"
+                  f" {text['seconds'] * 1000:>8.1f}ms {iq.format_bytes(text['rss']):>9}"
+                  f" {opened['seconds'] * 1000:>6.2f}ms {iq.format_bytes(opened['rss']):>7}"
+                  f" {loaded['seconds'] * 1000:>7.1f}ms {iq.format_bytes(loaded['rss']):>8}")
+            if text_mode == "tsv":
+                break
+    print(f"\n※ 読込(元): {'json.load' if text_mode == 'json' else 'import_questions.load_tsv'}"
+          " / 開く: mmap で開いて1問取り出す / 全問: 全問を dict にする")
+
+
+def print_info(bank: QuestionBank):
+    size = bank.path.stat().st_size
+    blob = size - bank._blob
+    print(f"{bank.path}: {bank.kind} / {bank.count}問 / {iq.format_bytes(size)}")
+    if bank.kind == "book":
+        print(f"  参考書: {bank.meta.get('subject', '')}_{bank.meta.get('title', '')}")
+    else:
+        print(f"  ジャンル: {len(bank.genres)}")
+    print(f"  文字列: {bank.string_count} ({iq.format_bytes(blob)}) / "
+          f"列・索引: {iq.format_bytes(bank._blob)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="問題データのバイナリ形式（.qbank）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pack", help="参考書 JSON / TSV を .qbank にする")
+    p.add_argument("inputs", nargs="+", type=Path)
+    p.add_argument("-o", "--output", type=Path, help="出力先（入力が1つのとき。省略時は拡張子を .qbank に）")
+
+    p = sub.add_parser("unpack", help=".qbank を参考書 JSON / TSV に戻す")
+    p.add_argument("input", type=Path)
+    p.add_argument("-o", "--output", type=Path, help="出力先（省略時は拡張子を .json / .tsv に）")
+
+    p = sub.add_parser("info", help=".qbank の概要")
+    p.add_argument("inputs", nargs="+", type=Path)
+
+    p = sub.add_parser("bench", help="json.load / TSV の読み込みと比べる")
+    p.add_argument("source", help="参考書 JSON または TSV")
+    p.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100],
+                   help="参考書の問題を何倍にして測るか (default: 1 10 100)")
+    p.add_argument("--repeat", type=int, default=3)
+
+    p = sub.add_parser("_measure")
+    p.add_argument("mode")
+    p.add_argument("path", type=Path)
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        if args.output and len(args.inputs) > 1:
+            parser.error("-o は入力が1つのときだけ指定できます")
+        for source in args.inputs:
+            output = args.output or default_output(source, SUFFIX)
+            started = time.perf_counter()
+            try:
+                writer = pack(source, output)
+            except (OSError, ValueError) as e:
+                print(f"エラー: {source}: {e}")
+                return 1
+            print(f"{source} → {output}: {len(writer.usage)}問 / 文字列 {len(writer.strings)} / "
+                  f"{iq.format_bytes(source.stat().st_size)} → {iq.format_bytes(output.stat().st_size)} "
+                  f"({time.perf_counter() - started:.2f}秒)")
+    elif args.command in ("unpack", "info"):
+        for path in ([args.input] if args.command == "unpack" else args.inputs):
+            try:
+                bank = QuestionBank(path)
+            except (OSError, ValueError) as e:
+                print(f"エラー: {e}")
+                return 1
+            with bank:
+                if args.command == "info":
+                    print_info(bank)
+                    continue
+                output = args.output or default_output(path, ".json" if bank.kind == "book" else ".tsv")
+                unpack(bank, output)
+                print(f"{path} → {output}: {bank.count}問")
+    elif args.command == "bench":
+        run_bench(args)
+    elif args.command == "_measure":
+        print(json.dumps(measure(args.mode, args.path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+問題データのローカルストア（SQLite）
+
+生成済みの TSV と参考書 JSON（data/ の create_book 形式）を SQLite に読み込み、
+スプレッドシート（GAS）のオフラインのミラーとして使う。
+GAS の読み取り（getQuestions / getGenres / getBookQuestions）は毎回シート全体を
+getValues() して走査するが、ここでは subject / genre_id / book_id /
+import_batch_id / usage_count のインデックスで同じ問い合わせをミリ秒で返す。
+
+行の同一性は (book_id, subject, genre_id, question_text) で決める
+（Questions シートの行は book_id が空）。それ以外の内容はハッシュにして持ち、
+import_questions.py --mirror で新規・変更された問題だけを送るのに使う。
+
+Usage:
+    python tools/question_store.py load data/generated/*.tsv "data/FINISH/*_shuffled.json"
+    python tools/question_store.py select --subject jp --count 10
+    python tools/question_store.py select --book "jp_中学入試でる順ポケでる国語 漢字・熟語 四訂版"
+    python tools/question_store.py genres --subject jp
+    python tools/question_store.py stats
+    python tools/question_store.py dups
+    python tools/question_store.py bench --rows 100000   # 全件走査との比較
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import import_questions as iq
+from question import book_questions
+
+
+# プロジェクトルート
+PROJECT_ROOT = Path(__file__).parent.parent
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "data" / "generated" / "questions.db"
+
+# 内容ハッシュに含めるフィールド（同一性のキーと、GAS が採番する question_id 以外）
+CONTENT_FIELDS = ["genre_name", "choices", "correct_index", "correct_answer", "hint", "difficulty"]
+
+# 読み込み時に1回のトランザクションで書く行数
+LOAD_CHUNK_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    book_id TEXT NOT NULL DEFAULT '',        -- 参考書シート名（Questions シートの行は空）
+    question_id TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL,
+    genre_id TEXT NOT NULL DEFAULT '',
+    genre_name TEXT NOT NULL DEFAULT '',
+    question_text TEXT NOT NULL,
+    choices TEXT NOT NULL,                   -- JSON 配列
+    correct_index INTEGER NOT NULL,
+    correct_answer TEXT NOT NULL DEFAULT '',
+    hint TEXT NOT NULL DEFAULT '',
+    difficulty TEXT NOT NULL DEFAULT '',
+    import_batch_id TEXT NOT NULL DEFAULT '',
+    usage_count INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    UNIQUE (book_id, subject, genre_id, question_text)
+);
+-- 出題（usage_count の少ない順）はフィルタ列 + book_id + usage_count の順で引く
+CREATE INDEX IF NOT EXISTS idx_questions_subject ON questions (subject, book_id, usage_count);
+CREATE INDEX IF NOT EXISTS idx_questions_genre ON questions (genre_id, book_id, usage_count);
+CREATE INDEX IF NOT EXISTS idx_questions_book ON questions (book_id, usage_count);
+CREATE INDEX IF NOT EXISTS idx_questions_batch ON questions (import_batch_id, book_id, usage_count);
+CREATE INDEX IF NOT EXISTS idx_questions_usage ON questions (usage_count);
+-- 重複検出は問題文のインデックスだけで数える
+CREATE INDEX IF NOT EXISTS idx_questions_text ON questions (question_text);
+"""
+
+COLUMNS = ["book_id", "question_id", "subject", "genre_id", "genre_name", "question_text",
+           "choices", "correct_index", "correct_answer", "hint", "difficulty",
+           "import_batch_id", "usage_count", "content_hash", "source"]
+
+
+def row_key(q: dict) -> tuple[str, str, str, str]:
+    """行の同一性のキー (book_id, subject, genre_id, question_text)"""
+    return (q.get("book_id") or "", q.get("subject") or "", q.get("genre_id") or "",
+            q.get("question_text") or "")
+
+
+def content_hash(q: dict) -> str:
+    """キー以外の内容のハッシュ（変更の検出用）"""
+    content = {field: q.get(field) for field in CONTENT_FIELDS}
+    if isinstance(content["choices"], str):
+        content["choices"] = json.loads(content["choices"])
+    if content["correct_index"] is not None:
+        content["correct_index"] = int(content["correct_index"])
+    content = {k: ("" if v is None else v) for k, v in content.items()}
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def iter_book(book: dict) -> Iterator[dict]:
+    """参考書 JSON（create_book 形式）の問題を、ストアの行の形で返す
+
+    question_id は GAS の createBook と同じく1始まりの連番。
+    correct_index は参考書全体の値から 0始まりか 1始まりかを決めて 0始まりにそろえる
+    （1〜3 だけの参考書はシャッフル済みとみなして 0始まり）。決められなければ ValueError。
+    """
+    subject = book["subject"]
+    book_id = f"{subject}_{book['title']}"
+    _, questions = book_questions(book, default_base=0)
+    for number, q in enumerate(questions, start=1):
+        yield {
+            "book_id": book_id,
+            "question_id": str(number),
+            "subject": subject,
+            "question_text": q.question_text,
+            "choices": q.choices,
+            "correct_index": q.correct_index,
+            "correct_answer": q.correct_answer,
+            "hint": q.hint,
+        }
+
+
+def is_book_file(path: Path) -> bool:
+    """JSON ファイルが参考書（create_book 形式のオブジェクト）かどうか"""
+    if path.suffix.lower() != ".json":
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(4096).lstrip("\ufeff \t\r\n")
+    return head.startswith("{")
+
+
+def iter_file(path: Path) -> Iterator[dict]:
+    """TSV / JSON / NDJSON / 参考書 JSON を読んで行を返す"""
+    if is_book_file(path):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_book(json.load(f))
+        return
+    loader = iq.question_loader(path)
+    if loader is None:
+        raise ValueError(f"サポートされていないファイル形式です: {path}")
+    yield from loader(path)
+
+
+class QuestionStore:
+    """問題データの SQLite ストア"""
+
+    def __init__(self, path: Path = DEFAULT_DB_PATH):
+        self.path = Path(path)
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.conn:
+            yield self.conn
+
+    # ---- 読み込み・差分 ----
+
+    def lookup_hash(self, q: dict) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT content_hash FROM questions "
+            "WHERE book_id = ? AND subject = ? AND genre_id = ? AND question_text = ?",
+            row_key(q)).fetchone()
+        return row[0] if row else None
+
+    def diff(self, questions: Iterable[dict]) -> Iterator[tuple[str, dict, str]]:
+        """questions を ("new" | "changed" | "same", 問題, 内容ハッシュ) に分類して返す"""
+        for q in questions:
+            stored = self.lookup_hash(q)
+            digest = content_hash(q)
+            if stored is None:
+                yield "new", q, digest
+            elif stored != digest:
+                yield "changed", q, digest
+            else:
+                yield "same", q, digest
+
+    def upsert(self, questions: Iterable[dict], source: str = "",
+               import_batch_id: Optional[str] = None) -> dict[str, int]:
+        """questions を追加・更新し、new / changed / same の件数を返す
+
+        usage_count と import_batch_id は既存の値を残す（import_batch_id を渡した場合は上書き）。
+        """
+        counts = {"new": 0, "changed": 0, "same": 0}
+        chunk = []
+        for status, q, digest in self.diff(questions):
+            counts[status] += 1
+            if status != "same" or import_batch_id is not None:
+                chunk.append(self._to_row(q, digest, source, import_batch_id))
+            if len(chunk) >= LOAD_CHUNK_SIZE:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+        if counts["new"] + counts["changed"]:
+            self.conn.execute("PRAGMA optimize")
+        return counts
+
+    def _to_row(self, q: dict, digest: str, source: str,
+                import_batch_id: Optional[str]) -> tuple:
+        choices = q.get("choices")
+        if not isinstance(choices, str):
+            choices = json.dumps(choices, ensure_ascii=False)
+        values = {
+            "book_id": q.get("book_id") or "",
+            "question_id": str(q.get("question_id") or ""),
+            "subject": q.get("subject") or "",
+            "genre_id": q.get("genre_id") or "",
+            "genre_name": q.get("genre_name") or "",
+            "question_text": q.get("question_text") or "",
+            "choices": choices,
+            "correct_index": int(q.get("correct_index") or 0),
+            "correct_answer": str(q.get("correct_answer") or ""),
+            "hint": q.get("hint") or "",
+            "difficulty": str(q.get("difficulty") or ""),
+            "import_batch_id": import_batch_id if import_batch_id is not None
+                               else (q.get("import_batch_id") or ""),
+            "usage_count": int(q.get("usage_count") or 0),
+            "content_hash": digest,
+            "source": source,
+        }
+        return tuple(values[c] for c in COLUMNS)
+
+    def _write(self, rows: list[tuple]):
+        updates = ", ".join(f"{c} = excluded.{c}" for c in COLUMNS
+                            if c not in ("usage_count", "import_batch_id"))
+        sql = (f"INSERT INTO questions ({', '.join(COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(COLUMNS))}) "
+               f"ON CONFLICT (book_id, subject, genre_id, question_text) DO UPDATE SET {updates}, "
+               f"import_batch_id = CASE WHEN excluded.import_batch_id = '' "
+               f"THEN import_batch_id ELSE excluded.import_batch_id END")
+        with self.transaction() as conn:
+            conn.executemany(sql, rows)
+
+    def load_file(self, path: Path) -> dict[str, int]:
+        return self.upsert(iter_file(path), source=str(path))
+
+    # ---- 問い合わせ（GAS の読み取りと同じ結果） ----
+
+    def _filters(self, subject: Optional[str], genre_id: Optional[str],
+                 batch_id: Optional[str], book_id: Optional[str]) -> tuple[str, list]:
+        clauses = ["book_id = ?"]
+        params = [book_id or ""]
+        if subject and subject != "all":
+            clauses.append("subject = ?")
+            params.append(subject)
+        if genre_id:
+            clauses.append("genre_id = ?")
+            params.append(genre_id)
+        if batch_id:
+            clauses.append("import_batch_id = ?")
+            params.append(batch_id)
+        return " AND ".join(clauses), params
+
+    def select_questions(self, subject: Optional[str] = "all", genre_id: Optional[str] = None,
+                         batch_id: Optional[str] = None, book_id: Optional[str] = None,
+                         count: int = 10, increment: bool = False) -> list[dict]:
+        """usage_count の少ない順に count 問選ぶ（同じ usage_count の中はランダム）
+
+        getQuestions（book_id 省略時）/ getBookQuestions と同じ選び方。全件を
+        並べ替えず、インデックスで count 問目の usage_count を求めてから、それより
+        少ない行と、同じ値の行からのランダムな抜き出しを合わせる。
+        increment=True で選んだ問題の usage_count を +1 する。
+        """
+        if count <= 0:
+            return []
+        where, params = self._filters(subject, genre_id, batch_id, book_id)
+        row = self.conn.execute(
+            f"SELECT usage_count FROM questions WHERE {where} "
+            f"ORDER BY usage_count LIMIT 1 OFFSET ?", params + [count - 1]).fetchone()
+        if row is None:
+            # count 問に満たない場合は全件
+            rows = self.conn.execute(
+                f"SELECT * FROM questions WHERE {where} ORDER BY usage_count", params).fetchall()
+            rows = self._shuffle_ties(rows)
+        else:
+            threshold = row[0]
+            rows = self.conn.execute(
+                f"SELECT * FROM questions WHERE {where} AND usage_count < ? "
+                f"ORDER BY usage_count", params + [threshold]).fetchall()
+            rows = self._shuffle_ties(rows)
+            # 同じ usage_count の行からは id だけをインデックスで抜き出してから読む
+            ids = self.conn.execute(
+                f"SELECT id FROM questions WHERE {where} AND usage_count = ? "
+                f"ORDER BY random() LIMIT ?", params + [threshold, count - len(rows)]).fetchall()
+            rows += self.conn.execute(
+                f"SELECT * FROM questions WHERE id IN ({', '.join('?' * len(ids))})",
+                [r[0] for r in ids]).fetchall()
+
+        selected = [dict(r) for r in rows]
+        if increment and selected:
+            with self.transaction() as conn:
+                conn.executemany("UPDATE questions SET usage_count = usage_count + 1 WHERE id = ?",
+                                 [(q["id"],) for q in selected])
+        return selected
+
+    @staticmethod
+    def _shuffle_ties(rows: list) -> list:
+        """usage_count 順の行を、同じ usage_count の中だけシャッフルする"""
+        result = []
+        group = []
+        for r in rows:
+            if group and group[0]["usage_count"] != r["usage_count"]:
+                random.shuffle(group)
+                result += group
+                group = []
+            group.append(r)
+        random.shuffle(group)
+        return result + group
+
+    def genres(self, subject: str) -> list[dict]:
+        """教科のジャンル一覧と問題数（getGenres と同じ）"""
+        # 件数は UNIQUE (book_id, subject, genre_id, ...) のインデックスだけで数え、
+        # ジャンル名はジャンルごとに1行だけ読む
+        counts = self.conn.execute(
+            "SELECT genre_id, COUNT(*) FROM questions WHERE book_id = '' AND subject = ? "
+            "GROUP BY genre_id ORDER BY genre_id", (subject,)).fetchall()
+        genres = []
+        for genre_id, n in counts:
+            name = self.conn.execute(
+                "SELECT genre_name FROM questions WHERE book_id = '' AND subject = ? "
+                "AND genre_id = ? LIMIT 1", (subject, genre_id)).fetchone()[0]
+            genres.append({"genre_id": genre_id, "genre_name": name, "count": n})
+        return genres
+
+    def stats(self) -> dict:
+        """教科・参考書・インポートバッチ別の問題数と usage_count の分布"""
+        def grouped(sql: str) -> dict:
+            return {r[0]: r[1] for r in self.conn.execute(sql)}
+
+        return {
+            "total": self.conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0],
+            "by_subject": grouped("SELECT subject, COUNT(*) FROM questions GROUP BY subject"),
+            "by_book": grouped("SELECT book_id, COUNT(*) FROM questions "
+                               "WHERE book_id != '' GROUP BY book_id"),
+            "by_batch": grouped("SELECT import_batch_id, COUNT(*) FROM questions "
+                                "WHERE import_batch_id != '' GROUP BY import_batch_id"),
+            "by_usage": grouped("SELECT usage_count, COUNT(*) FROM questions GROUP BY usage_count"),
+        }
+
+    def duplicates(self, limit: int = 100) -> list[dict]:
+        """問題文が同じ行のグループ（参考書・ジャンルをまたいだ重複も含む）"""
+        # 重複する問題文をインデックスだけで数えてから、その行の場所を読む
+        texts = self.conn.execute(
+            "SELECT question_text, COUNT(*) AS count FROM questions GROUP BY question_text "
+            "HAVING COUNT(*) > 1 ORDER BY count DESC LIMIT ?", (limit,)).fetchall()
+        result = []
+        for text, n in texts:
+            places = self.conn.execute(
+                "SELECT book_id || ':' || genre_id FROM questions WHERE question_text = ?",
+                (text,)).fetchall()
+            result.append({"question_text": text, "count": n,
+                           "places": " ".join(p[0] for p in places)})
+        return result
+
+    def all_rows(self) -> list[dict]:
+        return [dict(r) for r in self.conn.execute("SELECT * FROM questions ORDER BY id")]
+
+
+# ---- 全件走査（GAS の getDataRange().getValues() と同じやり方）との比較 ----
+
+def scan_select(values: list[dict], subject: str, genre_id: Optional[str],
+                count: int) -> list[dict]:
+    """getQuestions と同じく全行を走査し、usage_count でグループ分けしてシャッフル"""
+    matched = [q for q in values if q["book_id"] == ""
+               and (subject == "all" or q["subject"] == subject)
+               and (not genre_id or q["genre_id"] == genre_id)]
+    groups: dict[int, list] = {}
+    for q in matched:
+        groups.setdefault(q["usage_count"], []).append(q)
+    result = []
+    for key in sorted(groups):
+        random.shuffle(groups[key])
+        result += groups[key]
+    return result[:count]
+
+
+def scan_genres(values: list[dict], subject: str) -> list[dict]:
+    genres: dict[str, dict] = {}
+    for q in values:
+        if q["subject"] == subject and q["book_id"] == "":
+            g = genres.setdefault(q["genre_id"], {"genre_id": q["genre_id"],
+                                                  "genre_name": q["genre_name"], "count": 0})
+            g["count"] += 1
+    return list(genres.values())
+
+
+def scan_duplicates(values: list[dict]) -> list[str]:
+    seen: dict[str, int] = {}
+    for q in values:
+        seen[q["question_text"]] = seen.get(q["question_text"], 0) + 1
+    return [text for text, n in seen.items() if n > 1]
+
+
+def iter_fake_rows(count: int, seed: int = 0) -> Iterator[dict]:
+    """ベンチマーク用の疑似データ（4教科・80ジャンル・一部は参考書の行）"""
+    rng = random.Random(seed)
+    subjects = ["jp", "math", "sci", "soc"]
+    for i in range(count):
+        subject = subjects[i % 4]
+        choices = [f"選択肢{i}_{k}" for k in range(4)]
+        index = i % 4
+        yield {
+            "book_id": f"{subject}_参考書{i % 5}" if i % 10 == 0 else "",
+            "question_id": f"{subject.upper()[:2]}{i % 20 + 1:02d}_{i:06d}",
+            "subject": subject,
+            "genre_id": f"{subject.upper()[:2]}{i % 20 + 1:02d}",
+            "genre_name": f"ジャンル{i % 20 + 1}",
+            "question_text": f"問題{i % (count - count // 50)}：次のうち正しいものを選びなさい。",
+            "choices": choices,
+            "correct_index": index,
+            "correct_answer": choices[index],
+            "hint": "ヒント",
+            "difficulty": "normal",
+            "import_batch_id": f"batch_{i % 30:02d}",
+            "usage_count": rng.randrange(5),
+        }
+
+
+def time_ms(func, repeat: int) -> float:
+    """repeat 回実行した最速値（ミリ秒）"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_bench(store: QuestionStore, rows: int, repeat: int):
+    if rows:
+        started = time.perf_counter()
+        counts = store.upsert(iter_fake_rows(rows), source="bench")
+        print(f"疑似データ {rows}行を読み込み: {time.perf_counter() - started:.2f}秒 {counts}")
+
+    values = store.all_rows()
+    print(f"行数: {len(values)} / {repeat}回中の最速値")
+    genre = next((q["genre_id"] for q in values if q["genre_id"] and not q["book_id"]), None)
+    cases = [
+        ("select subject=jp", lambda: store.select_questions("jp", count=10),
+         lambda: scan_select(values, "jp", None, 10)),
+        (f"select genre={genre}", lambda: store.select_questions("all", genre_id=genre, count=10),
+         lambda: scan_select(values, "all", genre, 10)),
+        ("genres subject=jp", lambda: store.genres("jp"), lambda: scan_genres(values, "jp")),
+        ("duplicates", lambda: store.duplicates(), lambda: scan_duplicates(values)),
+    ]
+    print(f"\n{'問い合わせ':<24} {'全件走査':>10} {'SQLite':>10} {'速度比':>8}")
+    for name, indexed, scan in cases:
+        scan_ms = time_ms(scan, repeat)
+        indexed_ms = time_ms(indexed, repeat)
+        ratio = scan_ms / indexed_ms if indexed_ms else 0
+        print(f"{name:<24} {scan_ms:>8.2f}ms {indexed_ms:>8.2f}ms {ratio:>7.1f}x")
+    print("\n※ 全件走査はメモリ上の行を走査する時間のみ（GAS ではこれに getValues() の読み込みが加わる）")
+
+
+def expand_paths(patterns: list[str]) -> list[Path]:
+    paths = []
+    for pattern in patterns:
+        matched = sorted(Path().glob(pattern)) if any(c in pattern for c in "*?[") else [Path(pattern)]
+        paths.extend(matched)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="問題データのローカルストア（SQLite）")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH,
+                        help=f"データベースファイル (default: {DEFAULT_DB_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("load", help="TSV / JSON / NDJSON / 参考書 JSON を読み込む")
+    p.add_argument("files", nargs="+", help="ファイル（グロブ可）")
+
+    p = sub.add_parser("select", help="出題する問題を選ぶ（getQuestions / getBookQuestions と同じ）")
+    p.add_argument("--subject", default="all")
+    p.add_argument("--genre")
+    p.add_argument("--batch")
+    p.add_argument("--book")
+    p.add_argument("--count", type=int, default=10)
+    p.add_argument("--increment", action="store_true", help="選んだ問題の usage_count を +1 する")
+
+    p = sub.add_parser("genres", help="ジャンル一覧（getGenres と同じ）")
+    p.add_argument("--subject", required=True)
+
+    sub.add_parser("stats", help="教科・参考書・バッチ別の問題数")
+
+    p = sub.add_parser("dups", help="問題文が重複している行")
+    p.add_argument("--limit", type=int, default=20)
+
+    p = sub.add_parser("bench", help="インデックス付きの問い合わせと全件走査を比べる")
+    p.add_argument("--rows", type=int, default=0, help="先に読み込む疑似データの行数")
+    p.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+
+    with QuestionStore(args.db) as store:
+        if args.command == "load":
+            for path in expand_paths(args.files):
+                started = time.perf_counter()
+                try:
+                    counts = store.load_file(path)
+                except ValueError as e:
+                    print(f"{path}: エラー: {e}")
+                    continue
+                print(f"{path}: 新規 {counts['new']} / 変更 {counts['changed']} / "
+                      f"変更なし {counts['same']} ({time.perf_counter() - started:.2f}秒)")
+        elif args.command == "select":
+            for q in store.select_questions(args.subject, args.genre, args.batch, args.book,
+                                            args.count, args.increment):
+                place = q["book_id"] or q["genre_id"]
+                print(f"[{place}] (usage {q['usage_count']}) {q['question_text']}")
+        elif args.command == "genres":
+            for g in store.genres(args.subject):
+                print(f"{g['genre_id']}\t{g['genre_name']}\t{g['count']}問")
+        elif args.command == "stats":
+            stats = store.stats()
+            print(f"問題数: {stats['total']}")
+            for title, key in (("教科別", "by_subject"), ("参考書別", "by_book"),
+                               ("インポートバッチ別", "by_batch"), ("usage_count 別", "by_usage")):
+                if stats[key]:
+                    print(f"\n{title}:")
+                    for name, n in sorted(stats[key].items()):
+                        print(f"  {name}: {n}")
+        elif args.command == "dups":
+            for d in store.duplicates(args.limit):
+                print(f"{d['count']}件: {d['question_text']}  ({d['places']})")
+        elif args.command == "bench":
+            run_bench(store, args.rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
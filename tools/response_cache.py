@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+生成チャンクのレスポンスキャッシュ（コンテンツアドレス方式）
+
+システムインストラクション・モデルID・モード・チャンクJSON・temperature・
+プロンプト形式のハッシュをキーに、モデルの生レスポンスをディスクに保存する。
+再実行時はキャッシュヒットしたチャンクを API に送らずに済む。
+
+レイアウト:
+    {cache_dir}/{key[:2]}/{key}.txt
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+# 書き込み途中の一時ファイル（*.tmp）は、最後の書き込みからこの秒数が過ぎたら
+# 中断で残ったものとみなして evict で削除する
+STALE_TEMP_SECONDS = 3600
+
+
+def make_cache_key(system_instruction: str, model_id: str, mode: str,
+                   genre_id: str, items: list[dict], temperature: float,
+                   prompt_format: str = "") -> str:
+    """キャッシュキー（SHA-256 の16進文字列）を作る
+
+    prompt_format はチャンクをプロンプトに埋め込む形式（形式が違えば別のプロンプトになる）。
+    """
+    payload = json.dumps({
+        "system_instruction": system_instruction,
+        "model_id": model_id,
+        "mode": mode,
+        "genre_id": genre_id,
+        "chunk": items,
+        "temperature": temperature,
+        "prompt_format": prompt_format,
+    }, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """ディスク上のレスポンスキャッシュ
+
+    refresh=True の場合は既存エントリを読まずに上書きする（再取得モード）。
+    エビクションは max_age_days より古いエントリを削除し、さらに合計サイズが
+    max_bytes を超えていれば最終アクセスが古い順に削除する。
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS, refresh: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュ済みレスポンスを返す（なければ None）"""
+        path = self._path(key)
+        text = None
+        if not self.refresh:
+            try:
+                text = path.read_text(encoding="utf-8")
+                # 最終アクセス時刻を更新（LRU エビクション用）
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        """レスポンスを保存（一時ファイル + rename でアトミックに書く）"""
+        entry = self.open_entry(key)
+        try:
+            entry.write(text)
+        except BaseException:
+            entry.discard()
+            raise
+        entry.commit()
+
+    def open_entry(self, key: str) -> "CacheEntryWriter":
+        """ストリーミングで届くレスポンスを少しずつ書き込むエントリを開く"""
+        return CacheEntryWriter(self, key)
+
+    def _stored(self):
+        with self._lock:
+            self.stores += 1
+
+    def evict(self) -> int:
+        """サイズ・経過日数の上限を超えたエントリを削除し、削除数を返す
+
+        中断で残った古い一時ファイルも削除する（削除数には数えない）。
+        """
+        if not self.cache_dir.exists():
+            return 0
+
+        now = time.time()
+        for path in self.cache_dir.glob("*/*.tmp"):
+            try:
+                if now - path.stat().st_mtime > STALE_TEMP_SECONDS:
+                    path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+
+        max_age = self.max_age_days * 86400
+        entries = []
+        removed = 0
+        for path in self.cache_dir.glob("*/*.txt"):
+            stat = path.stat()
+            if max_age > 0 and now - stat.st_mtime > max_age:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes > 0 and total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                path.unlink(missing_ok=True)
+                removed += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+        self.evicted += removed
+        return removed
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return (f"ヒット {self.hits} / ミス {self.misses} ({rate:.1f}%)、"
+                f"保存 {self.stores}、削除 {self.evicted}")
+
+
+class CacheEntryWriter:
+    """書き込み途中のキャッシュエントリ
+
+    write() で一時ファイルに追記し、commit() で確定（rename）、discard() で破棄する。
+    """
+
+    def __init__(self, cache: ResponseCache, key: str):
+        self._cache = cache
+        self._path = cache._path(key)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=self._path.parent, suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, text: str):
+        self._file.write(text)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._tmp, self._path)
+        self._cache._stored()
+
+    def discard(self):
+        self._file.close()
+        Path(self._tmp).unlink(missing_ok=True)
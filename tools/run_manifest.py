@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+生成ランのマニフェスト（チェックポイント）
+
+ファイルごと・チャンクごとの状態（pending / ok / failed）、問題数、レイテンシ、
+レスポンスのバイト数を JSON に記録する。--resume で中断したランを
+続きから再開するために使う。
+
+形式:
+    {
+      "version": 1,
+      "settings": {"mode": "max", "chunk_size": 20},
+      "files": {
+        "JP01": {
+          "source": "KNOWLEDGE/jp/JP01.json", "source_hash": "...",
+          "output": "data/generated/JP01.tsv", "status": "ok", "questions": 120,
+          "chunks": {"1": {"status": "ok", "questions": 12, "latency": 8.3, "bytes": 5120}}
+        }
+      }
+    }
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+MANIFEST_VERSION = 1
+
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+
+
+def atomic_write_text(path: Path, text: str):
+    """一時ファイルに書いてから rename する（途中で落ちても壊れたファイルを残さない）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def file_hash(path: Path) -> str:
+    """ファイル内容の SHA-256（大きなファイルも少しずつ読む）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """生成ランの状態を保持し、更新のたびにアトミックに保存する"""
+
+    def __init__(self, path: Path, data: dict):
+        self.path = Path(path)
+        self.data = data
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, path: Path, settings: dict, resume: bool) -> "RunManifest":
+        """マニフェストを開く
+
+        resume=True かつ既存マニフェストの設定（モード・チャンク分割）が一致する場合は
+        それを引き継ぐ。それ以外は新規に作成する。
+        """
+        path = Path(path)
+        if resume and path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and data.get("settings") == settings:
+                return cls(path, data)
+            print(f"警告: マニフェストの設定が現在の引数と異なるため新規に開始します: {path}")
+
+        now = datetime.now().isoformat(timespec="seconds")
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": settings,
+            "started_at": now,
+            "updated_at": now,
+            "files": {},
+        }
+        manifest = cls(path, data)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        with self._lock:
+            self.data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+            atomic_write_text(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
+
+    def register_file(self, genre_id: str, source: Path, output: Path,
+                      total_chunks: int) -> dict:
+        """ファイルを登録する。入力が変わっていればチャンク状態をリセットする"""
+        source_hash = file_hash(source)
+        with self._lock:
+            entry = self.data["files"].get(genre_id)
+            if (entry is None or entry.get("source_hash") != source_hash
+                    or len(entry.get("chunks", {})) != total_chunks):
+                entry = {
+                    "source": str(source),
+                    "source_hash": source_hash,
+                    "output": str(output),
+                    "status": PENDING,
+                    "questions": 0,
+                    "chunks": {str(i): {"status": PENDING}
+                               for i in range(1, total_chunks + 1)},
+                }
+                self.data["files"][genre_id] = entry
+            self.save()
+            return entry
+
+    def file_status(self, genre_id: str) -> str:
+        with self._lock:
+            return self.data["files"][genre_id]["status"]
+
+    def chunk(self, genre_id: str, index: int) -> dict:
+        with self._lock:
+            return dict(self.data["files"][genre_id]["chunks"][str(index)])
+
+    def update_chunk(self, genre_id: str, index: int, status: str, **fields):
+        with self._lock:
+            chunk = {"status": status}
+            chunk.update(fields)
+            self.data["files"][genre_id]["chunks"][str(index)] = chunk
+            self.save()
+
+    def finish_file(self, genre_id: str, questions: int):
+        """ファイル完了を記録（失敗チャンクがあれば failed）"""
+        with self._lock:
+            entry = self.data["files"][genre_id]
+            statuses = [c["status"] for c in entry["chunks"].values()]
+            entry["status"] = OK if all(s == OK for s in statuses) else FAILED
+            entry["questions"] = questions
+            self.save()
+            return entry["status"]
+
+    def summary(self) -> dict[str, int]:
+        """チャンク状態ごとの件数"""
+        counts = {PENDING: 0, OK: 0, FAILED: 0}
+        with self._lock:
+            for entry in self.data["files"].values():
+                for chunk in entry["chunks"].values():
+                    counts[chunk["status"]] = counts.get(chunk["status"], 0) + 1
+        return counts
+
+
+def default_manifest_path(output_dir: Path) -> Path:
+    return Path(output_dir) / ".manifest.json"
+
+
+def parts_dir(output_dir: Path, genre_id: str) -> Path:
+    """チャンク単位の中間TSVを置くディレクトリ"""
+    return Path(output_dir) / ".parts" / genre_id
+
+
+def part_path(output_dir: Path, genre_id: str, index: int) -> Path:
+    return parts_dir(output_dir, genre_id) / f"{index:04d}.tsv"
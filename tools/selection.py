@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+出題する問題の選択（usage_count の少ない順、同じ値の中はランダム）
+
+GAS の getQuestions / getBookQuestions は、シート全体を読んで usage_count ごとに
+グループに分け、全グループをシャッフルして concat でつないでから先頭 count 問を取る
+（sortByUsageCountWithShuffle）。ここでは同じ結果の分布になる選び方を、
+全体を並べ替えずに行う。
+
+    1. usage_count ごとの件数を数え、count 問目が入る値（しきい値）を求める
+    2. しきい値より少ない問題は全部選ぶ（count 問未満）
+    3. しきい値と同じ問題からは、足りない数だけランダムに抜き出す
+
+シャッフルするのは選んだ問題だけで、しきい値の値を持つ問題が多くても
+抜き出す数に比例した手間しかかからない。
+
+Usage:
+    python tools/selection.py bench                          # 10k / 100k / 1M 問で従来の方法と比べる
+    python tools/selection.py bench --sizes 10000 100000 --count 40 --repeat 5
+    python tools/selection.py select --book "jp_中学入試でる順ポケでる国語 漢字・熟語 四訂版" --count 10
+"""
+
+import argparse
+import heapq
+import random
+import time
+from collections import Counter
+from itertools import compress, count as counter, islice, repeat
+from operator import eq, gt
+from pathlib import Path
+from typing import Sequence
+
+from question_store import DEFAULT_DB_PATH, QuestionStore
+
+# ベンチマークの問題数
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# ベンチマークの usage_count の分布
+#   fresh:   全問 0（取り込み直後。しきい値の値を持つ問題が全体になる）
+#   uniform: 0〜20 に一様
+#   worn:    ほとんどが何度も出題済みで、0 は 1%
+DISTRIBUTIONS = ["fresh", "uniform", "worn"]
+
+
+def usage_of(q: dict):
+    """GAS の `q.usage_count || 0` と同じ（空欄は 0）"""
+    return q.get("usage_count") or 0
+
+
+def select_indexes(usages: Sequence, count: int, rng: random.Random = random) -> list[int]:
+    """usage_count の少ない順に count 個の位置を選ぶ（同じ値の中はランダムな順）
+
+    usages は問題ごとの usage_count（空欄は 0 にしておく）。
+    戻り値は usage_count の昇順で、同じ値の中はランダムに並ぶ。
+    """
+    n = len(usages)
+    if count <= 0 or n == 0:
+        return []
+    if count >= n:
+        order = list(range(n))
+        rng.shuffle(order)
+        order.sort(key=usages.__getitem__)
+        return order
+
+    # count 問目が入る usage_count（しきい値）と、それより少ない問題の数
+    counts = Counter(usages)
+    below = 0
+    for threshold in sorted(counts):
+        if below + counts[threshold] >= count:
+            break
+        below += counts[threshold]
+
+    # しきい値より少ない問題は全部（値ごとにまとめ、同じ値の中はランダム）
+    chosen = []
+    if below:
+        chosen = list(compress(range(n), map(gt, repeat(threshold, n), usages)))
+        rng.shuffle(chosen)
+        chosen.sort(key=usages.__getitem__)
+
+    # しきい値と同じ問題から need 問。何番目のものを選ぶかを先に決め、
+    # 位置の一覧は作らずに islice で読み飛ばす
+    need = count - below
+    ranks = rng.sample(range(counts[threshold]), need)
+    ties = compress(counter(), map(eq, usages, repeat(threshold, n)))
+    picked = {}
+    position = -1
+    for rank in sorted(ranks):
+        picked[rank] = next(islice(ties, rank - position - 1, None))
+        position = rank
+    return chosen + [picked[rank] for rank in ranks]
+
+
+def select_least_used(questions: Sequence[dict], count: int,
+                      rng: random.Random = random) -> list[dict]:
+    """usage_count の少ない順に count 問選ぶ（sortByUsageCountWithShuffle + slice と同じ分布）"""
+    usages = [q.get("usage_count") or 0 for q in questions]
+    return [questions[i] for i in select_indexes(usages, count, rng)]
+
+
+def select_heap(questions: Sequence[dict], count: int,
+                rng: random.Random = random) -> list[dict]:
+    """比較用: (usage_count, 乱数) をキーにした heapq.nsmallest（全問に乱数を振る）"""
+    random_key = rng.random
+    return heapq.nsmallest(count, questions, key=lambda q: (usage_of(q), random_key()))
+
+
+def js_shuffle(array: list, rng: random.Random = random) -> list:
+    """GAS の shuffle（コピーしてから Fisher-Yates）"""
+    arr = list(array)
+    for i in range(len(arr) - 1, 0, -1):
+        j = int(rng.random() * (i + 1))
+        arr[i], arr[j] = arr[j], arr[i]
+    return arr
+
+
+def legacy_select(questions: Sequence[dict], count: int,
+                  rng: random.Random = random) -> list[dict]:
+    """比較用: GAS の sortByUsageCountWithShuffle と slice(0, count) をそのまま移したもの"""
+    groups = {}
+    for q in questions:
+        key = usage_of(q)
+        if key not in groups:
+            groups[key] = []
+        groups[key].append(q)
+
+    # 各グループをシャッフルして、usage_count 昇順で結合（concat は毎回新しい配列を作る）
+    result = []
+    for key in sorted(groups):
+        result = result + js_shuffle(groups[key], rng)
+    return result[:count]
+
+
+def make_questions(size: int, distribution: str, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    if distribution == "fresh":
+        usages = [0] * size
+    elif distribution == "uniform":
+        usages = [rng.randint(0, 20) for _ in range(size)]
+    elif distribution == "worn":
+        usages = [0 if rng.random() < 0.01 else rng.randint(5, 50) for _ in range(size)]
+    else:
+        raise ValueError(f"不明な分布: {distribution}")
+    return [{"row_index": i + 2, "question_id": f"Q{i:07d}", "usage_count": u}
+            for i, u in enumerate(usages)]
+
+
+def best_of(repeat_count: int, func) -> tuple[float, object]:
+    best = None
+    result = None
+    for _ in range(repeat_count):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def check_uniform(trials: int = 20000, seed: int = 0) -> float:
+    """しきい値と同じ問題の抜き出しが一様か（各問題が選ばれた回数の、期待値からの最大のずれ）"""
+    rng = random.Random(seed)
+    questions = [{"usage_count": u} for u in [0, 0, 1, 1, 1, 1, 1, 1, 2, 2]]
+    hits = Counter()
+    for _ in range(trials):
+        for i in select_indexes(list(map(usage_of, questions)), 4, rng):
+            hits[i] += 1
+    # usage 0 の2問は必ず選ばれ、usage 1 の6問から2問が選ばれる（期待値 trials / 3）
+    expected = trials * 2 / 6
+    return max(abs(hits[i] - expected) / expected for i in range(2, 8))
+
+
+def run_bench(args):
+    print(f"選ぶ問題数: {args.count} / {args.repeat}回中の最速値")
+    print(f"\n{'分布':<8} {'問題数':>9} {'従来':>9} {'ヒープ':>9} {'新方式':>9} {'速度比':>6} {'列のみ':>9}")
+    for distribution in args.distributions:
+        for size in args.sizes:
+            questions = make_questions(size, distribution, args.seed)
+            rng = random.Random(args.seed)
+            legacy_time, legacy = best_of(args.repeat, lambda: legacy_select(questions, args.count, rng))
+            heap_time, heap = best_of(args.repeat, lambda: select_heap(questions, args.count, rng))
+            new_time, new = best_of(args.repeat, lambda: select_least_used(questions, args.count, rng))
+            # usage_count を列（リスト）で持っている場合の選択だけの時間
+            usages = list(map(usage_of, questions))
+            column_time, _ = best_of(args.repeat, lambda: select_indexes(usages, args.count, rng))
+
+            # 選ばれた問題の usage_count の並びはどの方法でも同じになる
+            expected = list(map(usage_of, legacy))
+            if list(map(usage_of, heap)) != expected or list(map(usage_of, new)) != expected:
+                raise SystemExit(f"{distribution}/{size}: 選ばれた usage_count が一致しません")
+            print(f"{distribution:<8} {size:>9,} {legacy_time * 1000:>7.1f}ms {heap_time * 1000:>7.1f}ms "
+                  f"{new_time * 1000:>7.1f}ms {legacy_time / new_time:>5.1f}x {column_time * 1000:>7.1f}ms")
+            del questions, usages, legacy, heap, new
+    deviation = check_uniform()
+    print("\n※ 列のみ: usage_count を問題ごとの列（リスト）で持っている場合の選択だけの時間")
+    print(f"同じ usage_count からの抜き出しの偏り（期待値からの最大のずれ）: {deviation:.1%}")
+
+
+def run_select(args):
+    with QuestionStore(args.db) as store:
+        rows = store.all_rows()
+    # getQuestions / getBookQuestions と同じ絞り込み（usage_count は更新しない）
+    candidates = [q for q in rows if q["book_id"] == (args.book or "")
+                  and (args.subject == "all" or q["subject"] == args.subject)
+                  and (not args.genre or q["genre_id"] == args.genre)]
+    picked = select_least_used(candidates, args.count)
+    print(f"候補: {len(candidates)}問 / 選択: {len(picked)}問")
+    for q in picked:
+        print(f"  [{q['usage_count']}] {q['question_id']} {q['question_text']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="出題する問題の選択（usage_count の少ない順）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("bench", help="従来の方法（全体を並べ替え）と比べる")
+    p.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    p.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS)
+    p.add_argument("--count", type=int, default=10, help="選ぶ問題数 (default: 10)")
+    p.add_argument("--repeat", type=int, default=3, help="繰り返し回数（最速値を使う）")
+    p.add_argument("--seed", type=int, default=0)
+
+    p = sub.add_parser("select", help="ローカルストアから問題を選ぶ（usage_count は更新しない）")
+    p.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="ストアのパス")
+    p.add_argument("--subject", default="all")
+    p.add_argument("--genre")
+    p.add_argument("--book")
+    p.add_argument("--count", type=int, default=10)
+
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        run_bench(args)
+    elif args.command == "select":
+        run_select(args)
+
+
+if __name__ == "__main__":
+    main()
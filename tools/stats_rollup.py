@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+ユーザー別の成績の集計（Answers / Sessions シートのエクスポートから差分で更新）
+
+GAS の getStats / getBookStats / getHistory は、リクエストのたびに Answers・Sessions
+シート全体を getValues() して走査する。ここではエクスポート（CSV または NDJSON）を
+前回の続きから読み、ユーザーごとの集計を更新してスナップショットに書き出す。
+バックエンドはスナップショットの users[user_id] をそのまま返せばよい。
+
+    - stats:      getStats と同じ形（全体と教科別の解答数・正解数、正答率）
+    - book_stats: getBookStats と同じ形（参考書別、正答率は % の整数）
+    - genres:     教科・ジャンル別（参考書以外）の解答数・正解数・正答率
+    - streaks:    連続正解数（現在と最長。全体・教科別・ジャンル別・参考書別）
+    - history:    getHistory と同じ形（新しい順に HISTORY_LIMIT 件）
+
+エクスポートは行の追加だけを前提にする。チェックポイントにはファイルごとの読んだ
+バイト数と最後の行のハッシュを持ち、最後の行が変わっていれば（シートを作り直した
+場合など）最初から集計し直す。書きかけの最後の行（改行で終わっていない行）は次回に回す。
+
+--verify は、全行を GAS と同じやり方（ユーザーごとに全行を走査）で集計し直した
+結果とスナップショットを比べる。
+
+Usage:
+    python tools/stats_rollup.py --answers exports/Answers.csv --sessions exports/Sessions.csv
+    python tools/stats_rollup.py --answers exports/answers.ndjson --sessions exports/sessions.ndjson --verify
+    python tools/stats_rollup.py --answers exports/Answers.csv --sessions exports/Sessions.csv --rebuild
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from question_store import PROJECT_ROOT
+from run_manifest import atomic_write_text
+
+
+STATE_VERSION = 1
+
+# 既定のチェックポイントとスナップショット
+DEFAULT_STATE = PROJECT_ROOT / "data" / "generated" / "stats_state.json"
+DEFAULT_SNAPSHOT = PROJECT_ROOT / "data" / "generated" / "stats_snapshot.json"
+
+# シートの列（GAS の setupSheets と同じ。CSV にヘッダーがない場合にも使う）
+ANSWER_FIELDS = ["answer_id", "user_id", "session_id", "question_id", "subject",
+                 "genre_id", "user_answer", "is_correct", "time_taken", "answered_at"]
+SESSION_FIELDS = ["session_id", "user_id", "subject", "genre_id", "total_questions",
+                  "correct_count", "time_limit", "time_remaining", "started_at", "finished_at"]
+
+# getBookStats と同じ判定（Answers の genre_id 列に book_id が入っている）
+BOOK_PATTERN = re.compile(r"^(jp|math|sci|soc)_")
+
+# スナップショットに持つ履歴の件数（getHistory の limit の既定値は 20）
+HISTORY_LIMIT = 50
+
+_INTEGER = re.compile(r"-?\d+")
+_DECIMAL = re.compile(r"-?\d+\.\d+")
+
+
+def parse_bool(value) -> bool:
+    """is_correct（NDJSON は true / false、CSV エクスポートは TRUE / FALSE）"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1")
+    return bool(value)
+
+
+def parse_number(value):
+    """CSV の数値の列を数値に戻す（getValues() と同じく数値で返すため）"""
+    if isinstance(value, str):
+        if _INTEGER.fullmatch(value):
+            return int(value)
+        if _DECIMAL.fullmatch(value):
+            return float(value)
+    return value
+
+
+def js_percent(correct: int, total: int) -> int:
+    """Math.round(correct / total * 100)（0.5 は切り上げ）"""
+    return int(correct * 100 / total + 0.5) if total else 0
+
+
+# ---- エクスポートの読み込み ----
+
+def new_cursor() -> dict:
+    return {"offset": 0, "rows": 0, "header": None, "tail": None, "tail_length": 0}
+
+
+def cursor_valid(path: Path, cursor: dict) -> bool:
+    """前回最後に読んだ行が同じ位置に残っているか（追記だけされたか）"""
+    if cursor["offset"] == 0:
+        return True
+    if not path.exists() or path.stat().st_size < cursor["offset"]:
+        return False
+    with open(path, "rb") as f:
+        f.seek(cursor["offset"] - cursor["tail_length"])
+        tail = f.read(cursor["tail_length"])
+    return hashlib.sha256(tail).hexdigest() == cursor["tail"]
+
+
+def iter_new_rows(path: Path, cursor: dict, fields: list[str]) -> Iterator[dict]:
+    """cursor の続きから、改行で終わっている行だけを読む（読んだ分だけ cursor を進める）
+
+    CSV は1行目をヘッダーとみなす（fields の先頭の列名で始まらない場合は fields を使う）。
+    引用符の中の改行は、引用符の数が偶数になるまで次の行とつなげる。
+    """
+    is_csv = path.suffix.lower() == ".csv"
+    with open(path, "rb") as f:
+        f.seek(cursor["offset"])
+        record = b""
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            record += line
+            if is_csv and record.count(b'"') % 2:
+                continue
+            raw, record = record, b""
+            text = raw.decode("utf-8")
+            if cursor["offset"] == 0:
+                text = text.lstrip("\ufeff")
+            cursor["offset"] += len(raw)
+            cursor["tail"] = hashlib.sha256(raw).hexdigest()
+            cursor["tail_length"] = len(raw)
+            if not text.strip():
+                continue
+            if not is_csv:
+                try:
+                    row = json.loads(text)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}: {cursor['rows'] + 1}件目の行を読めません: {e}") from None
+                cursor["rows"] += 1
+                yield row
+                continue
+            values = next(csv.reader([text]))
+            if cursor["header"] is None:
+                cursor["header"] = values if values and values[0] == fields[0] else fields
+                if cursor["header"] is values:
+                    continue
+            cursor["rows"] += 1
+            yield dict(zip(cursor["header"], values))
+
+
+def answer_row(row: dict) -> tuple:
+    """(user_id, subject, genre_id, is_correct)"""
+    return (str(row.get("user_id", "")), str(row.get("subject", "")),
+            str(row.get("genre_id", "")), parse_bool(row.get("is_correct")))
+
+
+def history_entry(row: dict) -> dict:
+    """getHistory が返す1件（session_id, user_id 以外の列）"""
+    entry = {"session_id": row.get("session_id", "")}
+    for name in SESSION_FIELDS[2:]:
+        entry[name] = parse_number(row.get(name, ""))
+    return entry
+
+
+def history_key(entry: dict) -> str:
+    return str(entry["finished_at"] or entry["started_at"])
+
+
+# ---- 差分の集計 ----
+
+def _tally(node: dict, key: str, correct: bool):
+    """[total, correct, streak, best_streak] を1問分進める"""
+    t = node.get(key)
+    if t is None:
+        t = node[key] = [0, 0, 0, 0]
+    t[0] += 1
+    if correct:
+        t[1] += 1
+        t[2] += 1
+        if t[2] > t[3]:
+            t[3] = t[2]
+    else:
+        t[2] = 0
+
+
+class Rollup:
+    """ユーザーごとの集計（チェックポイントにそのまま保存できる形で持つ）"""
+
+    def __init__(self, users: Optional[dict] = None):
+        self.users = users if users is not None else {}
+
+    def _user(self, user_id: str) -> dict:
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = {"all": {}, "subjects": {}, "genres": {},
+                                          "books": {}, "history": []}
+        return user
+
+    def add_answer(self, row: dict):
+        user_id, subject, genre_id, correct = answer_row(row)
+        user = self._user(user_id)
+        _tally(user["all"], "", correct)
+        _tally(user["subjects"], subject, correct)
+        if BOOK_PATTERN.match(genre_id):
+            _tally(user["books"], genre_id, correct)
+        else:
+            _tally(user["genres"], f"{subject}/{genre_id}", correct)
+
+    def add_sessions(self, rows: list[dict]):
+        """新しいセッションを履歴に加える（新しい順に HISTORY_LIMIT 件だけ残す）
+
+        getHistory と同じく、日付が同じものは行の順に並べる（前回までの履歴の後ろに
+        新しい行を足してから安定ソートする）。
+        """
+        added = {}
+        for row in rows:
+            added.setdefault(str(row.get("user_id", "")), []).append(history_entry(row))
+        for user_id, entries in added.items():
+            user = self._user(user_id)
+            history = user["history"] + entries
+            history.sort(key=history_key, reverse=True)
+            user["history"] = history[:HISTORY_LIMIT]
+
+    def snapshot(self) -> dict:
+        return {user_id: user_snapshot(user) for user_id, user in sorted(self.users.items())}
+
+
+def user_snapshot(user: dict) -> dict:
+    """集計を API のレスポンスの形にする"""
+    total, correct = user["all"].get("", [0, 0])[:2]
+    genres = {}
+    for key, (t, c, _, _) in sorted(user["genres"].items()):
+        subject, genre_id = key.split("/", 1)
+        genres.setdefault(subject, {})[genre_id] = {"total": t, "correct": c,
+                                                    "accuracy": c / t if t else 0}
+
+    def streaks(node: dict) -> dict:
+        return {key: {"current": s, "best": b} for key, (_, _, s, b) in sorted(node.items())}
+
+    return {
+        "stats": {
+            "total_questions": total,
+            "total_correct": correct,
+            "by_subject": {s: {"total": t, "correct": c}
+                           for s, (t, c, _, _) in sorted(user["subjects"].items())},
+            "overall_accuracy": correct / total if total else 0,
+        },
+        "book_stats": {b: {"total": t, "correct": c, "accuracy": js_percent(c, t)}
+                       for b, (t, c, _, _) in sorted(user["books"].items())},
+        "genres": genres,
+        "streaks": {
+            "overall": streaks(user["all"]).get("", {"current": 0, "best": 0}),
+            "by_subject": streaks(user["subjects"]),
+            "by_genre": streaks(user["genres"]),
+            "by_book": streaks(user["books"]),
+        },
+        "history": user["history"],
+    }
+
+
+# ---- チェックポイント ----
+
+def load_state(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    state = json.loads(path.read_text(encoding="utf-8"))
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def update(answers: Path, sessions: Path, state_path: Path, snapshot_path: Path,
+           rebuild: bool = False) -> dict:
+    """前回の続きから読んで集計を更新し、チェックポイントとスナップショットを書く"""
+    state = None if rebuild else load_state(state_path)
+    reason = "再集計（--rebuild）" if rebuild else "初回"
+    if state is not None:
+        inputs = state["inputs"]
+        if inputs.get("answers", {}).get("path") != str(answers) \
+                or inputs.get("sessions", {}).get("path") != str(sessions):
+            state, reason = None, "入力ファイルが前回と違うため最初から集計"
+        elif not (cursor_valid(answers, inputs["answers"]["cursor"])
+                  and cursor_valid(sessions, inputs["sessions"]["cursor"])):
+            state, reason = None, "前回読んだ行が変わっているため最初から集計"
+        else:
+            reason = "差分"
+    if state is None:
+        state = {"version": STATE_VERSION,
+                 "inputs": {"answers": {"path": str(answers), "cursor": new_cursor()},
+                            "sessions": {"path": str(sessions), "cursor": new_cursor()}},
+                 "users": {}}
+
+    rollup = Rollup(state["users"])
+    answer_cursor = state["inputs"]["answers"]["cursor"]
+    session_cursor = state["inputs"]["sessions"]["cursor"]
+    answers_before, sessions_before = answer_cursor["rows"], session_cursor["rows"]
+
+    for row in iter_new_rows(answers, answer_cursor, ANSWER_FIELDS):
+        rollup.add_answer(row)
+    rollup.add_sessions(list(iter_new_rows(sessions, session_cursor, SESSION_FIELDS)))
+
+    snapshot = {"version": STATE_VERSION,
+                "answers": answer_cursor["rows"],
+                "sessions": session_cursor["rows"],
+                "users": rollup.snapshot()}
+    # スナップショットを先に書く（チェックポイントだけ進んで集計が欠けることがないように）
+    atomic_write_text(snapshot_path, json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")))
+    atomic_write_text(state_path, json.dumps(state, ensure_ascii=False, separators=(",", ":")))
+    return {"reason": reason, "snapshot": snapshot,
+            "new_answers": answer_cursor["rows"] - answers_before,
+            "new_sessions": session_cursor["rows"] - sessions_before}
+
+
+# ---- 全件の再集計（GAS と同じやり方。--verify 用） ----
+
+def full_scan(answers: list[dict], sessions: list[dict], user_id: str) -> dict:
+    """getStats / getBookStats / getHistory と同じく全行を走査して1ユーザー分を集計する"""
+    stats = {"total_questions": 0, "total_correct": 0, "by_subject": {}}
+    book_stats, genres = {}, {}
+    runs = {"overall": {}, "by_subject": {}, "by_genre": {}, "by_book": {}}
+
+    def streak(group: dict, key: str, correct: bool):
+        current, best = group.get(key, (0, 0))
+        current = current + 1 if correct else 0
+        group[key] = (current, max(best, current))
+
+    for row in answers:
+        uid, subject, genre_id, correct = answer_row(row)
+        if uid != user_id:
+            continue
+        stats["total_questions"] += 1
+        stats["total_correct"] += correct
+        s = stats["by_subject"].setdefault(subject, {"total": 0, "correct": 0})
+        s["total"] += 1
+        s["correct"] += correct
+        streak(runs["overall"], "", correct)
+        streak(runs["by_subject"], subject, correct)
+        if BOOK_PATTERN.match(genre_id):
+            b = book_stats.setdefault(genre_id, {"total": 0, "correct": 0})
+            b["total"] += 1
+            b["correct"] += correct
+            streak(runs["by_book"], genre_id, correct)
+        else:
+            g = genres.setdefault(subject, {}).setdefault(genre_id, {"total": 0, "correct": 0})
+            g["total"] += 1
+            g["correct"] += correct
+            streak(runs["by_genre"], f"{subject}/{genre_id}", correct)
+
+    stats["overall_accuracy"] = (stats["total_correct"] / stats["total_questions"]
+                                 if stats["total_questions"] else 0)
+    for b in book_stats.values():
+        b["accuracy"] = js_percent(b["correct"], b["total"])
+    for g in (g for subject in genres.values() for g in subject.values()):
+        g["accuracy"] = g["correct"] / g["total"]
+
+    history = [history_entry(row) for row in sessions if str(row.get("user_id", "")) == user_id]
+    history.sort(key=history_key, reverse=True)
+
+    def as_dict(group: dict) -> dict:
+        return {key: {"current": c, "best": b} for key, (c, b) in group.items()}
+
+    streaks = {name: as_dict(group) for name, group in runs.items()}
+    streaks["overall"] = streaks["overall"].get("", {"current": 0, "best": 0})
+    return {"stats": stats, "book_stats": book_stats, "genres": genres,
+            "streaks": streaks, "history": history[:HISTORY_LIMIT]}
+
+
+def verify(answers_path: Path, sessions_path: Path, snapshot: dict) -> list[str]:
+    """スナップショットを全件の再集計と比べ、食い違ったユーザーを返す"""
+    answers = list(iter_new_rows(answers_path, new_cursor(), ANSWER_FIELDS))
+    sessions = list(iter_new_rows(sessions_path, new_cursor(), SESSION_FIELDS))
+    users = {str(r.get("user_id", "")) for r in answers} | {str(r.get("user_id", "")) for r in sessions}
+    mismatched = sorted(users ^ set(snapshot["users"]))
+    for user_id in sorted(users & set(snapshot["users"])):
+        # JSON に書いて読み直した形で比べる（キーの順序やタプルの違いは無視）
+        expected = json.loads(json.dumps(full_scan(answers, sessions, user_id), ensure_ascii=False))
+        if expected != snapshot["users"][user_id]:
+            mismatched.append(user_id)
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユーザー別の成績の集計（差分更新）")
+    parser.add_argument("--answers", type=Path, required=True,
+                        help="Answers シートのエクスポート（.csv / .ndjson）")
+    parser.add_argument("--sessions", type=Path, required=True,
+                        help="Sessions シートのエクスポート（.csv / .ndjson）")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE,
+                        help=f"チェックポイント (default: {DEFAULT_STATE.relative_to(PROJECT_ROOT)})")
+    parser.add_argument("--output", type=Path, default=DEFAULT_SNAPSHOT,
+                        help=f"スナップショット (default: {DEFAULT_SNAPSHOT.relative_to(PROJECT_ROOT)})")
+    parser.add_argument("--rebuild", action="store_true", help="チェックポイントを使わず最初から集計する")
+    parser.add_argument("--verify", action="store_true", help="全件の再集計と比べる")
+
+    args = parser.parse_args()
+
+    for path in (args.answers, args.sessions):
+        if not path.exists():
+            print(f"エラー: {path} が見つかりません")
+            return 1
+
+    started = time.perf_counter()
+    try:
+        result = update(args.answers, args.sessions, args.state, args.output, args.rebuild)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+    snapshot = result["snapshot"]
+    print(f"{result['reason']}: 解答 +{result['new_answers']} / セッション +{result['new_sessions']} "
+          f"({elapsed:.2f}秒)")
+    print(f"合計: 解答 {snapshot['answers']} / セッション {snapshot['sessions']} / "
+          f"ユーザー {len(snapshot['users'])}")
+    print(f"スナップショット: {args.output}")
+
+    if args.verify:
+        started = time.perf_counter()
+        mismatched = verify(args.answers, args.sessions, snapshot)
+        elapsed = time.perf_counter() - started
+        if mismatched:
+            print(f"検証: {len(mismatched)}ユーザーが全件の再集計と一致しません ({elapsed:.2f}秒)")
+            for user_id in mismatched[:10]:
+                print(f"  {user_id}")
+            return 1
+        print(f"検証: 全件の再集計と一致しました ({elapsed:.2f}秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
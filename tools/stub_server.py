@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Gemini API のローカルスタブサーバー
+
+gemini_client.HttpTransport の送信先として使い、API を呼ばずに
+ベンチマークや動作確認を行う。
+
+Usage:
+    python tools/stub_server.py --port 8765
+    python tools/stub_server.py --port 8765 --latency 0.5 --response-file sample_response.txt
+
+    # 別ターミナルで
+    GEMINI_STUB_URL=http://127.0.0.1:8765 python tools/generate_questions.py KNOWLEDGE/jp/JP01.json
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+# リクエスト dict（model / contents / config）→ レスポンステキスト
+Responder = Callable[[dict], str]
+
+DEFAULT_RESPONSE = """```tsv
+subject\tgenre_id\tgenre_name\tquestion_text\tchoices\tcorrect_index\tcorrect_answer\thint\tdifficulty
+jp\tJP01\t漢字・語彙\tスタブ問題\t["A","B","C","D"]\t0\tA\tスタブ\t1
+```"""
+
+
+# /stream で1回に送る文字数
+STREAM_PIECE_CHARS = 512
+
+
+def make_handler(responder: Responder):
+    class StubHandler(BaseHTTPRequestHandler):
+        # keep-alive を有効にする
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+            if self.path.endswith("/stream"):
+                self._stream(request)
+                return
+            try:
+                body = json.dumps({"text": responder(request)}, ensure_ascii=False).encode("utf-8")
+                status = 200
+            except Exception as e:
+                body = json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8")
+                status = 500
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, request: dict):
+            """レスポンステキストを chunked で少しずつ返す"""
+            try:
+                text = responder(request)
+            except Exception as e:
+                body = str(e).encode("utf-8")
+                self.send_response(500)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(text), STREAM_PIECE_CHARS):
+                piece = text[i:i + STREAM_PIECE_CHARS].encode("utf-8")
+                self.wfile.write(f"{len(piece):X}\r\n".encode("ascii") + piece + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_server(responder: Responder, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """バックグラウンドスレッドでスタブサーバーを起動する（port=0 で空きポート）"""
+    server = ThreadingHTTPServer((host, port), make_handler(responder))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API のローカルスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="1リクエストあたりの遅延（秒）")
+    parser.add_argument("--response-file", type=Path, help="返すレスポンステキストのファイル")
+
+    args = parser.parse_args()
+
+    text = args.response_file.read_text(encoding="utf-8") if args.response_file else DEFAULT_RESPONSE
+
+    def responder(request: dict) -> str:
+        if args.latency:
+            time.sleep(args.latency)
+        return text
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(responder))
+    print(f"スタブサーバー起動: {server_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n終了します。")
+
+
+if __name__ == "__main__":
+    main()
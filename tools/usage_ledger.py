@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+usage_count の更新をまとめて書き戻す台帳
+
+GAS の incrementUsageCount（getQuestions / getBookQuestions の後）は、選んだ問題
+1問ごとに getRange().getValue() と getRange().setValue() を呼ぶので、クイズ開始の
+たびに 2 × 問題数 回のシート呼び出しを待つことになる。また読んでから書くまでの間に
+別のクイズ開始が同じ行を読むと、+1 が1回分消える。
+
+ここでは増分を追記専用のログ（NDJSON、1行 = 1回のクイズ開始で選んだ行）にためて、
+まとめて書き戻すときに行ごとの増分に集計し、連続した行の範囲ごとに
+getValues() と setValues() を1回ずつ呼ぶ。クイズ開始の処理はログへの追記だけになる。
+
+    ログ:   {"sheet": "Questions", "rows": [12, 13, 40]}
+    集計:   Questions: 12〜13 行に +1, +1 / 40 行に +1  →  範囲 2つ = 4回の呼び出し
+
+bench では、シートの代わりに 2次元配列と呼び出しごとの遅延（仮想時間）を持つ
+FakeSheet を使い、同時に 10 / 100 / 1000 回のクイズ開始があった場合の
+呼び出し回数と待ち時間を比べる。
+
+Usage:
+    python tools/usage_ledger.py bench
+    python tools/usage_ledger.py bench --sessions 10 100 1000 --rows 5000 --count 10 --latency 0.05
+    python tools/usage_ledger.py bench --max-gap 3      # 3行以内の隙間はつないで1範囲にする
+
+書き込むのが台帳だけなら、--max-gap を行数以上にするとシートごとに読み1回・書き1回になる
+（隙間の行は読んだ値をそのまま書き戻すので、他に usage_count を書く処理があると上書きする）。
+"""
+
+import argparse
+import json
+import random
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from selection import select_indexes
+
+
+# usage_count の列（1始まり。参考書シートは question_id, question_text, choice_1〜4,
+# correct_index, hint, usage_count の順）
+BOOK_USAGE_COLUMN = 9
+
+# シート呼び出し1回あたりの遅延（秒、bench の既定値）
+DEFAULT_LATENCY = 0.05
+
+
+class FakeSheet:
+    """スプレッドシートの代わり（2次元配列、行・列は GAS と同じく1始まり）
+
+    呼び出しごとに calls を数え、latency 秒を仮想時間 clock に足す（実際には待たない）。
+    """
+
+    def __init__(self, values: list[list], latency: float = DEFAULT_LATENCY):
+        self.values = values
+        self.latency = latency
+        self.calls = 0
+        self.clock = 0.0
+
+    def _call(self):
+        self.calls += 1
+        self.clock += self.latency
+
+    def get_value(self, row: int, column: int):
+        self._call()
+        return self.values[row - 1][column - 1]
+
+    def set_value(self, row: int, column: int, value):
+        self._call()
+        self.values[row - 1][column - 1] = value
+
+    def get_values(self, row: int, column: int, num_rows: int) -> list[list]:
+        """1列分の範囲（getRange(row, column, num_rows, 1).getValues()）"""
+        self._call()
+        return [[r[column - 1]] for r in self.values[row - 1:row - 1 + num_rows]]
+
+    def set_values(self, row: int, column: int, values: list[list]):
+        self._call()
+        for offset, (value,) in enumerate(values):
+            self.values[row - 1 + offset][column - 1] = value
+
+    def column(self, column: int) -> list:
+        """ヘッダーを除いた列の値（呼び出しには数えない。集計の確認用）"""
+        return [r[column - 1] for r in self.values[1:]]
+
+
+def increment_usage_count(sheet: FakeSheet, rows: Iterable[int], column: int) -> Iterator[None]:
+    """GAS の incrementUsageCount と同じ（1行ごとに読んで書く）
+
+    シート呼び出しのたびに yield するので、複数のクイズ開始を交互に進められる。
+    """
+    for row in rows:
+        current = sheet.get_value(row, column) or 0
+        yield
+        sheet.set_value(row, column, current + 1)
+        yield
+
+
+@dataclass
+class RangeUpdate:
+    """連続した行の範囲への増分（deltas[i] が start + i 行目の増分）"""
+    sheet: str
+    start: int
+    deltas: list[int]
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.deltas) - 1
+
+
+def contiguous_ranges(counts: dict[int, int], max_gap: int = 0) -> list[tuple[int, list[int]]]:
+    """行ごとの増分を連続した行の範囲にまとめる（行の昇順）
+
+    max_gap > 0 の場合は、その行数以内の隙間（増分 0 の行）もつないで1つの範囲にする
+    （範囲は減るが、隙間の行も読んで同じ値を書き戻す）。
+    """
+    ranges = []
+    for row in sorted(counts):
+        if ranges and row - (ranges[-1][0] + len(ranges[-1][1])) <= max_gap:
+            start, deltas = ranges[-1]
+            deltas.extend([0] * (row - start - len(deltas)))
+            deltas.append(counts[row])
+        else:
+            ranges.append((row, [counts[row]]))
+    return ranges
+
+
+class UsageLedger:
+    """usage_count の増分を追記専用のログにためる台帳
+
+    path を渡すとログをファイルに追記し、起動時に残っているログを読み直す。
+    書き戻し（flush）が終わったらログを空にする。書き戻しの途中で止まった場合は
+    ログが残るので、次の flush でもう一度数える（増分が消えることはないが、
+    書き戻しが終わった範囲は2回数えることがある）。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.entries: list[tuple[str, list[int]]] = []
+        if self.path and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.append((entry["sheet"], entry["rows"]))
+
+    def record(self, sheet: str, rows: list[int]):
+        """1回のクイズ開始で選んだ行を記録する（シートには触らない）"""
+        rows = list(rows)
+        self.entries.append((sheet, rows))
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"sheet": sheet, "rows": rows}, ensure_ascii=False) + "\n")
+
+    def pending(self) -> dict[str, Counter]:
+        """シートごと・行ごとの増分"""
+        counts: dict[str, Counter] = {}
+        for sheet, rows in self.entries:
+            counts.setdefault(sheet, Counter()).update(rows)
+        return counts
+
+    def compact(self, max_gap: int = 0) -> list[RangeUpdate]:
+        """ログを連続した行の範囲ごとの増分にまとめる"""
+        updates = []
+        for sheet, counts in sorted(self.pending().items()):
+            updates.extend(RangeUpdate(sheet, start, deltas)
+                           for start, deltas in contiguous_ranges(counts, max_gap))
+        return updates
+
+    def flush(self, sheets: dict[str, FakeSheet], column: int, max_gap: int = 0) -> list[RangeUpdate]:
+        """まとめた増分をシートに書き戻してログを空にする（範囲ごとに読み1回・書き1回）"""
+        updates = self.compact(max_gap)
+        for update in updates:
+            sheet = sheets[update.sheet]
+            current = sheet.get_values(update.start, column, len(update.deltas))
+            sheet.set_values(update.start, column,
+                             [[(value or 0) + delta] for (value,), delta in zip(current, update.deltas)])
+        self.entries = []
+        if self.path:
+            self.path.write_text("", encoding="utf-8")
+        return updates
+
+
+def make_book_sheet(rows: int, latency: float) -> FakeSheet:
+    """参考書シート（ヘッダー + rows 行、usage_count は 0）"""
+    header = ["question_id", "question_text", "choice_1", "choice_2", "choice_3", "choice_4",
+              "correct_index", "hint", "usage_count"]
+    values = [header] + [[str(i), f"問題{i}", "A", "B", "C", "D", 0, "", 0]
+                         for i in range(1, rows + 1)]
+    return FakeSheet(values, latency)
+
+
+def plan_sessions(usages: list, sessions: int, count: int, rng: random.Random) -> list[list[int]]:
+    """同時に始まったクイズがそれぞれ選ぶ行（全員が同じ時点の usage_count を見る）"""
+    return [[i + 2 for i in select_indexes(usages, count, rng)] for _ in range(sessions)]
+
+
+def run_interleaved(steps: list[Iterator[None]]):
+    """各クイズ開始のシート呼び出しを1回ずつ交互に進める（同時実行の近似）"""
+    active = list(steps)
+    while active:
+        active = [s for s in active if next(s, StopIteration) is not StopIteration]
+
+
+def run_bench(args):
+    rng = random.Random(args.seed)
+    column = BOOK_USAGE_COLUMN
+    print(f"参考書シート: {args.rows}行 / 1回に選ぶ問題: {args.count}問 / "
+          f"呼び出し1回: {args.latency * 1000:.0f}ms（仮想時間）")
+    print(f"\n{'同時開始':>8} {'従来:呼出':>10} {'従来:時間':>10} {'開始の待ち':>10} {'消えた+1':>8}"
+          f" {'台帳:範囲':>9} {'台帳:呼出':>9} {'台帳:時間':>9} {'削減':>7}")
+    for sessions in args.sessions:
+        base = make_book_sheet(args.rows, args.latency)
+        picks = plan_sessions(base.column(column), sessions, args.count, rng)
+        expected = Counter(row for rows in picks for row in rows)
+
+        # 従来: クイズ開始ごとに1行ずつ読んで書く（同時に進めると、読んでから書くまでの
+        # 間に他のクイズ開始が同じ行を読み、+1 が消える）
+        legacy = make_book_sheet(args.rows, args.latency)
+        run_interleaved([increment_usage_count(legacy, rows, column) for rows in picks])
+        legacy_total = sum(legacy.column(column))
+        lost = sum(expected.values()) - legacy_total
+
+        # 台帳: クイズ開始はログに追記するだけで、まとめて1回書き戻す
+        sheet = make_book_sheet(args.rows, args.latency)
+        ledger = UsageLedger()
+        for rows in picks:
+            ledger.record("book", rows)
+        updates = ledger.flush({"book": sheet}, column, args.max_gap)
+        final = sheet.column(column)
+        if any(final[row - 2] != n for row, n in expected.items()) or sum(final) != sum(expected.values()):
+            raise SystemExit(f"{sessions}: 書き戻した usage_count が増分と一致しません")
+
+        wait = 2 * args.count * args.latency
+        print(f"{sessions:>8} {legacy.calls:>10,} {legacy.clock:>9.1f}s {wait:>9.2f}s {lost:>8,}"
+              f" {len(updates):>9,} {sheet.calls:>9,} {sheet.clock:>8.2f}s"
+              f" {1 - sheet.calls / legacy.calls:>6.1%}")
+    print("\n※ 時間は呼び出し回数 × 遅延の合計（仮想時間）。開始の待ち: 従来の方法で1回のクイズ開始が"
+          "\n  usage_count の更新を待つ時間（台帳ではログへの追記のみ）")
+    print("※ 消えた+1: 同時開始を1呼び出しずつ交互に進めたとき、読んでから書くまでの間に"
+          "\n  他の開始が同じ行を読んで上書きされた増分（台帳では発生しない）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="usage_count の更新をまとめて書き戻す台帳")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("bench", help="1行ずつの更新と、台帳からのまとめた書き戻しを比べる")
+    p.add_argument("--sessions", type=int, nargs="+", default=[10, 100, 1000],
+                   help="同時に始まるクイズの数 (default: 10 100 1000)")
+    p.add_argument("--rows", type=int, default=5000, help="参考書シートの行数 (default: 5000)")
+    p.add_argument("--count", type=int, default=10, help="1回に選ぶ問題数 (default: 10)")
+    p.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+                   help=f"シート呼び出し1回の遅延（秒） (default: {DEFAULT_LATENCY})")
+    p.add_argument("--max-gap", type=int, default=0,
+                   help="この行数以内の隙間はつないで1範囲にする (default: 0)")
+    p.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        run_bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+問題データのバリデーション（生成・インポート共通）
+
+generate_questions.py と import_questions.py が同じ validate_batch を使う。
+
+検査項目:
+    必須フィールドの有無、choices の形式・個数・重複、
+    correct_index の型と範囲、correct_answer と choices[correct_index] の一致
+
+エラーは表示せず ValidationError のリストで返す（表示は呼び出し側）。
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+
+# 必須フィールド（question_id・hint・difficulty は任意）
+REQUIRED_FIELDS = ["subject", "genre_id", "genre_name", "question_text",
+                   "choices", "correct_index", "correct_answer"]
+
+# 4択
+CHOICE_COUNT = 4
+
+
+@dataclass
+class ValidationError:
+    """1件のバリデーションエラー"""
+    index: int    # バッチ内の位置（0始まり）
+    field: str
+    code: str     # missing / choices_json / choices_type / choices_count /
+                  # choices_duplicate / index_type / index_range / answer_mismatch
+    message: str
+
+    def __str__(self) -> str:
+        return self.message
+
+
+def _value(row, field: str):
+    """row の値（欠けている値・dict でない行は None）"""
+    return row.get(field) if isinstance(row, dict) else None
+
+
+def _is_missing(value) -> bool:
+    return value is None or value == ""
+
+
+def _parse_choices(value):
+    """choices の値をパースする（JSON の文字列はパースし、リストなどはそのまま）
+
+    パースできない文字列は元の文字列のまま返す（型の検査で choices_json として報告する）。
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, RecursionError):
+        return value
+
+
+def _to_int(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _has_duplicates(choices: list) -> bool:
+    try:
+        return len(set(choices)) != len(choices)
+    except TypeError:
+        # ハッシュできない要素（配列など）は文字列にして比べる
+        return len({json.dumps(c, ensure_ascii=False) for c in choices}) != len(choices)
+
+
+def _choices_error(i: int, choices, choice_count: Optional[int]) -> Optional[ValidationError]:
+    """choices の形式・個数・重複の検査（問題なければ None）"""
+    if isinstance(choices, str):
+        return ValidationError(i, "choices", "choices_json", "choices が JSON として不正です")
+    if not isinstance(choices, list):
+        return ValidationError(i, "choices", "choices_type", "choices は配列である必要があります")
+    if choice_count is not None and len(choices) != choice_count:
+        return ValidationError(i, "choices", "choices_count",
+                               f"choices は{choice_count}つ必要です（{len(choices)}つ）")
+    if choice_count is None and len(choices) < 2:
+        return ValidationError(i, "choices", "choices_count", "choices は2つ以上必要です")
+    if _has_duplicates(choices):
+        return ValidationError(i, "choices", "choices_duplicate", f"choices が重複しています: {choices}")
+    return None
+
+
+def validate_row(i: int, row: dict, choice_count: Optional[int] = CHOICE_COUNT,
+                 check_answer: bool = True) -> list[ValidationError]:
+    """1行を検査してエラーを返す（i はエラーに記録するバッチ内の位置）"""
+    errors = []
+
+    # 必須フィールド
+    for field in REQUIRED_FIELDS:
+        if _is_missing(_value(row, field)):
+            errors.append(ValidationError(i, field, "missing", f"{field} がありません"))
+
+    # choices（不正なら correct_index の範囲・correct_answer の検査を省く）
+    raw_choices = _value(row, "choices")
+    choices = _parse_choices(raw_choices)
+    choices_ok = False
+    if not _is_missing(raw_choices):
+        error = _choices_error(i, choices, choice_count)
+        if error:
+            errors.append(error)
+        else:
+            choices_ok = True
+
+    # correct_index
+    raw_index = _value(row, "correct_index")
+    if _is_missing(raw_index):
+        return errors
+    index = _to_int(raw_index)
+    if index is None:
+        errors.append(ValidationError(i, "correct_index", "index_type",
+                                      "correct_index が数値ではありません"))
+        return errors
+    if not choices_ok:
+        return errors
+    if not 0 <= index < len(choices):
+        errors.append(ValidationError(i, "correct_index", "index_range",
+                                      f"correct_index {index} が範囲外です"))
+        return errors
+
+    # correct_answer と choices[correct_index] の一致
+    answer = _value(row, "correct_answer")
+    if check_answer and not _is_missing(answer):
+        expected = choices[index]
+        if answer != expected and str(answer).strip() != str(expected).strip():
+            errors.append(ValidationError(
+                i, "correct_answer", "answer_mismatch",
+                f"correct_answer「{answer}」が choices[{index}]「{expected}」と一致しません"))
+    return errors
+
+
+def validate_batch(rows: Sequence[dict], choice_count: Optional[int] = CHOICE_COUNT,
+                   check_answer: bool = True) -> list[ValidationError]:
+    """rows を1行ずつ検査し、エラーを行順に返す
+
+    choices は JSON 文字列（TSV）でもリスト（JSON / インポート）でもよい。
+    choice_count=None で個数を問わない（2つ以上）。check_answer=False で
+    correct_answer と choices[correct_index] の一致を検査しない。
+    choices が不正な行は、それに依存する correct_index・correct_answer の検査を省く。
+    """
+    errors: list[ValidationError] = []
+    for i, row in enumerate(rows):
+        errors.extend(validate_row(i, row, choice_count, check_answer))
+    return errors
+
+
+def errors_by_row(errors: list[ValidationError]) -> dict[int, list[ValidationError]]:
+    """エラーを行ごとにまとめる"""
+    by_row: dict[int, list[ValidationError]] = {}
+    for e in errors:
+        by_row.setdefault(e.index, []).append(e)
+    return by_row
+
+
+def join_messages(errors: list[ValidationError]) -> str:
+    """1行分のエラーを1つのメッセージにする"""
+    return "; ".join(e.message for e in errors)
+
+
+def split_valid(rows: Sequence[dict], errors: list[ValidationError]
+                ) -> tuple[list[dict], dict[int, list[ValidationError]]]:
+    """rows を有効な行と、不正な行ごとのエラーに分ける"""
+    by_row = errors_by_row(errors)
+    valid = [row for i, row in enumerate(rows) if i not in by_row]
+    return valid, by_row